@@ -1,3 +1,4 @@
+from collections import defaultdict
 from dataclasses import dataclass, field
 
 """
@@ -90,6 +91,10 @@ class Iron:
             edges: a dictionary storing the edges of the graph
 
             source: a list containing the sources/format trasnformations of the graph
+
+            forward_adjacency: a dictionary mapping the id of each 'parent' node to a dictionary {edge_key: child_id}
+
+            reverse_adjacency: a dictionary mapping the id of each 'child' node to a dictionary {edge_key: parent_id}
     """
     def __init__(self):
         """
@@ -100,6 +105,8 @@ class Iron:
         self.nodes = {}
         self.edges = {}
         self.source = str
+        self.forward_adjacency = defaultdict(dict)
+        self.reverse_adjacency = defaultdict(dict)
 
     def __str__(self):
         return f'Nodes: {self.nodes} \nEdges: {self.edges}'
@@ -109,8 +116,15 @@ class Iron:
         self.nodes[k] = node
 
     def add_edge(self, k, edge: Edge):
-        """ To add an edge to an Iron instance. """
+        """ To add an edge to an Iron instance. The adjacency indexes are updated accordingly. """
+        if k in self.edges:
+            # if an edge with the same key is replaced, its old entries are removed from the indexes
+            old_edge = self.edges[k]
+            self.forward_adjacency[str(old_edge.a_iid)].pop(k, None)
+            self.reverse_adjacency[str(old_edge.b_iid)].pop(k, None)
         self.edges[k] = edge
+        self.forward_adjacency[str(edge.a_iid)][k] = str(edge.b_iid)
+        self.reverse_adjacency[str(edge.b_iid)][k] = str(edge.a_iid)
 
     def i_node_number(self):
         """ To get the number of nodes in an Iron instance """
@@ -122,30 +136,27 @@ class Iron:
 
     def get_neighbors(self, a):
         """ To get the list of nodes sharing an edge with a given node """
-        neigh_lst = []
-        for id_e, edge in self.edges.items():
-            if edge.a_iid == str(a):
-                neigh_lst.append(edge.b_iid)
-            elif edge.b_iid == str(a):
-                neigh_lst.append(edge.a_iid)
+        outgoing = self.forward_adjacency.get(str(a), {})
+        neigh_lst = list(outgoing.values())
+        # self-loops are already counted among the outgoing edges
+        neigh_lst.extend(a_iid for id_e, a_iid in self.reverse_adjacency.get(str(a), {}).items()
+                         if id_e not in outgoing)
         return neigh_lst
 
     def get_child_nodes(self, b):
         """ To get the list of 'child' nodes of a given node """
-        return [edge.a_iid for id_e, edge in self.edges.items() if edge.b_iid == str(b)]
+        return list(self.reverse_adjacency.get(str(b), {}).values())
 
     def get_parent_nodes(self, a):
         """ To get the list of 'parent' nodes of a given node """
-        return [edge.b_iid for id_e, edge in self.edges.items() if edge.a_iid == str(a)]
+        return list(self.forward_adjacency.get(str(a), {}).values())
 
     def get_edge_id(self, a, b):
         """ To get the list of edge ids connecting the nodes a and b (direction ignored) """
-        ids_lst = []
-        for id_e, edge in self.edges.items():
-            if edge.a_iid == str(a) and edge.b_iid == str(b):
-                ids_lst.append(id_e)
-            elif edge.b_iid == str(a) and edge.a_iid == str(b):
-                ids_lst.append(id_e)
+        ids_lst = [id_e for id_e, child in self.forward_adjacency.get(str(a), {}).items() if child == str(b)]
+        if str(a) != str(b):
+            ids_lst.extend(id_e for id_e, child in self.forward_adjacency.get(str(b), {}).items()
+                           if child == str(a))
         return ids_lst
 
     def get_degree_sequence(self):
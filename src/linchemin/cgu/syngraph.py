@@ -5,7 +5,8 @@ from typing import List, Union
 import linchemin.utilities as utilities
 from linchemin.cgu.iron import Iron
 from linchemin.cheminfo.constructors import (ChemicalEquationConstructor,
-                                             MoleculeConstructor)
+                                             MoleculeConstructor,
+                                             chemical_equation_cache)
 from linchemin.cheminfo.models import ChemicalEquation, Molecule
 
 """
@@ -165,26 +166,20 @@ class BipartiteSynGraph(SynGraph):
 
     def builder_from_iron(self, iron_graph):
         """ To build a BipartiteSynGraph instance from an Iron instance """
-        connections = [edge.direction.tup for id_e, edge in iron_graph.edges.items()]
+        connections, reactants_of, products_of, smiles = group_iron_connections(iron_graph)
         for node1, node2 in connections:
 
-            all_reactants = [iron_graph.nodes[tup[0]].properties['node_smiles'] for tup in connections if
-                             tup[1] == node2]
-            all_products = [iron_graph.nodes[tup[1]].properties['node_smiles'] for tup in connections if
-                            tup[0] == node1]
-            check = [item for item in all_reactants if item in all_products]
-            if not check:
+            all_reactants = [smiles[n] for n in reactants_of[node2]]
+            all_products = [smiles[n] for n in products_of[node1]]
+            if set(all_reactants).isdisjoint(all_products):
                 chemical_equation = get_reaction_instance(all_reactants, all_products)
 
-                reactant = iron_graph.nodes[node1].properties['node_smiles']
-                product = iron_graph.nodes[node2].properties['node_smiles']
-
-                self.add_nodes_sequence(reactant, product, chemical_equation)
+                self.add_nodes_sequence(smiles[node1], smiles[node2], chemical_equation)
 
         roots = []
         for products in self.graph.values():
             roots.extend(
-                prod for prod in products if prod not in list(self.graph.keys()) and isinstance(prod, Molecule))
+                prod for prod in products if prod not in self.graph and isinstance(prod, Molecule))
 
         for root in roots:
             self.add_node((root, []))
@@ -227,30 +222,22 @@ class MonopartiteReacSynGraph(SynGraph):
 
     def builder_from_iron(self, iron_graph):
         """ To build a MonopartiteReacSynGraph from an Iron instance. """
-        connections = [edge.direction.tup for id_e, edge in iron_graph.edges.items()]
+        connections, reactants_of, products_of, smiles = group_iron_connections(iron_graph)
         for node1, node2 in connections:
 
-            all_reactants = [iron_graph.nodes[tup[0]].properties['node_smiles'] for tup in connections if
-                             tup[1] == node2]
-            all_products = [iron_graph.nodes[tup[1]].properties['node_smiles'] for tup in connections if
-                            tup[0] == node1]
-            check = [item for item in all_reactants if item in all_products]
-            if not check:
+            all_reactants = [smiles[n] for n in reactants_of[node2]]
+            all_products = [smiles[n] for n in products_of[node1]]
+            if set(all_reactants).isdisjoint(all_products):
 
                 chemical_equation1 = get_reaction_instance(all_reactants, all_products)
 
-                # Searching for the connections in which the product of the "parent" reaction is a reactant
-                next_connections = [edge.direction.tup for edge in iron_graph.edges.values()
-                                    if edge.direction.tup[0] == node2]
-                if next_connections:
-                    for node_a, node_b in next_connections:
-                        all_reactants2 = [iron_graph.nodes[tup[0]].properties['node_smiles'] for tup in connections
-                                          if tup[1] == node_b]
-                        all_products2 = [iron_graph.nodes[tup[1]].properties['node_smiles'] for tup in connections
-                                         if tup[0] == node_a]
-
-                        check = [item for item in all_reactants2 if item in all_products2]
-                        if not check:
+                # The connections in which the product of the "parent" reaction is a reactant
+                if next_products := products_of.get(node2):
+                    all_products2 = [smiles[n] for n in next_products]
+                    for node_b in next_products:
+                        all_reactants2 = [smiles[n] for n in reactants_of[node_b]]
+
+                        if set(all_reactants2).isdisjoint(all_products2):
                             chemical_equation2 = get_reaction_instance(all_reactants2, all_products2)
                             self.add_node((chemical_equation1, [chemical_equation2]))
                 else:
@@ -314,23 +301,17 @@ class MonopartiteMolSynGraph(SynGraph):
         self.set_source(str(self.uid))
 
     def builder_from_iron(self, iron_graph):
-        connections = [edge.direction.tup for id_e, edge in iron_graph.edges.items()]
+        connections, reactants_of, products_of, smiles = group_iron_connections(iron_graph)
         for node1, node2 in connections:
 
-            reactant = iron_graph.nodes[node1].properties['node_smiles']
-            product = iron_graph.nodes[node2].properties['node_smiles']
-
-            all_reactants = [iron_graph.nodes[tup[0]].properties['node_smiles'] for tup in connections if
-                             tup[1] == node2]
-            all_products = [iron_graph.nodes[tup[1]].properties['node_smiles'] for tup in connections if
-                            tup[0] == node1]
-            check = [item for item in all_reactants if item in all_products]
-            if not check:
+            all_reactants = [smiles[n] for n in reactants_of[node2]]
+            all_products = [smiles[n] for n in products_of[node1]]
+            if set(all_reactants).isdisjoint(all_products):
                 molecule_constructor = MoleculeConstructor(molecular_identity_property_name='smiles')
 
-                reactant_canonical = molecule_constructor.build_from_molecule_string(molecule_string=reactant,
+                reactant_canonical = molecule_constructor.build_from_molecule_string(molecule_string=smiles[node1],
                                                                                      inp_fmt='smiles')
-                product_canonical = molecule_constructor.build_from_molecule_string(molecule_string=product,
+                product_canonical = molecule_constructor.build_from_molecule_string(molecule_string=smiles[node2],
                                                                                     inp_fmt='smiles')
 
                 self.add_node((reactant_canonical, [product_canonical]))
@@ -338,7 +319,7 @@ class MonopartiteMolSynGraph(SynGraph):
         roots = []
         for products in self.graph.values():
             roots.extend(
-                prod for prod in products if prod not in list(self.graph.keys()) and isinstance(prod, Molecule))
+                prod for prod in products if prod not in self.graph and isinstance(prod, Molecule))
 
         for root in roots:
             self.add_node((root, []))
@@ -353,6 +334,31 @@ class MonopartiteMolSynGraph(SynGraph):
         return [reac for reac in self.graph.keys() if reac not in connections]
 
 
+def group_iron_connections(iron_graph: Iron) -> tuple:
+    """ Takes an Iron instance and groups its edges by product and by reactant in a single pass.
+
+        :param:
+            iron_graph: an Iron instance
+
+        :return:
+            connections: a list of tuples (reactant_id, product_id), one for each edge, in the order of the Iron edges
+            reactants_of: a dictionary mapping the id of each product node to the list of ids of its reactants
+            products_of: a dictionary mapping the id of each reactant node to the list of ids of its products
+            smiles: a dictionary mapping the id of each node to its smiles
+    """
+    connections = [edge.direction.tup for edge in iron_graph.edges.values()]
+    reactants_of = defaultdict(list)
+    products_of = defaultdict(list)
+    smiles = {}
+    for reactant, product in connections:
+        reactants_of[product].append(reactant)
+        products_of[reactant].append(product)
+        for iid in (reactant, product):
+            if iid not in smiles:
+                smiles[iid] = iron_graph.nodes[iid].properties['node_smiles']
+    return connections, reactants_of, products_of, smiles
+
+
 def get_reaction_instance(reactants: list, products: list) -> ChemicalEquation:
     """ Takes the lists of reactants and products of a reaction and create the ChemicalEquation instance.
 
@@ -364,12 +370,21 @@ def get_reaction_instance(reactants: list, products: list) -> ChemicalEquation:
             chemical_equation: an instance of the ChemicalEquation class
     """
 
+    chemical_equation_constructor = ChemicalEquationConstructor(molecular_identity_property_name='smiles')
+    # The canonical reaction string (independent of the order of reactants and products) and the constructor
+    # settings are used as key of the chemical equation cache
+    key = ('>'.join(['.'.join(sorted(reactants)), '', '.'.join(sorted(products))]),
+           chemical_equation_constructor.molecular_identity_property_name,
+           chemical_equation_constructor.chemical_equation_identity_name)
+    if (chemical_equation := chemical_equation_cache.get(key)) is not None:
+        return chemical_equation
+
     # The ChemicalEquation instance is created
     reaction_string = '>'.join(['.'.join(reactants), '.'.join([]), '.'.join(products)])
-    chemical_equation_constructor = ChemicalEquationConstructor(molecular_identity_property_name='smiles')
     chemical_equation = chemical_equation_constructor.build_from_reaction_string(
         reaction_string=reaction_string,
         inp_fmt='smiles')
+    chemical_equation_cache.put(key, chemical_equation)
 
     return chemical_equation
 
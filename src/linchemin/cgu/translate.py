@@ -120,38 +120,45 @@ class TranslatorMonopartiteReacSynGraph(AbsTranslator):
             iron = Iron()
             id_n = 0
             id_e = 0
+            # the ids of the nodes already added to Iron are mapped to their ChemicalEquation and smiles
+            ids_by_class = {}
+            ids_by_smiles = {}
             for reac, connections in mp_syngraph.graph.items():
                 # if the smiles 'reac' is not yet among the nodes of the Iron instance,
                 # the corresponding node is created and added to Iron
-                if reac not in [n.properties['node_class'] for id, n in iron.nodes.items()]:
+                if reac not in ids_by_class:
                     # the unmapped smiles is built so that the route is suitable to be correctly displayed in a png file
                     unmapped_smiles = cif.rdrxn_to_string(reac.rdrxn, out_fmt='smiles', use_atom_mapping=False)
                     prop = {
                         'node_unmapped_smiles': unmapped_smiles,
                         'node_smiles': reac.smiles,
                         'node_class': reac}
-                    node1 = [(id_n, Node(iid=str(id_n), properties=prop, labels=[]))]
-                    iron.add_node(str(node1[0][0]), node1[0][1])
+                    iron.add_node(str(id_n), Node(iid=str(id_n), properties=prop, labels=[]))
+                    ids_by_class.setdefault(reac, id_n)
+                    ids_by_smiles.setdefault(reac.smiles, id_n)
+                    id1 = id_n
                     id_n += 1
                 else:
                     # if the smiles 'reac' is already included in Iron,
                     # the relative information are retrieved
-                    node1 = [(id, n) for id, n in iron.nodes.items() if n.properties['node_class'] == reac]
+                    id1 = ids_by_class[reac]
                 for c in connections:
-                    if c.smiles not in [n.properties['node_smiles'] for id, n in iron.nodes.items()]:
+                    if c.smiles not in ids_by_smiles:
                         unmapped_smiles = cif.rdrxn_to_string(c.rdrxn, out_fmt='smiles', use_atom_mapping=False)
                         prop = {
                             'node_unmapped_smiles': unmapped_smiles,
                             'node_smiles': c.smiles,
                             'node_class': c}
-                        node2 = [(id_n, Node(iid=str(id_n), properties=prop, labels=[]))]
-                        iron.add_node(str(node2[0][0]), node2[0][1])
+                        iron.add_node(str(id_n), Node(iid=str(id_n), properties=prop, labels=[]))
+                        ids_by_class.setdefault(c, id_n)
+                        ids_by_smiles.setdefault(c.smiles, id_n)
+                        id2 = id_n
                         id_n += 1
                     else:
-                        node2 = [(id, n) for id, n in iron.nodes.items() if n.properties['node_class'] == c]
+                        id2 = ids_by_class[c]
 
-                    d = Direction(f'{str(node1[0][0])}>{str(node2[0][0])}')
-                    e = Edge(iid=str(id_e), a_iid=str(node1[0][0]), b_iid=str(node2[0][0]), direction=d,
+                    d = Direction(f'{str(id1)}>{str(id2)}')
+                    e = Edge(iid=str(id_e), a_iid=str(id1), b_iid=str(id2), direction=d,
                              properties={},
                              labels=[])
                     iron.add_edge(str(id_e), e)
@@ -164,6 +171,10 @@ class TranslatorMonopartiteReacSynGraph(AbsTranslator):
                 'returned')
             return None
 
+    def to_networkx(self, mp_syngraph: MonopartiteReacSynGraph) -> Union[nx.classes.digraph.DiGraph, None]:
+        """ Translates a MonopartiteReacSynGraph instance directly into a Networkx object """
+        return syngraph_to_networkx(mp_syngraph, match_by_smiles=False, with_unmapped_smiles=True)
+
 
 class TranslatorBipartiteSynGraph(AbsTranslator):
     """ Translator subclass to handle translations into and from BipartiteSynGraph instances """
@@ -189,10 +200,12 @@ class TranslatorBipartiteSynGraph(AbsTranslator):
             iron = Iron()
             id_n = 0
             id_e = 0
+            # the ids of the nodes already added to Iron are mapped to their smiles
+            ids_by_smiles = {}
             for reac, connections in syngraph.graph.items():
                 # if the smiles 'reac' is not yet among the nodes of the Iron instance,
                 # the corresponding node is created and added to Iron
-                if reac.smiles not in [n.properties['node_smiles'] for id, n in iron.nodes.items()]:
+                if reac.smiles not in ids_by_smiles:
                     if type(reac) == ChemicalEquation:
                         unmapped_smiles = cif.rdrxn_to_string(reac.rdrxn, out_fmt='smiles', use_atom_mapping=False)
                     elif type(reac) == Molecule:
@@ -204,15 +217,16 @@ class TranslatorBipartiteSynGraph(AbsTranslator):
                         'node_class': reac
                     }
 
-                    node1 = [(id_n, Node(iid=str(id_n), properties=prop, labels=[]))]
-                    iron.add_node(str(node1[0][0]), node1[0][1])
+                    iron.add_node(str(id_n), Node(iid=str(id_n), properties=prop, labels=[]))
+                    ids_by_smiles[reac.smiles] = id_n
+                    id1 = id_n
                     id_n += 1
                 else:
                     # if the smiles 'reac' is already included in Iron,
                     # the relative information are retrieved
-                    node1 = [(id, n) for id, n in iron.nodes.items() if n.properties['node_smiles'] == reac.smiles]
+                    id1 = ids_by_smiles[reac.smiles]
                 for c in connections:
-                    if c.smiles not in [n.properties['node_smiles'] for id, n in iron.nodes.items()]:
+                    if c.smiles not in ids_by_smiles:
                         if type(c) == ChemicalEquation:
                             unmapped_smiles = cif.rdrxn_to_string(c.rdrxn, out_fmt='smiles', use_atom_mapping=False)
                         elif type(c) == Molecule:
@@ -223,14 +237,15 @@ class TranslatorBipartiteSynGraph(AbsTranslator):
                             'node_smiles': c.smiles,
                             'node_class': c
                         }
-                        node2 = [(id_n, Node(iid=str(id_n), properties=prop, labels=[]))]
-                        iron.add_node(str(node2[0][0]), node2[0][1])
+                        iron.add_node(str(id_n), Node(iid=str(id_n), properties=prop, labels=[]))
+                        ids_by_smiles[c.smiles] = id_n
+                        id2 = id_n
                         id_n += 1
                     else:
-                        node2 = [(id, n) for id, n in iron.nodes.items() if n.properties['node_smiles'] == c.smiles]
+                        id2 = ids_by_smiles[c.smiles]
 
-                    d = Direction(f'{str(node1[0][0])}>{str(node2[0][0])}')
-                    e = Edge(iid=str(id_e), a_iid=str(node1[0][0]), b_iid=str(node2[0][0]), direction=d,
+                    d = Direction(f'{str(id1)}>{str(id2)}')
+                    e = Edge(iid=str(id_e), a_iid=str(id1), b_iid=str(id2), direction=d,
                              properties={}, labels=[])
                     iron.add_edge(str(id_e), e)
                     id_e += 1
@@ -242,6 +257,10 @@ class TranslatorBipartiteSynGraph(AbsTranslator):
                 'While translating from a bipartite SynGraph to Iron an empty route was found: "None" returned')
             return None
 
+    def to_networkx(self, syngraph: BipartiteSynGraph) -> Union[nx.classes.digraph.DiGraph, None]:
+        """ Translates a BipartiteSynGraph instance directly into a Networkx object """
+        return syngraph_to_networkx(syngraph, match_by_smiles=True, with_unmapped_smiles=True)
+
 
 class TranslatorMonopartiteMolSynGraph(AbsTranslator):
     """ Translator subclass to handle translations into and from MonopartiteMolSynGraph instances"""
@@ -268,31 +287,38 @@ class TranslatorMonopartiteMolSynGraph(AbsTranslator):
             iron = Iron()
             id_n = 0
             id_e = 0
+            # the ids of the nodes already added to Iron are mapped to their Molecule and smiles
+            ids_by_class = {}
+            ids_by_smiles = {}
             for reac, connections in mp_syngraph.graph.items():
-                if reac not in [n.properties['node_class'] for id, n in iron.nodes.items()]:
+                if reac not in ids_by_class:
                     # if the smiles 'reac' is not yet among the nodes of the Iron instance,
                     # the corresponding node is created and added to Iron
                     prop = {'node_smiles': reac.smiles,
                             'node_class': reac}
-                    node1 = [(id_n, Node(iid=str(id_n), properties=prop, labels=[]))]
-                    iron.add_node(str(node1[0][0]), node1[0][1])
+                    iron.add_node(str(id_n), Node(iid=str(id_n), properties=prop, labels=[]))
+                    ids_by_class.setdefault(reac, id_n)
+                    ids_by_smiles.setdefault(reac.smiles, id_n)
+                    id1 = id_n
                     id_n += 1
                 else:
                     # if the smiles 'reac' is already included in Iron,
                     # the relative information are retrieved
-                    node1 = [(id, n) for id, n in iron.nodes.items() if n.properties['node_class'] == reac]
+                    id1 = ids_by_class[reac]
                 for c in connections:
-                    if c.smiles not in [n.properties['node_smiles'] for id, n in iron.nodes.items()]:
+                    if c.smiles not in ids_by_smiles:
                         prop = {'node_smiles': c.smiles,
                                 'node_class': c}
-                        node2 = [(id_n, Node(iid=str(id_n), properties=prop, labels=[]))]
-                        iron.add_node(str(node2[0][0]), node2[0][1])
+                        iron.add_node(str(id_n), Node(iid=str(id_n), properties=prop, labels=[]))
+                        ids_by_class.setdefault(c, id_n)
+                        ids_by_smiles.setdefault(c.smiles, id_n)
+                        id2 = id_n
                         id_n += 1
                     else:
-                        node2 = [(id, n) for id, n in iron.nodes.items() if n.properties['node_class'] == c]
+                        id2 = ids_by_class[c]
 
-                    d = Direction(f'{str(node1[0][0])}>{str(node2[0][0])}')
-                    e = Edge(iid=str(id_e), a_iid=str(node1[0][0]), b_iid=str(node2[0][0]), direction=d,
+                    d = Direction(f'{str(id1)}>{str(id2)}')
+                    e = Edge(iid=str(id_e), a_iid=str(id1), b_iid=str(id2), direction=d,
                              properties={},
                              labels=[])
                     iron.add_edge(str(id_e), e)
@@ -305,6 +331,67 @@ class TranslatorMonopartiteMolSynGraph(AbsTranslator):
                 'returned')
             return None
 
+    def to_networkx(self, mp_syngraph: MonopartiteMolSynGraph) -> Union[nx.classes.digraph.DiGraph, None]:
+        """ Translates a MonopartiteMolSynGraph instance directly into a Networkx object """
+        return syngraph_to_networkx(mp_syngraph, match_by_smiles=False, with_unmapped_smiles=False)
+
+
+def syngraph_to_networkx(syngraph: Union[BipartiteSynGraph, MonopartiteReacSynGraph, MonopartiteMolSynGraph],
+                         match_by_smiles: bool, with_unmapped_smiles: bool) -> Union[nx.classes.digraph.DiGraph, None]:
+    """ Takes a SynGraph instance and builds the corresponding Networkx object in a single pass, without the
+        intermediate Iron instance. The nodes and edges attributes are the same as those obtained through Iron.
+
+        :param:
+            syngraph: a SynGraph instance
+
+            match_by_smiles: a boolean indicating whether the 'parent' nodes are identified by their smiles (as in the
+                             bipartite translator) or by the node object itself (as in the monopartite translators)
+
+            with_unmapped_smiles: a boolean indicating whether the 'node_unmapped_smiles' property should be computed
+
+        :return:
+            nx_graph: a Networkx DiGraph object
+    """
+    if syngraph is None:
+        logger.warning('While translating from SynGraph to NetworkX object an empty route was found: "None" returned')
+        return None
+
+    # the same node ids that would be assigned in the Iron instance are used to build the edges direction
+    ids_by_class = {}
+    ids_by_smiles = {}
+    ids_by_parent = ids_by_smiles if match_by_smiles else ids_by_class
+    nodes_attributes = {}
+    edges = []
+
+    def add_node(node) -> int:
+        prop = {}
+        if with_unmapped_smiles:
+            prop['node_unmapped_smiles'] = cif.rdrxn_to_string(node.rdrxn, out_fmt='smiles', use_atom_mapping=False) \
+                if type(node) == ChemicalEquation else node.smiles
+        prop['node_smiles'] = node.smiles
+        prop['node_class'] = node
+        id_n = len(nodes_attributes)
+        nodes_attributes[id_n] = (node.smiles, {'properties': prop, 'labels': [], 'source': syngraph.source})
+        ids_by_class.setdefault(node, id_n)
+        ids_by_smiles.setdefault(node.smiles, id_n)
+        return id_n
+
+    for reac, connections in syngraph.graph.items():
+        key = reac.smiles if match_by_smiles else reac
+        id1 = ids_by_parent[key] if key in ids_by_parent else add_node(reac)
+        for c in connections:
+            id2 = ids_by_parent[c.smiles if match_by_smiles else c] if c.smiles in ids_by_smiles else add_node(c)
+            edges.append((nodes_attributes[id1][0], nodes_attributes[id2][0],
+                          {'attributes': {'direction': f'{id1}>{id2}', 'properties': {}, 'labels': []}}))
+
+    nx_graph = nx.DiGraph()
+    nx_graph.graph['source'] = syngraph.source
+    nx_graph.add_edges_from(edges)
+    # as in the translation from Iron, the isolated nodes are included only if the graph has no edges
+    nx_graph.add_nodes_from((smiles, {'attributes': attributes}) for smiles, attributes in nodes_attributes.values()
+                            if not edges or smiles in nx_graph)
+    return nx_graph
+
 
 class TranslatorNetworkx(AbsTranslator):
     """ Translator subclass to handle translations into and from Networkx objects """
@@ -710,6 +797,9 @@ class SynGraphToIron(Handler):
 
     def translate(self, input_format, graph, output_format, out_data_model):
         factory = TranslatorFactory()
+        if output_format == 'networkx':
+            # the networkx graph is built directly from the syngraph, without the Iron round-trip
+            return factory.data_models[out_data_model]['value']().to_networkx(graph)
         graph = factory.select_translation_to_iron('syngraph', graph, out_data_model)
         graph = IronToOutput().translate(input_format, graph, output_format, out_data_model)
         return graph
@@ -178,6 +178,52 @@ def select_fp_vector(fpgen, count_fp_vector):
     return fpgen.GetCountFingerprint if count_fp_vector else fpgen.GetFingerprint
 
 
+###########################################################################################
+# Fingerprints store
+class FingerprintStore:
+    """ Class storing the fingerprints of Molecule and ChemicalEquation instances, so that the fingerprint of each
+        node is computed only once, even if the node appears in several routes.
+
+        Attributes:
+            fingerprints: a dictionary mapping the tuple (uid, fingerprint name, frozen parameters, count flag) to the
+                          corresponding fingerprint
+    """
+
+    def __init__(self):
+        self.fingerprints = {}
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def get_reaction_fingerprint(self, chemical_equation, fp_name: str, params=None):
+        """ To get the fingerprint of a ChemicalEquation, computing it only if it is not stored yet """
+        key = (chemical_equation.uid, fp_name, freeze_params(params), None)
+        if key not in self.fingerprints:
+            self.fingerprints[key] = compute_reaction_fingerprint(chemical_equation.rdrxn, fp_name=fp_name,
+                                                                  params=params)
+        return self.fingerprints[key]
+
+    def get_molecular_fingerprint(self, molecule, fp_name: str, parameters=None, count_fp_vector=False):
+        """ To get the fingerprint of a Molecule, computing it only if it is not stored yet """
+        key = (molecule.uid, fp_name, freeze_params(parameters), count_fp_vector)
+        if key not in self.fingerprints:
+            self.fingerprints[key] = compute_mol_fingerprint(molecule.rdmol, fp_name=fp_name, parameters=parameters,
+                                                             count_fp_vector=count_fp_vector)
+        return self.fingerprints[key]
+
+    def clear(self):
+        """ To remove all the stored fingerprints """
+        self.fingerprints.clear()
+
+
+def freeze_params(params):
+    """ To transform a dictionary of fingerprint parameters into a hashable object """
+    if not params:
+        return None
+    return tuple(sorted((k, v if isinstance(v, (int, float, str, bool, type(None))) else repr(v))
+                        for k, v in params.items()))
+
+
 # Chemical similarity calculation
 def compute_similarity(fp1, fp2, similarity_name: str) -> float:
     """
@@ -196,6 +242,9 @@ def compute_similarity(fp1, fp2, similarity_name: str) -> float:
                       'dice': cif.DataStructs.DiceSimilarity,
                       'mcconnaughey': cif.DataStructs.McConnaugheySimilarity}
 
+    if similarity_name not in similarity_map:
+        raise KeyError(f'Invalid similarity type: {similarity_name} is not available.\n'
+                       f'Available options are: {similarity_map.keys()}')
     metric = similarity_map.get(similarity_name)
     # The syntax below is not compatible with count vectors fingerprints generated by GetCountFingerprint and with the
     # difference fingerprints for reactions
@@ -203,5 +252,34 @@ def compute_similarity(fp1, fp2, similarity_name: str) -> float:
     return metric(fp1, fp2)
 
 
+def compute_bulk_similarity(fp, fps: list, similarity_name: str) -> list:
+    """
+    Computes the chemical similarity between a fingerprint and a list of fingerprints using the selected similarity
+    algorithm in a single call
+
+    :param:
+        fp: a molecular or reaction fingerprint
+
+        fps: a list of molecular or reaction fingerprints
+
+        similarity_name: string indicating the selected similarity algorithm
+
+    :return:
+        a list of floats, with the similarity between fp and each fingerprint in fps
+    """
+    bulk_similarity_map = {'tanimoto': cif.DataStructs.BulkTanimotoSimilarity,
+                           'kulczynski': cif.DataStructs.BulkKulczynskiSimilarity,
+                           'dice': cif.DataStructs.BulkDiceSimilarity,
+                           'mcconnaughey': cif.DataStructs.BulkMcConnaugheySimilarity}
+    if similarity_name not in bulk_similarity_map:
+        raise KeyError(f'Invalid similarity type: {similarity_name} is not available.\n'
+                       f'Available options are: {bulk_similarity_map.keys()}')
+    try:
+        return list(bulk_similarity_map[similarity_name](fp, fps))
+    except TypeError:
+        # Some bulk functions are not available for count vectors fingerprints and difference reaction fingerprints
+        return [compute_similarity(fp, fp2, similarity_name=similarity_name) for fp2 in fps]
+
+
 if __name__ == '__main__':
     print('main')
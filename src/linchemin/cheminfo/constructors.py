@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
 from dataclasses import dataclass
 from typing import Dict, List, Tuple, Union
 
@@ -88,6 +88,62 @@ class MolIdentifierFactory:
         return generator().compute_identifier(self.rdmol, hash_map)
 
 
+# Instance caches
+class InstanceCache:
+    """ Class implementing a bounded LRU cache of model instances (e.g. Molecule or ChemicalEquation), so that an
+        object built more than once from the same input is constructed only once and the same instance is shared.
+
+            Attributes:
+                maxsize: an integer indicating the maximum number of stored instances; if 0, nothing is stored
+
+                hits: an integer counting the requests for which an instance was found in the cache
+
+                misses: an integer counting the requests for which no instance was found in the cache
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._store = OrderedDict()
+
+    def __len__(self):
+        return len(self._store)
+
+    def get(self, key: tuple):
+        """ To retrieve the instance associated with a key, if present """
+        instance = self._store.get(key)
+        if instance is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._store.move_to_end(key)
+        return instance
+
+    def put(self, key: tuple, instance) -> None:
+        """ To store an instance; the least recently used one is discarded if the cache is full """
+        if self.maxsize <= 0:
+            return
+        self._store[key] = instance
+        self._store.move_to_end(key)
+        if len(self._store) > self.maxsize:
+            self._store.popitem(last=False)
+
+    def clear(self) -> None:
+        """ To remove all the stored instances and reset the statistics """
+        self._store.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def get_stats(self) -> dict:
+        """ To get the statistics of the cache """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._store), 'maxsize': self.maxsize}
+
+
+molecule_cache = InstanceCache(maxsize=settings.CONSTRUCTORS.get('molecule_cache_size', 10000))
+chemical_equation_cache = InstanceCache(maxsize=settings.CONSTRUCTORS.get('chemical_equation_cache_size', 10000))
+
+
 # Molecule Constructor
 class MoleculeConstructor:
     """ Class implementing the constructor of the Molecule class
@@ -112,13 +168,25 @@ class MoleculeConstructor:
         self.hash_list = set(hash_list + [self.molecular_identity_property_name])
 
     def build_from_molecule_string(self, molecule_string: str, inp_fmt: str, ) -> Molecule:
-        """ To build a Molecule instance from a string """
+        """ To build a Molecule instance from a string. If the same string was already used with the same constructor
+            settings, the Molecule instance stored in the molecule cache is returned """
+        key = ('string', molecule_string, inp_fmt, self.molecular_identity_property_name, tuple(sorted(self.hash_list)))
+        if (molecule := molecule_cache.get(key)) is not None:
+            return molecule
         rdmol_input = cif.rdmol_from_string(input_string=molecule_string, inp_fmt=inp_fmt)
-        return self.build_from_rdmol(rdmol_input)
+        molecule = self.build_from_rdmol(rdmol_input)
+        molecule_cache.put(key, molecule)
+        return molecule
 
     def build_from_rdmol(self, rdmol: cif.Mol) -> Molecule:
-        """ To build a Molecule instance from a rdkit Mol instance """
+        """ To build a Molecule instance from a rdkit Mol instance. The Molecule only depends on the canonical mapped
+            smiles of the rdkit Mol, so that, if an equivalent rdkit Mol was already used with the same constructor
+            settings, the Molecule instance stored in the molecule cache is returned """
         rdmol_mapped = rdmol
+        mapped_smiles = cif.compute_mol_smiles(rdmol=rdmol_mapped)
+        key = ('rdmol', mapped_smiles, self.molecular_identity_property_name, tuple(sorted(self.hash_list)))
+        if (molecule := molecule_cache.get(key)) is not None:
+            return molecule
         rdmol_unmapped = cif.remove_rdmol_atom_mapping(rdmol=rdmol_mapped)
         rdmol_unmapped_canonical = cif.canonicalize_rdmol_lite(rdmol=rdmol_unmapped, is_pattern=False)
         rdmol_mapped_canonical = cif.canonicalize_mapped_rdmol(
@@ -127,9 +195,11 @@ class MoleculeConstructor:
         identity_property = hash_map.get(self.molecular_identity_property_name)
         uid = utilities.create_hash(identity_property)
         smiles = cif.compute_mol_smiles(rdmol=rdmol_unmapped_canonical)
-        return Molecule(rdmol=rdmol_unmapped_canonical, rdmol_mapped=rdmol_mapped_canonical,
-                        molecular_identity_property_name=self.molecular_identity_property_name, hash_map=hash_map,
-                        smiles=smiles, uid=uid, identity_property=identity_property)
+        molecule = Molecule(rdmol=rdmol_unmapped_canonical, rdmol_mapped=rdmol_mapped_canonical,
+                            molecular_identity_property_name=self.molecular_identity_property_name, hash_map=hash_map,
+                            smiles=smiles, uid=uid, identity_property=identity_property)
+        molecule_cache.put(key, molecule)
+        return molecule
 
 
 # Ratam Constructor
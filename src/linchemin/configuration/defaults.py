@@ -38,6 +38,23 @@ DEFAULT_GED = {
                                   'info': 'The Tanimoto similarity as defined in RDKit is used for computing the '
                                           'molecular similarity',
                                   'general_info': 'Chemical similarity method for molecules'},
+    'timeout': {'value': None,
+                'info': 'No time limit is set for the GED calculation of a pair of routes',
+                'general_info': 'Maximum time in seconds for the GED calculation of a pair of routes; when it is '
+                                'reached, the best upper bound found so far is used'},
+    'max_distance': {'value': None,
+                     'info': 'The exact distance is computed for all the pairs of routes',
+                     'general_info': 'Distance threshold; the calculation for a pair of routes is stopped as soon as '
+                                     'its distance is known to be above the threshold'},
+    'wl_iterations': {'value': 3,
+                      'info': 'Three refinement iterations of the node labels are used by the Weisfeiler-Lehman kernel',
+                      'general_info': 'Number of refinement iterations of the node labels in the Weisfeiler-Lehman '
+                                      'kernel'},
+    'prefilter_cutoff': {'value': None,
+                         'info': 'The GED is computed for all the pairs of routes',
+                         'general_info': 'Cutoff of the prefilter; the GED is not computed for the pairs of routes '
+                                         'whose lower bound, based on their reactions and molecules, is above it, '
+                                         'and the lower bound is used instead'},
 }
 
 DEFAULT_FACADE = {
@@ -74,7 +91,9 @@ DEFAULT_CONSTRUCTORS = {'molecular_identity_property_name': 'smiles',
                         'chemical_equation_identity_name': 'r_p',
                         'pattern_identity_property_name': 'smarts',
                         'template_identity_property': 'r_p',
-                        'molecular_hash_list': ['inchi_key', 'inchikey_KET_15T']}
+                        'molecular_hash_list': ['inchi_key', 'inchikey_KET_15T'],
+                        'molecule_cache_size': 10000,
+                        'chemical_equation_cache_size': 10000}
 
 DEFAULT_CHEMICAL_SIMILARITY = {'includeAgents': True,
                                'diff_fp_fpSize': 2048,
@@ -88,7 +107,18 @@ DEFAULT_CHEMICAL_SIMILARITY = {'includeAgents': True,
                                }
 
 DEFAULT_CLUSTERING = {'min_cluster_size': 3,
-                      'linkage': 'single'}
+                      'linkage': 'single',
+                      'max_n_clusters': None,
+                      'silhouette_sample_size': None,
+                      'n_neighbors': 10,
+                      'knn_embedding': 'fingerprints',
+                      'graph_clustering': 'hdbscan',
+                      'n_exemplars': 1,
+                      'novelty_threshold': None}
+
+DEFAULT_GED_CACHE = {'enabled': False,
+                     'path': '~/linchemin/ged_cache.sqlite',
+                     'max_entries': 1000000}
 
 def get_settings():
     """ To assemble the default values read from the dictionaries above and written to the settings.yaml file"""
@@ -99,6 +129,7 @@ def get_settings():
         all_settings['FACADE'].update(d['value'])
     all_settings['CHEMICAL_SIMILARITY'] = DEFAULT_CHEMICAL_SIMILARITY
     all_settings['CLUSTERING'] = DEFAULT_CLUSTERING
+    all_settings['GED_CACHE'] = DEFAULT_GED_CACHE
     return all_settings
 
 
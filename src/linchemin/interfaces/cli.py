@@ -2,7 +2,11 @@ import argparse
 from dataclasses import dataclass, field
 from typing import List
 
+import numpy as np
+
 from linchemin.interfaces.workflows import get_workflow_options, process_routes
+from linchemin.rem.graph_distance import (merge_distance_shards,
+                                          run_distance_shard)
 
 
 class keyvalue(argparse.Action):
@@ -72,6 +76,32 @@ def linchemin_cli(argv=None):
     print('END: LinChemIn')
 
 
+def distance_shard_cli(argv=None):
+    """ Command line interface to run a shard of a distance matrix, prepared with
+        linchemin.rem.graph_distance.write_distance_shards, and to merge the results of all the shards. """
+    parser = argparse.ArgumentParser(description='To compute a distance matrix split in shards')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Compute the cells of a shard and write its partial result')
+    run_parser.add_argument('task_file', help='Path to the task file of the shard')
+    run_parser.add_argument('-n_cpu', type=int, default=1, dest='n_cpu',
+                            help='Number of CPUs to be used for the shard')
+
+    merge_parser = subparsers.add_parser('merge', help='Assemble the condensed distance matrix from the shards')
+    merge_parser.add_argument('directory', help='Path to the directory with the task and result files')
+    merge_parser.add_argument('-output', default='distance_matrix.npz', dest='output',
+                              help='Path to the .npz file where the condensed matrix and its diagonal are written')
+
+    parsed = parser.parse_args(argv)
+    if parsed.command == 'run':
+        result_file = run_distance_shard(parsed.task_file, n_cpu=parsed.n_cpu)
+        print(f'Shard result written to {result_file}')
+    else:
+        matrix = merge_distance_shards(parsed.directory)
+        np.savez(parsed.output, condensed=matrix.condensed, diagonal=matrix.diagonal)
+        print(f'Distance matrix of {len(matrix)} routes written to {parsed.output}')
+
+
 if __name__ == '__main__':
     print('xx')
     linchemin_cli()
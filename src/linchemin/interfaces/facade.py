@@ -21,7 +21,8 @@ from linchemin.cheminfo.atom_mapping import (get_available_mappers,
 from linchemin.configuration.defaults import DEFAULT_FACADE
 from linchemin.rem.clustering import (ClusteringError, clusterer,
                                       get_available_clustering,
-                                      get_clustered_routes_metrics)
+                                      get_clustered_routes_metrics,
+                                      get_silhouette_info)
 from linchemin.rem.graph_distance import (GraphDistanceError,
                                           compute_distance_matrix,
                                           get_available_ged_algorithms,
@@ -285,10 +286,13 @@ class GedFacade(Facade):
                 n_cpu: an integer specifying the number of cpus to be used in the parallel calculation
 
             :return:
-                dist_matrix: a pandas DataFrame (n routes) x (n routes) with the ged values
+                dist_matrix: a DistanceMatrix (n routes) x (n routes) with the ged values, usable as a pandas DataFrame
 
                 meta: a dictionary storing information about the type of graph (mono or bipartite), the algorithm used
-                      for the ged calculations and the parameters for chemical similarity and fingerprints
+                      for the ged calculations, the parameters for chemical similarity and fingerprints, the number
+                      of pairs for which the time budget was reached, the number of pairs whose distance is above
+                      the 'max_distance' parameter, the number of pairs skipped by the prefilter and the hits and
+                      misses of the GED result cache
         """
 
         exceptions: list = []
@@ -299,6 +303,11 @@ class GedFacade(Facade):
             meta = {'ged_algorithm': ged_method, 'ged_params': ged_params,
                     'graph_type': 'monopartite' if type(routes[0]) == MonopartiteReacSynGraph else 'bipartite',
                     'invalid_routes': len(routes) - len(checked_routes),
+                    'timed_out_pairs': len(dist_matrix.attrs['timed_out_positions']),
+                    'pruned_pairs': int(dist_matrix.attrs['pruned_mask'].sum()),
+                    'prefiltered_pairs': len(dist_matrix.attrs['prefiltered_positions']),
+                    'ged_cache_hits': dist_matrix.attrs.get('ged_cache', {}).get('hits', 0),
+                    'ged_cache_misses': dist_matrix.attrs.get('ged_cache', {}).get('misses', 0),
                     'errors': exceptions}
 
         except GraphDistanceError as ke:
@@ -378,6 +387,7 @@ class ClusteringFacade:
                               compute_metrics=DEFAULT_FACADE['clustering']['value']['compute_metrics'],
                               parallelization=DEFAULT_FACADE['clustering']['value']['parallelization'],
                               n_cpu=DEFAULT_FACADE['clustering']['value']['n_cpu'],
+                              routes_descriptors=None,
                               **kwargs):
         """
             Performs clustering of the routes in the provided list.
@@ -400,8 +410,17 @@ class ClusteringFacade:
 
                 n_cpu: an integer specifying the number of cpus to be used in the parallel calculation
 
-                kwargs: the type of linkage can be indicated when using the agglomerative_cluster; the minimum size of the
-                        clusters can be indicated when using hdbscan
+                routes_descriptors: a pandas DataFrame with the descriptors of the routes, as returned by the
+                                    'routes_descriptors' functionality; if given, the number of steps and branches
+                                    are reused when computing the metrics
+
+                kwargs: the type of linkage and the maximum number of clusters (max_n_clusters; default: None -> all
+                        the numbers of clusters are tried) can be indicated when using the agglomerative_cluster; the
+                        minimum size of the clusters can be indicated when using hdbscan; the number of neighbours
+                        (n_neighbors), the embedding used to find them (knn_embedding), the clustering of the graph
+                        (graph_clustering) and the maximum distance of the linked routes (distance_threshold) can be
+                        indicated when using knn_graph; the size of the sample used for the silhouette score
+                        (silhouette_sample_size) can be indicated for all
 
             :return:
                 results: a tuple with: clustering, score, (dist_matrix), corresponding to the output of the clustering,
@@ -409,7 +428,9 @@ class ClusteringFacade:
 
                 meta: a dictionary storing information about the original file and the CASP tool that produced the routes,
                     the type of graph (mono or bipartite), information regarding the clustering, information regarding
-                    the ged calculations and the parameters for chemical similarity and fingerprints
+                    the ged calculations and the parameters for chemical similarity and fingerprints; the 'silhouette'
+                    key reports the mode ('full' or 'sampled'), the number of routes and the metric ('ged' or
+                    'embedding_cosine') used for the silhouette score
         """
 
         if clustering_method is None:
@@ -426,11 +447,13 @@ class ClusteringFacade:
             meta = {'graph_type': 'monopartite' if type(routes[0]) == MonopartiteReacSynGraph else 'bipartite',
                     'clustering_algorithm': clustering_method, 'clustering_params': kwargs,
                     'ged_algorithm': ged_method, 'ged_parameters': ged_params,
+                    'silhouette': getattr(results[0], 'silhouette_info', None) or
+                    get_silhouette_info(len(checked_routes), kwargs.get('silhouette_sample_size')),
                     'invalid_routes': len(routes) - len(checked_routes),
                     'errors': exceptions}
 
             if compute_metrics:
-                metrics = get_clustered_routes_metrics(routes, results[0])
+                metrics = get_clustered_routes_metrics(checked_routes, results[0], routes_descriptors)
 
         except ClusteringError as sre:
             exceptions.append(sre)
@@ -143,7 +143,7 @@ class ClusteringAndDistanceMatrixStep(WorkflowStep):
                                                ged_params=params['ged_params'],
                                                save_dist_matrix=True,
                                                compute_metrics=True, parallelization=params['parallelization'],
-                                               n_cpu=params['n_cpu'])
+                                               n_cpu=params['n_cpu'], routes_descriptors=output.descriptors)
         if cluster_output is None and metrics is None:
             output.log['clustering_and_d_matrix'] = meta
         else:
@@ -172,7 +172,7 @@ class ClusteringStep(WorkflowStep):
                                                ged_params=params['ged_params'],
                                                compute_metrics=True,
                                                parallelization=params['parallelization'],
-                                               n_cpu=params['n_cpu'])
+                                               n_cpu=params['n_cpu'], routes_descriptors=output.descriptors)
         if cluster_output is None:
             output.log['clustering_and_d_matrix'] = meta
         else:
@@ -1,13 +1,31 @@
 import abc
+import multiprocessing as mp
+from dataclasses import dataclass
 
 import hdbscan
 import numpy as np
 import pandas as pd
-from sklearn.cluster import AgglomerativeClustering
-from sklearn.metrics import silhouette_score
-
+from scipy import sparse
+from scipy.cluster.hierarchy import fcluster
+from scipy.cluster.hierarchy import linkage as hierarchical_linkage
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial.distance import squareform
+from sklearn.neighbors import NearestNeighbors
+
+import linchemin.IO.io as lio
 from linchemin import settings
-from linchemin.rem.graph_distance import compute_distance_matrix
+from linchemin.cgu.convert import converter
+from linchemin.cgu.syngraph import BipartiteSynGraph
+from linchemin.cheminfo.chemical_similarity import FingerprintStore
+from linchemin.configuration.defaults import DEFAULT_CLUSTERING
+from linchemin.rem.graph_distance import (PRUNED_DISTANCE, DistanceMatrix,
+                                          compute_cells,
+                                          compute_cosine_distance_matrix,
+                                          compute_distance_matrix,
+                                          compute_fingerprint_features,
+                                          compute_pair_distance,
+                                          compute_wl_features,
+                                          resolve_ged_params)
 from linchemin.rem.route_descriptors import descriptor_calculator
 from linchemin.utilities import console_logger
 
@@ -42,15 +60,64 @@ class SingleRouteClustering(ClusteringError):
     pass
 
 
+@dataclass
+class LinkageClustering:
+    """ Class storing the clustering obtained by cutting a hierarchical linkage; like the estimators of scikit-learn,
+        it exposes the labels of the routes in the 'labels_' attribute.
+
+        Attributes:
+            labels_: a NumPy array with the cluster label of each route, starting from 0
+
+            n_clusters_: an integer indicating the number of clusters
+
+            linkage_matrix: the linkage matrix computed by scipy, from which the clustering was obtained
+    """
+    labels_: np.ndarray
+    n_clusters_: int
+    linkage_matrix: np.ndarray
+
+
+# Distance assigned to the edges between identical routes in the sparse distance graphs, whose zeros are not edges
+_MIN_GRAPH_DISTANCE = 1e-8
+# Maximum number of routes used for the silhouette score of the clustering of the k-nearest-neighbours graph
+KNN_SILHOUETTE_SAMPLE_SIZE = 1000
+
+
+@dataclass
+class GraphClustering:
+    """ Class storing the clustering of the sparse graph linking each route to its nearest neighbours; like the
+        estimators of scikit-learn, it exposes the labels of the routes in the 'labels_' attribute.
+
+        Attributes:
+            labels_: a NumPy array with the cluster label of each route, starting from 0; -1 indicates noise
+
+            n_clusters_: an integer indicating the number of clusters
+
+            distance_graph: a scipy sparse matrix with the distances between each route and its nearest neighbours
+
+            silhouette_info: a dictionary with the mode, the sample size and the metric used for the silhouette score
+    """
+    labels_: np.ndarray
+    n_clusters_: int
+    distance_graph: sparse.csr_matrix
+    silhouette_info: dict
+
+
 class ClusterCalculator(metaclass=abc.ABCMeta):
     """ Definition of the abstract class for ClusterCalculator """
 
+    def cluster_routes(self, syngraphs: list, ged_method: str, ged_params=None, save_dist_matrix=False,
+                       parallelization=False, n_cpu=None, **kwargs):
+        """ Computes the distance matrix of the routes and applies the clustering algorithm to it """
+        dist_matrix = compute_distance_matrix(syngraphs, ged_method, ged_params, parallelization, n_cpu)
+        return self.get_clustering(dist_matrix, save_dist_matrix, **kwargs)
+
     @abc.abstractmethod
     def get_clustering(self, dist_matrix: pd.DataFrame, save_dist_matrix: bool, **kwargs):
         """ Applies the clustering algorithm to the provided distance matrix
 
             :param:
-                dist_matrix: a pandas.DataFrame
+                dist_matrix: a DistanceMatrix (or a pandas.DataFrame)
                     It contains the symmetric distance matrix for the routes
 
                 save_dist_matrix: a boolean
@@ -65,11 +132,12 @@ class HdbscanClusterCalculator(ClusterCalculator):
     """ Subclass of ClusterCalculator to apply the Hdbscan algorithm """
 
     def get_clustering(self, dist_matrix, save_dist_matrix, **kwargs):
-        """ Applies the Hdbscan algorithm. Possible optional arguments: min_cluster_size """
+        """ Applies the Hdbscan algorithm. Possible optional arguments: min_cluster_size, silhouette_sample_size """
         min_cluster_size = kwargs.get("min_cluster_size", settings.CLUSTERING.min_cluster_size)
 
-        clustering = hdbscan.HDBSCAN(min_cluster_size=min_cluster_size, metric='precomputed').fit(
-            dist_matrix.to_numpy(dtype=float))
+        # hdbscan only accepts float64 distances
+        square_matrix = get_square_distances(dist_matrix, dtype=np.float64)
+        clustering = hdbscan.HDBSCAN(min_cluster_size=min_cluster_size, metric='precomputed').fit(square_matrix)
 
         if clustering is None:
             logger.error('The clustering algorithm did not return any result.')
@@ -79,7 +147,7 @@ class HdbscanClusterCalculator(ClusterCalculator):
             # hdbscan: with less than 15 datapoints, only noise is found
             logger.error('Hdbscan found only noise. This can occur if less than 15 routes were given')
             raise OnlyNoiseClustering
-        s_score = compute_silhouette_score(dist_matrix, clustering.labels_)
+        s_score = compute_silhouette_score(dist_matrix, clustering.labels_, kwargs.get("silhouette_sample_size"))
         print(f'The Silhouette score is {round(s_score, 3):.3f}')
         return (clustering, s_score, dist_matrix) if save_dist_matrix is True else (clustering, s_score)
 
@@ -88,9 +156,14 @@ class AgglomerativeClusterCalculator(ClusterCalculator):
     """ Subclass of ClusterCalculator to apply the Agglomerative Clustering algorithm """
 
     def get_clustering(self, dist_matrix, save_dist_matrix, **kwargs):
-        """ Applies the Agglomerative Clustering algorithm. Possible optional arguments: linkage """
+        """ Applies the Agglomerative Clustering algorithm. Possible optional arguments: linkage, max_n_clusters,
+            silhouette_sample_size. By default, all the numbers of clusters are tried; max_n_clusters can be set to
+            limit the search to the smallest ones, when many routes are clustered. """
         linkage = kwargs.get("linkage", settings.CLUSTERING.linkage)
-        clustering, s_score, best_n_cluster = optimize_agglomerative_cluster(dist_matrix, linkage)
+        max_n_clusters = kwargs.get("max_n_clusters",
+                                    settings.CLUSTERING.get('max_n_clusters', DEFAULT_CLUSTERING['max_n_clusters']))
+        clustering, s_score, best_n_cluster = optimize_agglomerative_cluster(dist_matrix, linkage, max_n_clusters,
+                                                                             kwargs.get("silhouette_sample_size"))
 
         if clustering is None:
             logger.error('The clustering algorithm did not return any result.')
@@ -105,6 +178,178 @@ class AgglomerativeClusterCalculator(ClusterCalculator):
         return (clustering, s_score, dist_matrix) if save_dist_matrix is True else (clustering, s_score)
 
 
+class KnnGraphClusterCalculator(ClusterCalculator):
+    """ Subclass of ClusterCalculator to cluster the sparse graph linking each route to its nearest neighbours. When
+        the routes are given, the neighbours are searched with a cheap embedding of the routes and the distance is
+        computed only for the pairs of neighbours, so that the dense distance matrix is never built. """
+
+    def get_clustering(self, dist_matrix, save_dist_matrix, **kwargs):
+        """ Applies the clustering to the graph of the nearest neighbours in a distance matrix. Possible optional
+            arguments: n_neighbors, graph_clustering, min_cluster_size, distance_threshold, silhouette_sample_size """
+        # the pruned pairs are not linked in the graph
+        square_matrix = get_square_distances(dist_matrix, dtype=np.float64, clamp_pruned=False).copy()
+        n_routes = len(square_matrix)
+        n_neighbors = min(get_n_neighbors(kwargs), n_routes - 1)
+        np.fill_diagonal(square_matrix, np.inf)
+        neighbors = np.argpartition(square_matrix, n_neighbors - 1, axis=1)[:, :n_neighbors]
+        rows = np.repeat(np.arange(n_routes), n_neighbors)
+        columns = neighbors.ravel()
+        distance_graph = build_distance_graph(n_routes, rows, columns, square_matrix[rows, columns])
+        labels = cluster_distance_graph(distance_graph, **kwargs)
+        check_graph_labels(labels)
+
+        sample_size = kwargs.get("silhouette_sample_size")
+        s_score = compute_silhouette_score(dist_matrix, labels, sample_size)
+        clustering = GraphClustering(labels_=labels, n_clusters_=int(labels.max()) + 1, distance_graph=distance_graph,
+                                     silhouette_info=get_silhouette_info(n_routes, sample_size))
+        print(f'The Silhouette score is {round(s_score, 3):.3f}')
+        return (clustering, s_score, dist_matrix) if save_dist_matrix is True else (clustering, s_score)
+
+    def cluster_routes(self, syngraphs, ged_method, ged_params=None, save_dist_matrix=False, parallelization=False,
+                       n_cpu=None, **kwargs):
+        """ Computes the distances between each route and its nearest neighbours, found with the cosine similarity of
+            the embedding of the routes, and clusters the resulting sparse graph. The embedding ('knn_embedding')
+            is either the sum of the fingerprints of the nodes ('fingerprints') or the Weisfeiler-Lehman features
+            ('wl'). The silhouette score is computed with the cosine distances of the embedding of a stratified
+            sample of routes, as reported by the 'metric' of silhouette_info. If save_dist_matrix is True, the sparse
+            distance graph is returned in place of the distance matrix. """
+        params = resolve_ged_params(ged_params)
+        n_routes = len(syngraphs)
+        fingerprint_store = FingerprintStore()
+        features = compute_route_embedding(syngraphs, params, kwargs.get("knn_embedding"), fingerprint_store)
+        n_neighbors = min(get_n_neighbors(kwargs), n_routes - 1)
+        neighbors = NearestNeighbors(n_neighbors=n_neighbors, metric='cosine',
+                                     algorithm='brute').fit(features).kneighbors(return_distance=False)
+        # each pair of neighbours is computed only once
+        cells = sorted({(min(i, j), max(i, j)) for i, row in enumerate(neighbors) for j in row if i != j})
+        computed = compute_cells(syngraphs, cells, ged_method, params, parallelization, n_cpu or mp.cpu_count(),
+                                 fingerprint_store)
+        rows, columns, values = zip(*[(i, j, sim) for i, j, sim, _, _ in computed])
+        distance_graph = build_distance_graph(n_routes, np.array(rows), np.array(columns), np.array(values))
+        labels = cluster_distance_graph(distance_graph, **kwargs)
+        check_graph_labels(labels)
+
+        sample_size = kwargs.get("silhouette_sample_size") or min(n_routes, KNN_SILHOUETTE_SAMPLE_SIZE)
+        # the GED of all the pairs in the sample would be too expensive, so the scores of this method are not
+        # comparable with those computed on the distance matrix
+        silhouette_info = get_silhouette_info(n_routes, sample_size, metric='embedding_cosine')
+        sample = np.arange(n_routes) if silhouette_info['mode'] == 'full' else \
+            get_stratified_sample(labels, sample_size)
+        s_score = compute_silhouette_score(compute_cosine_distance_matrix(features[sample]), labels[sample],
+                                           len(sample))
+        clustering = GraphClustering(labels_=labels, n_clusters_=int(labels.max()) + 1, distance_graph=distance_graph,
+                                     silhouette_info=silhouette_info)
+        print(f'The Silhouette score is {round(s_score, 3):.3f}')
+        return (clustering, s_score, distance_graph) if save_dist_matrix is True else (clustering, s_score)
+
+
+def compute_route_embedding(syngraphs: list, ged_params: dict, embedding=None, fingerprint_store=None):
+    """ To compute the sparse features used to search the nearest neighbours of the routes.
+
+        :param:
+            syngraphs: a list of SynGraph objects
+            ged_params: a dictionary with the complete set of GED parameters
+            embedding: a string, 'fingerprints' or 'wl' (optional; default: None -> the 'knn_embedding' in the
+                       CLUSTERING settings is used)
+            fingerprint_store: a FingerprintStore instance (optional; default: None)
+
+        :return:
+            features: a scipy sparse matrix (n routes x n features)
+    """
+    if embedding is None:
+        embedding = settings.CLUSTERING.get('knn_embedding', DEFAULT_CLUSTERING['knn_embedding'])
+    if embedding == 'fingerprints':
+        return compute_fingerprint_features(syngraphs, ged_params, fingerprint_store)
+    if embedding == 'wl':
+        return compute_wl_features(syngraphs, ged_params['wl_iterations'])
+    logger.error(f"'{embedding}' is not a valid embedding. Available embeddings are: ['fingerprints', 'wl']")
+    raise UnavailableClusteringAlgorithm
+
+
+def get_n_neighbors(kwargs: dict) -> int:
+    """ To get the number of neighbours of each route in the k-nearest-neighbours graph """
+    return kwargs.get("n_neighbors", settings.CLUSTERING.get('n_neighbors', DEFAULT_CLUSTERING['n_neighbors']))
+
+
+def check_graph_labels(labels: np.ndarray) -> None:
+    """ To check that at least one cluster was found in the k-nearest-neighbours graph """
+    if 0 not in labels:
+        logger.error('Only noise was found in the graph of the nearest neighbours.')
+        raise OnlyNoiseClustering
+
+
+def build_distance_graph(n_routes: int, rows: np.ndarray, columns: np.ndarray, values: np.ndarray):
+    """ To build the symmetric sparse graph with the distances between pairs of routes. The pairs whose distance is
+        PRUNED_DISTANCE are not linked and the distance between identical routes is set to _MIN_GRAPH_DISTANCE,
+        since the zeros of a sparse matrix are not edges.
+
+        :param:
+            n_routes: an integer indicating the number of routes
+            rows, columns: two NumPy arrays with the indices of the pairs of routes
+            values: a NumPy array with the distances of the pairs of routes
+
+        :return:
+            distance_graph: a scipy sparse csr_matrix (n routes x n routes)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    linked = values != PRUNED_DISTANCE
+    values = np.maximum(values[linked], _MIN_GRAPH_DISTANCE)
+    graph = sparse.coo_matrix((values, (rows[linked], columns[linked])), shape=(n_routes, n_routes)).tocsr()
+    # the duplicated entries are summed, so the maximum with the transpose is used to symmetrize
+    graph.sum_duplicates()
+    return graph.maximum(graph.T).tocsr()
+
+
+def cluster_distance_graph(distance_graph, **kwargs) -> np.ndarray:
+    """ To cluster a sparse distance graph. The edges longer than 'distance_threshold' are removed; then, each
+        connected component of the graph is either a cluster ('graph_clustering' = 'connected_components') or it is
+        clustered with hdbscan ('graph_clustering' = 'hdbscan'). The routes in components smaller than
+        'min_cluster_size' are labeled as noise.
+
+        :param:
+            distance_graph: a scipy sparse matrix with the distances between pairs of routes
+            kwargs: the optional graph_clustering, min_cluster_size, distance_threshold and n_neighbors arguments
+
+        :return:
+            labels: a NumPy array with the cluster label of each route; -1 indicates noise
+    """
+    method = kwargs.get("graph_clustering",
+                        settings.CLUSTERING.get('graph_clustering', DEFAULT_CLUSTERING['graph_clustering']))
+    if method not in ['hdbscan', 'connected_components']:
+        logger.error(f"'{method}' is not a valid graph clustering. Available methods are: "
+                     f"['hdbscan', 'connected_components']")
+        raise UnavailableClusteringAlgorithm
+    min_cluster_size = kwargs.get("min_cluster_size", settings.CLUSTERING.min_cluster_size)
+    distance_threshold = kwargs.get("distance_threshold")
+    if distance_threshold is not None:
+        distance_graph = distance_graph.copy()
+        distance_graph.data[distance_graph.data > distance_threshold] = 0.0
+        distance_graph.eliminate_zeros()
+
+    n_components, components = connected_components(distance_graph, directed=False)
+    labels = np.full(distance_graph.shape[0], -1)
+    n_clusters = 0
+    for component in range(n_components):
+        members = np.flatnonzero(components == component)
+        if len(members) < max(min_cluster_size, 2):
+            continue
+        if method == 'connected_components':
+            labels[members] = n_clusters
+            n_clusters += 1
+            continue
+        # hdbscan requires a connected graph, so each component is clustered separately; each route must have at
+        # least min_samples neighbours, which can be fewer than n_neighbors when the pruned or long edges are removed
+        component_graph = distance_graph[members][:, members]
+        min_samples = min(min_cluster_size, get_n_neighbors(kwargs), np.diff(component_graph.indptr).min())
+        component_labels = hdbscan.HDBSCAN(min_cluster_size=min_cluster_size, min_samples=int(min_samples),
+                                           metric='precomputed', allow_single_cluster=True).fit(
+            component_graph).labels_
+        clustered = component_labels >= 0
+        labels[members[clustered]] = component_labels[clustered] + n_clusters
+        n_clusters += component_labels.max() + 1 if clustered.any() else 0
+    return labels
+
+
 class ClusterFactory:
     """ Definition of the Cluster Factory to give access to the clustering algorithms.
 
@@ -118,7 +363,12 @@ class ClusterFactory:
                     'info': 'HDBscan algorithm. Not working with less than 15 routes'},
         'agglomerative_cluster': {'value': AgglomerativeClusterCalculator(),
                                   'info': 'Agglomerative Clustering algorithm. The number of clusters is optimized '
-                                          'computing the silhouette score'}
+                                          'computing the silhouette score'},
+        'knn_graph': {'value': KnnGraphClusterCalculator(),
+                      'info': 'Clustering of the sparse graph linking each route to its nearest neighbours, found with '
+                              'the fingerprints or the Weisfeiler-Lehman features of the routes; the distance is '
+                              'computed only for the pairs of neighbours, so that large sets of routes can be '
+                              'clustered'}
     }
 
     def select_clustering_algorithms(self, syngraphs: list, ged_method: str, clustering_method: str, ged_params=None,
@@ -129,9 +379,8 @@ class ClusterFactory:
             raise UnavailableClusteringAlgorithm
 
         selector = self.available_clustering_algorithms[clustering_method]['value']
-        dist_matrix = compute_distance_matrix(syngraphs, ged_method, ged_params, parallelization, n_cpu)
-
-        return selector.get_clustering(dist_matrix, save_dist_matrix, **kwargs)
+        return selector.cluster_routes(syngraphs, ged_method, ged_params, save_dist_matrix, parallelization, n_cpu,
+                                       **kwargs)
 
 
 def clusterer(syngraphs: list, ged_method: str, clustering_method: str, ged_params=None, save_dist_matrix=False,
@@ -170,79 +419,423 @@ def clusterer(syngraphs: list, ged_method: str, clustering_method: str, ged_para
                                                               save_dist_matrix, parallelization, n_cpu, **kwargs)
 
 
-def compute_silhouette_score(dist_matrix, clusterer_labels) -> float:
+def get_square_distances(dist_matrix, dtype=None, clamp_pruned=True) -> np.ndarray:
+    """ To get the square NumPy array of a distance matrix, given as DistanceMatrix, pandas DataFrame or NumPy array.
+        The array of a DistanceMatrix is built directly from its condensed float32 form; it is converted only if a
+        different dtype is specified. Unless clamp_pruned is False, the pruned cells are replaced by a finite
+        distance (see clamp_pruned_distances). """
+    if isinstance(dist_matrix, DistanceMatrix):
+        square_matrix = dist_matrix.to_square()
+    elif isinstance(dist_matrix, pd.DataFrame):
+        square_matrix = dist_matrix.to_numpy(dtype=float)
+    else:
+        square_matrix = np.asarray(dist_matrix)
+    if clamp_pruned:
+        square_matrix = clamp_pruned_distances(square_matrix)
+    return square_matrix if dtype is None else square_matrix.astype(dtype, copy=False)
+
+
+def get_condensed_distances(dist_matrix) -> np.ndarray:
+    """ To get the condensed NumPy array of a distance matrix, given as DistanceMatrix, pandas DataFrame or NumPy
+        array. The condensed array of a DistanceMatrix is used directly; the pruned cells are replaced by a finite
+        distance (see clamp_pruned_distances). """
+    if isinstance(dist_matrix, DistanceMatrix):
+        return clamp_pruned_distances(dist_matrix.condensed)
+    return squareform(get_square_distances(dist_matrix), checks=False)
+
+
+def clamp_pruned_distances(distances: np.ndarray) -> np.ndarray:
+    """ To replace the PRUNED_DISTANCE values, found for the pairs of routes farther than 'max_distance', with a
+        distance larger than all the computed ones, so that the distances can be used by the linkage, by hdbscan and by
+        the silhouette score, which only accept finite values. The input is copied only if it contains pruned values.
+
+        :param:
+            distances: a NumPy array
+                It contains the distances, either in square or in condensed form
+
+        :return:
+            distances: a NumPy array
+                It contains the distances, with the pruned values replaced by the largest finite distance + 1
+    """
+    pruned = distances == PRUNED_DISTANCE
+    if not pruned.any():
+        return distances
+    finite = distances[~pruned]
+    clamped = distances.copy()
+    clamped[pruned] = (finite.max() if finite.size else 0.0) + 1.0
+    return clamped
+
+
+def compute_silhouette_score(dist_matrix, clusterer_labels, sample_size=None, random_state=0) -> float:
     """ To compute the silhouette score for the clustering of a distance matrix.
 
         :param:
-            dist_matrix: a np.array containg a distance matrix
+            dist_matrix: a DistanceMatrix, pandas DataFrame or np.array containg a distance matrix
             clusterer_labels: the labels assigned by a clutering algorithm
+            sample_size: an integer indicating the number of routes of the stratified sample on which the score is
+                         computed (optional; default: None -> the 'silhouette_sample_size' in the CLUSTERING settings
+                         is used; if it is None too, all the routes are used)
+            random_state: an integer used as seed for the sampling (optional; default: 0)
 
         :return:
             score: a float
     """
-    return silhouette_score(dist_matrix, clusterer_labels, metric='precomputed')
+    return compute_silhouette_scores(dist_matrix, [clusterer_labels], sample_size, random_state)[0]
 
 
-def optimize_agglomerative_cluster(dist_matrix, linkage: str) -> tuple:
-    """ To optimize the number of clusters for the AgglomerativeClustering method.
+def compute_silhouette_scores(dist_matrix, labelings: list, sample_size=None, random_state=0,
+                              chunk_size=None) -> list:
+    """ To compute the silhouette scores of several clusterings of the same routes. The sums of the distances of each
+        route from the routes of each cluster are computed for all the clusterings at once, as the product between
+        the distance matrix and the sparse matrix of the cluster memberships. The distance matrix is read in blocks
+        of rows from its condensed form, so that the square matrix is never built. If the routes are more than
+        'sample_size', the scores are computed on a sample stratified by the clusters of the finest clustering.
 
         :param:
-            dist_matrix: the distance matrix of the analzyed routes as numpy array
-            linkage: a string indicating which type of linkage to use in the clustering
+            dist_matrix: a DistanceMatrix, pandas DataFrame or np.array containg a distance matrix
+            labelings: a list of arrays with the labels assigned by a clustering algorithm; each one must contain
+                       between 2 and n routes - 1 distinct labels
+            sample_size: an integer (optional; default: None -> the 'silhouette_sample_size' in the CLUSTERING
+                         settings is used; if it is None too, all the routes are used)
+            random_state: an integer used as seed for the sampling (optional; default: 0)
+            chunk_size: an integer indicating the number of rows of the distance matrix read at once (optional;
+                        default: None -> it is chosen so that each block contains about 4 million distances)
 
         :return:
-            best_clustering: the output of the clustering algorithm with the best silhouette score
-            max_score: a float indicating the silhouette score relative to the best_clustering
-            best_n_cluster: an integer indicating the number of clusters used to get the best silhouette score
+            scores: a list of floats, one for each clustering
     """
+    condensed_matrix = get_condensed_distances(dist_matrix)
+    n_routes = len(labelings[0])
+    silhouette_info = get_silhouette_info(n_routes, sample_size)
+    sample = np.arange(n_routes)
+    if silhouette_info['mode'] == 'sampled':
+        finest = max(labelings, key=lambda labels: len(np.unique(labels)))
+        sample = get_stratified_sample(finest, silhouette_info['sample_size'], random_state)
+    n_sample = len(sample)
+
+    codes = [np.unique(np.asarray(labels)[sample], return_inverse=True)[1] for labels in labelings]
+    offsets = np.cumsum([0] + [c.max() + 1 for c in codes])
+    membership = sparse.csr_matrix((np.ones(n_sample * len(codes)),
+                                    (np.tile(np.arange(n_sample), len(codes)),
+                                     np.concatenate([c + offset for c, offset in zip(codes, offsets)]))),
+                                   shape=(n_sample, offsets[-1]))
+    if chunk_size is None:
+        chunk_size = max(1, 2 ** 22 // n_sample)
+    distance_sums = np.zeros((n_sample, offsets[-1]))
+    for start in range(0, n_sample, chunk_size):
+        block = get_distance_block(condensed_matrix, n_routes, sample[start:start + chunk_size], sample)
+        distance_sums[start:start + chunk_size] = membership.T.dot(block.T).T
+    counts = np.asarray(membership.sum(axis=0)).ravel()
+    return [silhouette_from_sums(distance_sums[:, start:stop], counts[start:stop], c)
+            for c, start, stop in zip(codes, offsets[:-1], offsets[1:])]
+
+
+def get_silhouette_info(n_routes: int, sample_size=None, metric='ged') -> dict:
+    """ To get the mode ('full' or 'sampled'), the number of routes and the distance ('ged' for the distances computed
+        with the GED method, 'embedding_cosine' for the cosine distances of the embedding of the routes) used to
+        compute the silhouette scores of a clustering of n_routes routes (see compute_silhouette_scores) """
+    if sample_size is None:
+        sample_size = settings.CLUSTERING.get('silhouette_sample_size',
+                                              DEFAULT_CLUSTERING['silhouette_sample_size'])
+    if sample_size is None or sample_size >= n_routes:
+        return {'mode': 'full', 'sample_size': n_routes, 'metric': metric}
+    return {'mode': 'sampled', 'sample_size': sample_size, 'metric': metric}
+
+
+def get_stratified_sample(labels, sample_size: int, random_state=0) -> np.ndarray:
+    """ To draw a sample of sample_size routes in which each cluster is represented in proportion to its size.
 
-    best_clustering = None
-    max_score = -1.0
-    best_n_cluster = None
-
-    for n_cluster in range(2, min(5, len(dist_matrix))):
-        clustering = AgglomerativeClustering(n_clusters=n_cluster, affinity='precomputed',
-                                             linkage=linkage).fit(dist_matrix.to_numpy(dtype=float))
-        score = compute_silhouette_score(dist_matrix, clustering.labels_)
-
-        if score > max_score:
-            max_score = score
-            best_clustering = clustering
-            best_n_cluster = n_cluster
+        :param:
+            labels: an array with the cluster label of each route
+            sample_size: an integer indicating the number of routes to be drawn
+            random_state: an integer used as seed for the sampling (optional; default: 0)
 
-    return best_clustering, max_score, best_n_cluster
+        :return:
+            sample: a sorted NumPy array with the indices of the sampled routes
+    """
+    rng = np.random.default_rng(random_state)
+    clusters, codes, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+    quotas = sizes * sample_size / len(codes)
+    allocation = np.floor(quotas).astype(int)
+    # the remaining routes are assigned to the clusters with the largest fractional quotas
+    remaining = sample_size - allocation.sum()
+    allocation[np.argsort(allocation - quotas, kind='stable')[:remaining]] += 1
+    sample = [rng.choice(np.flatnonzero(codes == k), size=allocation[k], replace=False)
+              for k in range(len(clusters))]
+    return np.sort(np.concatenate(sample))
+
+
+def get_distance_block(condensed_matrix: np.ndarray, n_routes: int, rows: np.ndarray, columns: np.ndarray):
+    """ To read the block of the square distance matrix with the selected rows and columns from its condensed form;
+        the distance of each route from itself is 0 """
+    i = np.asarray(rows, dtype=np.int64)[:, None]
+    j = np.asarray(columns, dtype=np.int64)[None, :]
+    low, high = np.minimum(i, j), np.maximum(i, j)
+    positions = n_routes * low - low * (low + 1) // 2 + high - low - 1
+    diagonal = low == high
+    block = condensed_matrix[np.where(diagonal, 0, positions)]
+    block[diagonal] = 0.0
+    return block
+
+
+def silhouette_from_sums(distance_sums: np.ndarray, counts: np.ndarray, labels: np.ndarray) -> float:
+    """ To compute the silhouette score of a clustering from the sums of the distances of each route from the routes
+        of each cluster (n routes x n clusters), the size of each cluster and the cluster index of each route. As in
+        scikit-learn, the silhouette of the routes in single-route clusters is 0. """
+    rows = np.arange(len(labels))
+    own_counts = counts[labels]
+    intra = distance_sums[rows, labels] / np.maximum(own_counts - 1, 1)
+    mean_distances = distance_sums / counts
+    mean_distances[rows, labels] = np.inf
+    inter = mean_distances.min(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        silhouettes = np.nan_to_num((inter - intra) / np.maximum(intra, inter))
+    silhouettes[own_counts == 1] = 0.0
+    return float(silhouettes.mean())
+
+
+def optimize_agglomerative_cluster(dist_matrix, linkage: str, max_n_clusters=None, sample_size=None) -> tuple:
+    """ To optimize the number of clusters for the agglomerative clustering. The hierarchical linkage is computed
+        only once from the condensed distance matrix and it is then cut at each number of clusters.
 
+        :param:
+            dist_matrix: the distance matrix of the analzyed routes as DistanceMatrix, pandas DataFrame or numpy array
+            linkage: a string indicating which type of linkage to use in the clustering
+            max_n_clusters: an integer indicating the maximum number of clusters to be tried (optional;
+                            default: None -> all the numbers of clusters between 2 and n routes - 1 are tried)
+            sample_size: an integer indicating the size of the sample used to compute the silhouette scores
+                         (optional; default: None -> see compute_silhouette_scores)
 
-def get_clustered_routes_metrics(syngraphs: list, clustering_output) -> pd.DataFrame:
+        :return:
+            best_clustering: a LinkageClustering with the clustering with the best silhouette score
+            max_score: a float indicating the silhouette score relative to the best_clustering
+            best_n_cluster: an integer indicating the number of clusters used to get the best silhouette score
+    """
+    condensed_matrix = get_condensed_distances(dist_matrix)
+    n_routes = int(round((1 + np.sqrt(1 + 8 * len(condensed_matrix))) / 2))
+    if n_routes < 3:
+        return None, -1.0, None
+    linkage_matrix = hierarchical_linkage(condensed_matrix, method=linkage)
+
+    top_n_cluster = n_routes - 1 if max_n_clusters is None else min(max_n_clusters, n_routes - 1)
+    labelings = {}
+    for n_cluster in range(2, top_n_cluster + 1):
+        labels = fcluster(linkage_matrix, n_cluster, criterion='maxclust') - 1
+        # with tied distances, some numbers of clusters cannot be obtained
+        n_found = len(np.unique(labels))
+        if 2 <= n_found <= n_routes - 1:
+            labelings.setdefault(n_found, labels)
+    if not labelings:
+        return None, -1.0, None
+
+    scores = compute_silhouette_scores(dist_matrix, list(labelings.values()), sample_size)
+    best = int(np.argmax(scores))
+    best_n_cluster = list(labelings)[best]
+    best_clustering = LinkageClustering(labels_=labelings[best_n_cluster], n_clusters_=best_n_cluster,
+                                        linkage_matrix=linkage_matrix)
+    return best_clustering, scores[best], best_n_cluster
+
+
+def get_clustered_routes_metrics(syngraphs: list, clustering_output, routes_descriptors=None) -> pd.DataFrame:
     """ To compute the metrics of the routes in the input list grouped by cluster.
 
         :param:
             syngraphs: a list containing the SynGraph/MonopartiteSynGraph for which the metrics should be computed
             clustering_output: the output of a clustering algorithm
+            routes_descriptors: a pandas DataFrame with the descriptors of the same routes, as returned by the
+                                'routes_descriptors' functionality of the facade (optional; default: None). Its
+                                'nr_steps' and 'nr_branches' columns, if present, are used instead of computing them
+                                again
 
         :return:
              df1: a pandas DataFrame with columns ['routes_id', 'cluster', 'n_steps', 'n_branch']
     """
-    unique_labels = set(clustering_output.labels_)
-
-    col = ['routes_id', 'cluster', 'n_steps', 'n_branch']
-    df1 = pd.DataFrame(columns=col)
-
-    for k in unique_labels:
-        cluster_routes = np.where(clustering_output.labels_ == k)[0].tolist()
-        graphs = [syngraphs[i] for i in cluster_routes]
-        d = pd.DataFrame(columns=col)
-        for n, graph in enumerate(graphs):
-            n_step = descriptor_calculator(graph, 'nr_steps')
-            route_id = graph.source
-            d.loc[n, 'routes_id'] = route_id
-            d.loc[n, 'n_steps'] = n_step
-            b = descriptor_calculator(graph, 'nr_branches')
-            d.loc[n, 'n_branch'] = b
-            d.loc[n, 'cluster'] = k
-
-        df1 = pd.concat([df1, d], ignore_index=True)
-    return df1
+    labels = np.asarray(clustering_output.labels_)
+    routes_id = [graph.source for graph in syngraphs]
+    metrics = {'n_steps': 'nr_steps', 'n_branch': 'nr_branches'}
+    reusable = routes_descriptors is not None and len(routes_descriptors) == len(syngraphs) and \
+        'route_id' in routes_descriptors and list(routes_descriptors['route_id']) == routes_id
+    values = {}
+    for column, descriptor in metrics.items():
+        if reusable and descriptor in routes_descriptors:
+            values[column] = routes_descriptors[descriptor].to_numpy()
+    missing = [column for column in metrics if column not in values]
+    if missing:
+        for column in missing:
+            values[column] = np.zeros(len(syngraphs), dtype=int)
+        for n, graph in enumerate(syngraphs):
+            # bipartite routes are converted only once for all the descriptors
+            mp_graph = converter(graph, 'monopartite_reactions') if isinstance(graph, BipartiteSynGraph) else graph
+            for column in missing:
+                values[column][n] = descriptor_calculator(mp_graph, metrics[column])
+
+    # the routes are grouped by cluster, keeping their order within each cluster
+    order = np.argsort(labels, kind='stable')
+    return pd.DataFrame({'routes_id': [routes_id[i] for i in order], 'cluster': labels[order],
+                         'n_steps': values['n_steps'][order], 'n_branch': values['n_branch'][order]})
+
+
+class ClusterModel:
+    """ Class holding a few exemplar routes for each cluster of a clustering, so that new routes can be assigned to
+        the clusters by computing their distance only from the exemplars. The first exemplar of each cluster is its
+        medoid. A route whose distance from all the exemplars is above the novelty threshold opens a new cluster, of
+        which it becomes the medoid. The model can be saved to a file and loaded back.
+
+        Attributes:
+            ged_method: a string indicating the algorithm used to compute the graph edit distance
+
+            ged_params: a dictionary with the complete set of parameters used in the GED calculations
+
+            exemplars: a dictionary mapping the label of each cluster to the list of its exemplar SynGraph instances
+
+            sizes: a dictionary mapping the label of each cluster to the number of routes assigned to it
+
+            novelty_threshold: a float indicating the maximum distance of a route from the closest exemplar for the
+                               route to be assigned to its cluster
+    """
+
+    def __init__(self, ged_method: str, ged_params=None, novelty_threshold=None):
+        """
+        Parameters:
+            ged_method: a string
+                It indicates which method to be used for computed the graph edit distance
+
+            ged_params: a dictionary (optional; default: None -> default parameters are used)
+                It contains the parameters for fingerprints and similarity calculations
+
+            novelty_threshold: a float (optional; default: None -> the 'novelty_threshold' in the CLUSTERING settings
+                               is used; if it is None too, it is set by from_clustering)
+        """
+        self.ged_method = ged_method
+        self.ged_params = resolve_ged_params(ged_params)
+        if novelty_threshold is None:
+            novelty_threshold = settings.CLUSTERING.get('novelty_threshold', DEFAULT_CLUSTERING['novelty_threshold'])
+        self.novelty_threshold = novelty_threshold
+        self.exemplars = {}
+        self.sizes = {}
+
+    def __len__(self):
+        return len(self.exemplars)
+
+    @classmethod
+    def from_clustering(cls, syngraphs: list, clustering, ged_method: str, ged_params=None, dist_matrix=None,
+                        n_exemplars=None, novelty_threshold=None, parallelization=False, n_cpu=mp.cpu_count()):
+        """ To build a ClusterModel from the output of a clustering. The exemplars of each cluster are its routes
+            with the lowest sum of distances from the other routes of the cluster; the routes labeled as noise are
+            not represented. If no novelty threshold is given, the largest distance of a route of the clustering from
+            the closest exemplar of its cluster is used.
+
+            :param:
+                syngraphs: the list of SynGraph objects that were clustered, in the same order as the labels
+
+                clustering: the output of a clustering algorithm, with the 'labels_' attribute, as returned by the
+                            clustering facade for the valid routes
+
+                ged_method: a string indicating the algorithm used to compute the graph edit distance
+
+                ged_params: a dictionary (optional; default: None -> default parameters are used)
+
+                dist_matrix: the distance matrix of the routes, as returned by the clustering facade with
+                             save_dist_matrix=True (optional; default: None -> the distances within each cluster are
+                             computed)
+
+                n_exemplars: an integer indicating the number of exemplars of each cluster (optional; default:
+                             None -> the 'n_exemplars' in the CLUSTERING settings is used)
+
+                novelty_threshold: a float (optional; default: None)
+
+                parallelization: a boolean indicating whether parallelization should be used (optional; default:
+                                 False)
+
+                n_cpu: an integer indicating the number of CPUs to be used (optional; default: 'mp.cpu_count()')
+
+            :return:
+                model: a ClusterModel instance
+        """
+        model = cls(ged_method, ged_params, novelty_threshold)
+        if n_exemplars is None:
+            n_exemplars = settings.CLUSTERING.get('n_exemplars', DEFAULT_CLUSTERING['n_exemplars'])
+        labels = np.asarray(clustering.labels_)
+        # the sparse graph returned by the knn_graph clustering does not contain all the distances of a cluster
+        if dist_matrix is not None and not sparse.issparse(dist_matrix):
+            condensed_matrix = get_condensed_distances(dist_matrix)
+        else:
+            condensed_matrix = None
+        radii = []
+        for label in sorted(set(labels[labels >= 0].tolist())):
+            members = np.flatnonzero(labels == label)
+            if condensed_matrix is not None:
+                distances = get_distance_block(condensed_matrix, len(labels), members, members)
+            elif len(members) > 1:
+                distances = compute_distance_matrix([syngraphs[i] for i in members], ged_method, model.ged_params,
+                                                    parallelization, n_cpu).to_square()
+            else:
+                distances = np.zeros((1, 1))
+            exemplars = np.argsort(distances.sum(axis=1), kind='stable')[:n_exemplars]
+            model.exemplars[label] = [syngraphs[members[i]] for i in exemplars]
+            model.sizes[label] = len(members)
+            radii.append(float(distances[:, exemplars].min(axis=1).max()))
+        if model.novelty_threshold is None:
+            model.novelty_threshold = max(radii, default=0.0)
+        return model
+
+    def assign(self, syngraphs: list, parallelization=False, n_cpu=mp.cpu_count()) -> np.ndarray:
+        """ To assign new routes to the clusters. The distance of each route is computed only from the exemplars of
+            the clusters; the routes are assigned in order, so that a new cluster opened by a route can receive the
+            following ones.
+
+            :param:
+                syngraphs: a list of SynGraph objects
+
+                parallelization: a boolean (optional; default: False)
+                    It indicates whether parallelization should be used for the distances from the exemplars
+
+                n_cpu: an integer (optional; default: 'mp.cpu_count()')
+                    If parallelization is activated, it indicates the number of CPUs to be used
+
+            :return:
+                labels: a NumPy array with the cluster label assigned to each route
+        """
+        exemplar_labels = [label for label, exemplars in self.exemplars.items() for _ in exemplars]
+        exemplar_routes = [route for exemplars in self.exemplars.values() for route in exemplars]
+        n_exemplars = len(exemplar_routes)
+        cells = [(e, n_exemplars + r) for r in range(len(syngraphs)) for e in range(n_exemplars)]
+        distances = np.full((len(syngraphs), n_exemplars), np.inf)
+        for e, r, sim, _, _ in compute_cells(exemplar_routes + list(syngraphs), cells, self.ged_method,
+                                             self.ged_params, parallelization, n_cpu):
+            distances[r - n_exemplars, e] = sim
+
+        labels = np.zeros(len(syngraphs), dtype=int)
+        new_medoids = {}
+        for r, syngraph in enumerate(syngraphs):
+            closest = {}
+            for label, distance in zip(exemplar_labels, distances[r]):
+                closest[label] = min(distance, closest.get(label, np.inf))
+            # the medoids of the clusters opened by the previous routes are considered as well
+            for label, medoid in new_medoids.items():
+                closest[label] = compute_pair_distance(medoid, syngraph, self.ged_method, self.ged_params)[0]
+            label = min(closest, key=closest.get) if closest else None
+            if label is None or closest[label] > self.novelty_threshold:
+                label = max(self.exemplars, default=-1) + 1
+                self.exemplars[label] = [syngraph]
+                self.sizes[label] = 0
+                new_medoids[label] = syngraph
+            self.sizes[label] += 1
+            labels[r] = label
+        return labels
+
+    def save(self, file_path):
+        """ To save the model, together with its exemplars, to a pickle file """
+        lio.write_pickle(self, file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        """ To load a model saved with the 'save' method """
+        model = lio.read_pickle(file_path)
+        if not isinstance(model, cls):
+            logger.error(f'The file {file_path} does not contain a ClusterModel')
+            raise TypeError
+        return model
 
 
 def get_available_clustering():
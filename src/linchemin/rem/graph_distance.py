@@ -1,18 +1,33 @@
 import abc
+import hashlib
+import json
 import multiprocessing as mp
+import sqlite3
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from functools import partial
+from pathlib import Path
+from typing import Union
 
 import networkx as nx
 import numpy as np
 import pandas as pd
+from scipy import sparse
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial.distance import squareform
 
+import linchemin.IO.io as lio
+import linchemin.utilities as utilities
 from linchemin import settings
 from linchemin.cgu.syngraph import BipartiteSynGraph, MonopartiteReacSynGraph
 from linchemin.cgu.translate import translator
 from linchemin.cheminfo.chemical_similarity import (
-    compute_mol_fingerprint, compute_reaction_fingerprint, compute_similarity)
+    FingerprintStore, compute_bulk_similarity, compute_mol_fingerprint,
+    compute_reaction_fingerprint, compute_similarity)
 from linchemin.cheminfo.models import ChemicalEquation, Molecule
-from linchemin.configuration.defaults import DEFAULT_GED
+from linchemin.configuration.defaults import DEFAULT_GED, DEFAULT_GED_CACHE
 from linchemin.utilities import console_logger
 
 """
@@ -43,214 +58,817 @@ class TooFewRoutes(GraphDistanceError):
     pass
 
 
+class MissingShardResult(GraphDistanceError):
+    """ Raised if the result of a shard of the distance matrix is missing when merging the shards """
+    pass
+
+
+ged_data_models = {BipartiteSynGraph: 'bipartite',
+                   MonopartiteReacSynGraph: 'monopartite_reactions'}
+
+# Value returned in threshold mode when the distance between two routes is known to be above 'max_distance'
+PRUNED_DISTANCE = np.inf
+# Tolerance used when comparing a lower bound with 'max_distance', to avoid pruning pairs due to rounding errors
+_BOUND_TOLERANCE = 1e-9
+
+
+@dataclass
+class PreparedRoute:
+    """ Class holding the data of a route needed by the GED calculators. It is built once per route, so that the
+        translation into networkx, the identification of the root and the calculation of the nodes fingerprints
+        are not repeated for each pair of routes.
+
+        Attributes:
+            syngraph: the original SynGraph instance
+
+            nx_graph: the networkx DiGraph corresponding to the SynGraph
+
+            root: the node of the networkx graph corresponding to the root of the route
+
+            reaction_fingerprints: a dictionary mapping the uid of the ChemicalEquation nodes to their fingerprints
+
+            molecular_fingerprints: a dictionary mapping the uid of the Molecule nodes to their fingerprints
+    """
+    syngraph: Union[BipartiteSynGraph, MonopartiteReacSynGraph]
+    nx_graph: nx.DiGraph
+    root: Union[str, None]
+    reaction_fingerprints: dict = field(default_factory=dict)
+    molecular_fingerprints: dict = field(default_factory=dict)
+
+
+@dataclass
+class SimilarityMatrix:
+    """ Class holding the similarity values between the nodes of two routes as a NumPy array.
+
+        Attributes:
+            values: a NumPy array (n nodes in graph2) x (n nodes in graph1) containing the similarity values
+
+            row_index: a dictionary mapping the hashes of the nodes of graph2 to the rows of the array
+
+            column_index: a dictionary mapping the hashes of the nodes of graph1 to the columns of the array
+    """
+    values: np.ndarray
+    row_index: dict
+    column_index: dict
+
+    def get(self, h2, h1) -> float:
+        """ To get the similarity between the node h2 of graph2 and the node h1 of graph1 """
+        return self.values[self.row_index[h2], self.column_index[h1]]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """ To get the similarity matrix as a pandas DataFrame """
+        return pd.DataFrame(self.values, columns=list(self.column_index), index=list(self.row_index))
+
+
+class DistanceMatrix:
+    """ Class holding the distance matrix of a set of routes in condensed form: the upper triangle, without the
+        diagonal, is stored as a float32 NumPy vector with the layout used by scipy 'squareform' and 'linkage'.
+        A read-only pandas DataFrame view is built only when needed; the DataFrame attributes and methods that are not
+        defined here are delegated to it, so that the object can be used in place of the DataFrame. The distance of a
+        pair of routes assigned through the loc, iloc, at and iat indexers is written in the condensed matrix.
+
+        Attributes:
+            condensed: a float32 NumPy array with the n * (n - 1) / 2 distances between different routes
+
+            diagonal: a float32 NumPy array with the n distances of each route from itself
+
+            attrs: a dictionary with information about the calculation (see compute_distance_matrix)
+    """
+
+    def __init__(self, n_routes: int, condensed=None, diagonal=None, attrs=None):
+        """
+        Parameters:
+            n_routes: an integer indicating the number of routes
+
+            condensed: a NumPy array with the condensed distances (optional; default: None -> zeros)
+
+            diagonal: a NumPy array with the distances of each route from itself (optional; default: None -> zeros)
+
+            attrs: a dictionary with information about the calculation (optional; default: None)
+        """
+        n_cells = n_routes * (n_routes - 1) // 2
+        self.condensed = np.zeros(n_cells, dtype=np.float32) if condensed is None else \
+            np.asarray(condensed, dtype=np.float32)
+        self.diagonal = np.zeros(n_routes, dtype=np.float32) if diagonal is None else \
+            np.asarray(diagonal, dtype=np.float32)
+        if len(self.condensed) != n_cells or len(self.diagonal) != n_routes:
+            logger.error(f'The condensed matrix and the diagonal do not correspond to {n_routes} routes')
+            raise ValueError
+        self.attrs = {} if attrs is None else attrs
+        self._dataframe = None
+
+    def __len__(self):
+        return len(self.diagonal)
+
+    def __iter__(self):
+        return iter(self.to_dataframe())
+
+    def __eq__(self, other):
+        # elementwise, as for the DataFrame
+        return self.to_dataframe() == (other.to_dataframe() if isinstance(other, DistanceMatrix) else other)
+
+    def __ne__(self, other):
+        return self.to_dataframe() != (other.to_dataframe() if isinstance(other, DistanceMatrix) else other)
+
+    def __getattr__(self, name):
+        # only called for the attributes not found in the instance: they are looked up in the DataFrame view
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.to_dataframe(), name)
+
+    def __getitem__(self, key):
+        return self.to_dataframe()[key]
+
+    def __array__(self, dtype=None):
+        square = self.to_square()
+        return square if dtype is None else square.astype(dtype)
+
+    @classmethod
+    def from_square(cls, square, attrs=None):
+        """ To build a DistanceMatrix from a symmetric square matrix (NumPy array or pandas DataFrame) """
+        square = np.asarray(square, dtype=np.float32)
+        rows, columns = np.triu_indices(len(square), k=1)
+        return cls(len(square), condensed=square[rows, columns], diagonal=np.diagonal(square), attrs=attrs)
+
+    @property
+    def shape(self) -> tuple:
+        return len(self), len(self)
+
+    @property
+    def loc(self):
+        return DistanceMatrixIndexer(self, 'loc')
+
+    @property
+    def iloc(self):
+        return DistanceMatrixIndexer(self, 'iloc')
+
+    @property
+    def at(self):
+        return DistanceMatrixIndexer(self, 'at')
+
+    @property
+    def iat(self):
+        return DistanceMatrixIndexer(self, 'iat')
+
+    def position(self, i: int, j: int) -> int:
+        """ To get the position in the condensed vector of the cell (i, j), with i != j """
+        if i > j:
+            i, j = j, i
+        return len(self) * i - i * (i + 1) // 2 + j - i - 1
+
+    def get(self, i: int, j: int) -> float:
+        """ To get the distance between the routes i and j """
+        return self.diagonal[i] if i == j else self.condensed[self.position(i, j)]
+
+    def set(self, i: int, j: int, value: float) -> None:
+        """ To set the distance between the routes i and j """
+        if i == j:
+            self.diagonal[i] = value
+        else:
+            self.condensed[self.position(i, j)] = value
+        self._dataframe = None
+
+    def to_square(self) -> np.ndarray:
+        """ To get the distance matrix as a square float32 NumPy array """
+        square = squareform(self.condensed, checks=False)
+        np.fill_diagonal(square, self.diagonal)
+        return square
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """ To get the distance matrix as a read-only pandas DataFrame (n routes x n routes), with the same attrs """
+        if self._dataframe is None:
+            # the view is rebuilt when the distances change, so it must not be modified in place
+            square = self.to_square()
+            square.flags.writeable = False
+            self._dataframe = pd.DataFrame(square, index=range(len(self)), columns=range(len(self)))
+            self._dataframe.attrs = self.attrs
+        return self._dataframe
+
+    def equals(self, other) -> bool:
+        """ To check whether another DistanceMatrix or pandas DataFrame contains the same distances """
+        if isinstance(other, DistanceMatrix):
+            return np.array_equal(self.condensed, other.condensed) and np.array_equal(self.diagonal, other.diagonal)
+        return self.to_dataframe().equals(other)
+
+
+class DistanceMatrixIndexer:
+    """ Class wrapping the loc, iloc, at and iat indexers of the DataFrame view of a DistanceMatrix. The values are
+        read from the view, while the assignments are written in the DistanceMatrix through its 'set' method; since
+        the labels of the routes are their positions, the label-based and the position-based indexers are equivalent.
+    """
+
+    def __init__(self, matrix: DistanceMatrix, name: str):
+        self._matrix = matrix
+        self._name = name
+
+    def __getitem__(self, key):
+        return getattr(self._matrix.to_dataframe(), self._name)[key]
+
+    def __setitem__(self, key, value):
+        if not (isinstance(key, tuple) and len(key) == 2 and all(isinstance(k, (int, np.integer)) for k in key)):
+            logger.error('Only the distance of a single pair of routes can be assigned, as matrix.loc[i, j] = value')
+            raise TypeError
+        i, j = key
+        if not (0 <= i < len(self._matrix) and 0 <= j < len(self._matrix)):
+            logger.error(f'The pair ({i}, {j}) is out of range for {len(self._matrix)} routes')
+            raise IndexError
+        self._matrix.set(i, j, value)
+
+
+def prepare_route(syngraph, reaction_fp, reaction_fp_params, molecular_fp, molecular_fp_params,
+                  molecular_fp_count_vect, fingerprint_store=None) -> PreparedRoute:
+    """ To build the PreparedRoute instance of a SynGraph.
+
+        :param:
+            syngraph: a BipartiteSynGraph or MonopartiteReacSynGraph instance
+
+            reaction_fp: a string corresponding to the type of fingerprints to be used for reactions
+
+            reaction_fp_params: a dictionary with the optional parameters for computing reaction fingerprints
+
+            molecular_fp: a string corresponding to the type of fingerprints to be used for molecules
+
+            molecular_fp_params: a dictionary with the optional parameters for computing molecular fingerprints
+
+            molecular_fp_count_vect: a boolean indicating whether 'GetCountFingerprint' should be used
+
+            fingerprint_store: a FingerprintStore instance (optional; default: None)
+                If provided, the fingerprints already computed for other routes are reused
+
+        :return:
+            a PreparedRoute instance
+    """
+    if type(syngraph) not in ged_data_models:
+        logger.error(f'Graph has type = {type(syngraph)}. '
+                     f'The GED can be computed only between graphs of types {list(ged_data_models.keys())}.')
+        raise MismatchingGraph
+    nx_graph = translator('syngraph', syngraph, 'networkx', out_data_model=ged_data_models[type(syngraph)])
+    roots = [n for n, d in nx_graph.out_degree() if d == 0]
+    reaction_fingerprints, molecular_fingerprints = compute_nodes_fingerprints(
+        syngraph, reaction_fp, molecular_fp, reaction_fp_params=reaction_fp_params,
+        molecular_fp_params=molecular_fp_params, molecular_fp_count_vect=molecular_fp_count_vect,
+        fingerprint_store=fingerprint_store)
+    return PreparedRoute(syngraph=syngraph, nx_graph=nx_graph, root=roots[0] if roots else None,
+                         reaction_fingerprints=reaction_fingerprints, molecular_fingerprints=molecular_fingerprints)
+
+
 class Ged(metaclass=abc.ABCMeta):
-    """ Abstract class for Ged calculators. """
+    """ Abstract class for Ged calculators.
+
+        Attributes:
+            timed_out: a boolean indicating whether the last calculation hit the time budget, so that the returned
+                       value is an upper bound of the GED
+
+            vectorized: a boolean indicating whether the calculator can compute the distances among a list of routes
+                        at once; the vectorized calculators define a compute_distances(syngraphs, ged_params) method
+    """
+    timed_out = False
+    vectorized = False
 
     @abc.abstractmethod
-    def compute_ged(self, syngraph1, syngraph2, reaction_fp, reaction_fp_params,
-                    reaction_similarity_name, molecular_fp, molecular_fp_params, molecular_fp_count_vect,
-                    molecular_similarity_name):
+    def compute_ged(self, route1: PreparedRoute, route2: PreparedRoute, reaction_similarity_name,
+                    molecular_similarity_name, timeout=None, max_distance=None):
         """ Calculates the Graph Edit Distance for a pair of graphs.
 
             :param:
-                syngraph1, syngraph2: two graph objects
-                    They are graphs for which the GED should be computed
-
-                reaction_fp: a string
-                    It indicates which reaction fingerprints should be used
-
-                reaction_fp_params: a dictionary
-                    It contains the parameters for the reaction fingerprints available in RDKIT
+                route1, route2: two PreparedRoute objects
+                    They contain the graphs for which the GED should be computed and the fingerprints of their nodes
 
                 reaction_similarity_name: a string
                     It indicates which method should be used to compute the similarity between reactions
 
-                molecular_fp: a string
-                    It indicates which molecular fingerprints should be used
-
-                molecular_fp_params: a dictionary
-                    It contains the parameters for the molecular fingerprints available in RDKIT
-
-                molecular_fp_count_vect: a boolean
-                    If set to True, GetCountFingerprint is used for the molecular fingerprints
-
                 molecular_similarity_name: a string
                     It indicates which method should be used to compute the similarity between molecules
 
+                timeout: a float (optional; default: None)
+                    If provided, the maximum time in seconds for the calculation; when it is reached, the best upper
+                    bound found so far is returned. The NetworkX methods check it each time a better edit path is
+                    found (see optimize_ged_with_budget)
+
+                max_distance: a float (optional; default: None)
+                    If provided, the search is stopped as soon as the GED is known to be above this value and
+                    PRUNED_DISTANCE is returned
+
 
             :return:
                 the value of the GED
         """
         pass
 
+    def lower_bound(self, route1: PreparedRoute, route2: PreparedRoute, reaction_similarity_name,
+                    molecular_similarity_name, cutoff=None) -> float:
+        """ To compute a cheap lower bound of the distance computed by the calculator. If the bound based on the uid
+            sets is already above 'cutoff', the similarity-based bound is not computed. """
+        set_bound = compute_set_lower_bound(route1, route2)
+        if cutoff is not None and set_bound > cutoff + _BOUND_TOLERANCE:
+            return set_bound
+        return compute_ged_lower_bound(route1, route2, reaction_similarity_name, molecular_similarity_name)
 
 class GedOptNx(Ged):
     """ Subclass for the calculation of the optimized GED algorithm as implemented in NetworkX. """
 
-    def compute_ged(self, syngraph1, syngraph2, reaction_fp, reaction_fp_params, reaction_similarity_name,
-                    molecular_fingerprint, molecular_fp_params, molecular_fp_count_vect,
-                    molecular_similarity_name):
-        """ Takes two SynGraph instances, fingerprints and similarity methods for both molecules
+    def compute_ged(self, route1, route2, reaction_similarity_name, molecular_similarity_name, timeout=None,
+                    max_distance=None):
+        """ Takes two PreparedRoute instances and the similarity methods for both molecules
             and reactions and returns the GED between the two graphs as computed by the optmized GED algorithm in
-            NetworkX. """
-        if type(syngraph1) == type(syngraph2) and type(syngraph1) == MonopartiteReacSynGraph:
-            nx_graphs = [translator('syngraph', s, 'networkx',
-                                    out_data_model='monopartite_reactions') for s in [syngraph1, syngraph2]]
-            # The cost function uses the selected reaction fingerprints.
-            node_subst_cost_partial = partial(node_subst_cost, reaction_fingerprints=reaction_fp,
-                                              reaction_similarity_name=reaction_similarity_name,
-                                              reaction_fp_params=reaction_fp_params,
-                                              molecular_fingerprint=molecular_fingerprint,
-                                              molecular_fp_params=molecular_fp_params,
-                                              molecular_fp_count_vect=molecular_fp_count_vect,
-                                              molecular_similarity_name=molecular_similarity_name)
-            # The NetworkX GED is called
-            opt_ged = nx.optimize_graph_edit_distance(nx_graphs[0], nx_graphs[1],
-                                                      node_subst_cost=node_subst_cost_partial)
-
-        elif type(syngraph1) == type(syngraph2) and type(syngraph1) == BipartiteSynGraph:
-            nx_graphs = [translator('syngraph', s, 'networkx',
-                                    out_data_model='bipartite') for s in [syngraph1, syngraph2]]
-            # The cost function uses the selected reaction and molecular fingerprints and the selected similarity type.
-            node_subst_cost_partial = partial(node_subst_cost, reaction_fingerprints=reaction_fp,
-                                              reaction_fp_params=reaction_fp_params,
-                                              reaction_similarity_name=reaction_similarity_name,
-                                              molecular_fingerprint=molecular_fingerprint,
-                                              molecular_fp_params=molecular_fp_params,
-                                              molecular_fp_count_vect=molecular_fp_count_vect,
-                                              molecular_similarity_name=molecular_similarity_name)
-
-            opt_ged = nx.optimize_graph_edit_distance(nx_graphs[0], nx_graphs[1],
-                                                      node_subst_cost=node_subst_cost_partial)
-
-        else:
-            logger.error(f'Graph1 has type = {type(syngraph1)} \nGraph2 has type = {type(syngraph2)}. '
-                         f'The GED cannot be computed between graph of different types.')
-            raise MismatchingGraph
-
-        for g in opt_ged:
-            min_g = g
-        return min_g
+            NetworkX. If the time budget is reached, the lowest value found so far is returned. """
+        check_graphs_type(route1, route2)
+        # The cost function uses the precomputed fingerprints and the selected similarity type.
+        node_subst_cost_partial = partial(node_subst_cost_prepared, route1=route1, route2=route2,
+                                          reaction_similarity_name=reaction_similarity_name,
+                                          molecular_similarity_name=molecular_similarity_name)
+        # The NetworkX GED is called; each generated edit path has a lower cost than the previous one
+        costs = nx.optimize_graph_edit_distance(route1.nx_graph, route2.nx_graph,
+                                                node_subst_cost=node_subst_cost_partial, upper_bound=max_distance)
+        return optimize_ged_with_budget(self, costs, timeout)
 
 
 class GedNxPrecomputedMatrix(Ged):
     """ Subclass for the calculation of the GED algorithm as implemented in NetworkX; the chemical similarity between
         nodes is precomputed. """
 
-    def compute_ged(self, syngraph1, syngraph2, reaction_fingerprints, reaction_fp_params, reaction_similarity_name,
-                    molecular_fingerprint, molecular_fp_params, molecular_fp_count_vect,
-                    molecular_similarity_name):
-        """ Takes two SynGraph instances, fingerprints and similarity methods for both molecules
+    def compute_ged(self, route1, route2, reaction_similarity_name, molecular_similarity_name, timeout=None,
+                    max_distance=None):
+        """ Takes two PreparedRoute instances and the similarity methods for both molecules
             and reactions and returns the GED between the two graphs as computed by the GED algorithm in NetworkX.
-            The similarity matrix between nodes in the involved graphs is precomputed.
+            The similarity matrix between nodes in the involved graphs is precomputed. If the time budget is reached,
+            the lowest value found so far is returned.
         """
-        if type(syngraph1) == type(syngraph2) and type(syngraph1) == MonopartiteReacSynGraph:
-            d_reactions1, d_mol = compute_nodes_fingerprints(syngraph1, reaction_fingerprints,
-                                                             molecular_fingerprint,
-                                                             reaction_fp_params=reaction_fp_params,
-                                                             molecular_fp_params=molecular_fp_params,
-                                                             molecular_fp_count_vect=molecular_fp_count_vect)
-            d_reactions2, d_mol = compute_nodes_fingerprints(syngraph2, reaction_fingerprints,
-                                                             molecular_fingerprint,
-                                                             reaction_fp_params=reaction_fp_params,
-                                                             molecular_fp_params=molecular_fp_params,
-                                                             molecular_fp_count_vect=molecular_fp_count_vect)
-            reaction_similarity_matrix = build_similarity_matrix(d_reactions1, d_reactions2, reaction_similarity_name)
-            nx_graphs = [translator('syngraph', s, 'networkx',
-                                    out_data_model='monopartite_reactions') for s in [syngraph1, syngraph2]]
-            # The cost function uses the selected reaction fingerprints.
-            node_subst_cost_partial = partial(node_subst_cost_matrix,
-                                              reaction_similarity_matrix=reaction_similarity_matrix,
-                                              molecule_similarity_matrix=None)
-            root_g1 = [n for n, d in nx_graphs[0].out_degree() if d == 0]
-            root_g2 = [n for n, d in nx_graphs[1].out_degree() if d == 0]
-            # The NetworkX GED is called
-            ged = nx.graph_edit_distance(nx_graphs[0], nx_graphs[1], node_subst_cost=node_subst_cost_partial,
-                                         roots=(root_g1[0], root_g2[0]))
-
-        elif type(syngraph1) == type(syngraph2) and type(syngraph1) == BipartiteSynGraph:
-            d_reactions1, d_mol1 = compute_nodes_fingerprints(syngraph1, reaction_fingerprints,
-                                                              molecular_fingerprint,
-                                                              reaction_fp_params=reaction_fp_params,
-                                                              molecular_fp_params=molecular_fp_params,
-                                                              molecular_fp_count_vect=molecular_fp_count_vect)
-            d_reactions2, d_mol2 = compute_nodes_fingerprints(syngraph2, reaction_fingerprints,
-                                                              molecular_fingerprint,
-                                                              reaction_fp_params=reaction_fp_params,
-                                                              molecular_fp_params=molecular_fp_params,
-                                                              molecular_fp_count_vect=molecular_fp_count_vect)
-            reaction_similarity_matrix = build_similarity_matrix(d_reactions1, d_reactions2, reaction_similarity_name)
-            molecule_similarity_matrix = build_similarity_matrix(d_mol1, d_mol2, molecular_similarity_name)
-            nx_graphs = [translator('syngraph', s, 'networkx',
-                                    out_data_model='bipartite') for s in [syngraph1, syngraph2]]
-            # The cost function uses the selected reaction and molecular fingerprints and the selected similarity type.
-            node_subst_cost_partial = partial(node_subst_cost_matrix,
-                                              reaction_similarity_matrix=reaction_similarity_matrix,
-                                              molecule_similarity_matrix=molecule_similarity_matrix)
-            # Retrieve the roots of the routes
-            root_g1 = [n for n, d in nx_graphs[0].out_degree() if d == 0]
-            root_g2 = [n for n, d in nx_graphs[1].out_degree() if d == 0]
-
-            ged = nx.graph_edit_distance(nx_graphs[0], nx_graphs[1], node_subst_cost=node_subst_cost_partial,
-                                         roots=(root_g1[0], root_g2[0]))
-
+        check_graphs_type(route1, route2)
+        reaction_similarity_matrix = build_similarity_matrix(route1.reaction_fingerprints,
+                                                             route2.reaction_fingerprints, reaction_similarity_name,
+                                                             as_dataframe=False)
+        if type(route1.syngraph) == BipartiteSynGraph:
+            molecule_similarity_matrix = build_similarity_matrix(route1.molecular_fingerprints,
+                                                                 route2.molecular_fingerprints,
+                                                                 molecular_similarity_name, as_dataframe=False)
         else:
-            logger.error(f'Graph1 has type = {type(syngraph1)} \nGraph2 has type = {type(syngraph2)}. '
-                         f'The GED cannot be computed between graph of different types.')
-            raise MismatchingGraph
-
-        return ged
+            molecule_similarity_matrix = None
+        # The cost function uses the precomputed similarity matrices.
+        node_subst_cost_partial = partial(node_subst_cost_matrix,
+                                          reaction_similarity_matrix=reaction_similarity_matrix,
+                                          molecule_similarity_matrix=molecule_similarity_matrix)
+        return nx_ged_with_budget(self, route1, route2, node_subst_cost_partial, timeout, max_distance)
 
 
 class GedNx(Ged):
     """ Subclass for the calculation of the GED algorithm as implemented in NetworkX. """
 
-    def compute_ged(self, syngraph1, syngraph2, reaction_fp, reaction_fp_params, reaction_similarity_name,
-                    molecular_fingerprint, molecular_fp_params, molecular_fp_count_vect, molecular_similarity_name):
-        """ Takes two SynGraph instances, fingerprints and similarity methods for both molecules
+    def compute_ged(self, route1, route2, reaction_similarity_name, molecular_similarity_name, timeout=None,
+                    max_distance=None):
+        """ Takes two PreparedRoute instances and the similarity methods for both molecules
             and reactions and returns the GED between the two graphs as computed by the GED algorithm in NetworkX.
+            If the time budget is reached, the lowest value found so far is returned.
+        """
+        check_graphs_type(route1, route2)
+        # The cost function uses the precomputed fingerprints and the selected similarity type.
+        node_subst_cost_partial = partial(node_subst_cost_prepared, route1=route1, route2=route2,
+                                          reaction_similarity_name=reaction_similarity_name,
+                                          molecular_similarity_name=molecular_similarity_name)
+        return nx_ged_with_budget(self, route1, route2, node_subst_cost_partial, timeout, max_distance)
+
+
+def nx_ged_with_budget(calculator: Ged, route1, route2, node_subst_cost_function, timeout=None, max_distance=None):
+    """ To call the NetworkX GED with the roots of the routes, an optional time budget and an optional distance
+        threshold (see optimize_ged_with_budget) """
+    costs = (cost for _, _, cost in nx.optimize_edit_paths(route1.nx_graph, route2.nx_graph,
+                                                           node_subst_cost=node_subst_cost_function,
+                                                           upper_bound=max_distance, strictly_decreasing=True,
+                                                           roots=(route1.root, route2.root)))
+    return optimize_ged_with_budget(calculator, costs, timeout)
+
+
+def optimize_ged_with_budget(calculator: Ged, costs, timeout=None):
+    """ To go through the costs of the edit paths generated by NetworkX, each lower than the previous one, keeping the
+        lowest one. When the time budget is reached, the search is stopped and the calculator is flagged as timed
+        out: the returned value is the cost of an edit path, hence an upper bound of the GED. The budget is checked
+        each time an edit path is found, since NetworkX cannot be interrupted while searching for the next one.
+        If no edit path within the distance threshold exists, PRUNED_DISTANCE is returned. """
+    start = time.perf_counter()
+    calculator.timed_out = False
+    ged = None
+    for cost in costs:
+        ged = cost
+        if timeout is not None and time.perf_counter() - start >= timeout:
+            calculator.timed_out = True
+            break
+    return PRUNED_DISTANCE if ged is None else ged
+
+
+class GedTreeEdit(Ged):
+    """ Subclass for the calculation of the tree edit distance between routes, as defined by Zhang and Shasha.
+        The routes are treated as trees rooted in the target, whose children are sorted by uid; the runtime is
+        polynomial in the number of nodes, so the time budget is not used. """
+
+    def compute_ged(self, route1, route2, reaction_similarity_name, molecular_similarity_name, timeout=None,
+                    max_distance=None):
+        """ Takes two PreparedRoute instances and the similarity methods for both molecules
+            and reactions and returns the tree edit distance between the two routes. The substitution costs are
+            the same used by the NetworkX GED, while the insertion and deletion of a node cost 1.
         """
-        if type(syngraph1) == type(syngraph2) and type(syngraph1) == MonopartiteReacSynGraph:
-            nx_graphs = [translator('syngraph', s, 'networkx',
-                                    out_data_model='monopartite_reactions') for s in [syngraph1, syngraph2]]
-            # The cost function uses the selected reaction fingerprints.
-            node_subst_cost_partial = partial(node_subst_cost, reaction_fingerprints=reaction_fp,
-                                              reaction_fp_params=reaction_fp_params,
-                                              reaction_similarity_name=reaction_similarity_name,
-                                              molecular_fingerprint=molecular_fingerprint,
-                                              molecular_fp_params=molecular_fp_params,
-                                              molecular_fp_count_vect=molecular_fp_count_vect,
-                                              molecular_similarity_name=molecular_similarity_name)
-            root_g1 = [n for n, d in nx_graphs[0].out_degree() if d == 0]
-            root_g2 = [n for n, d in nx_graphs[1].out_degree() if d == 0]
-
-            ged = nx.graph_edit_distance(nx_graphs[0], nx_graphs[1], node_subst_cost=node_subst_cost_partial,
-                                         roots=(root_g1[0], root_g2[0]))
-
-        elif type(syngraph1) == type(syngraph2) and type(syngraph1) == BipartiteSynGraph:
-            nx_graphs = [translator('syngraph', s, 'networkx',
-                                    out_data_model='bipartite') for s in [syngraph1, syngraph2]]
-            # The cost function uses the selected reaction and molecular fingerprints and the selected similarity type.
-            node_subst_cost_partial = partial(node_subst_cost, reaction_fingerprints=reaction_fp,
-                                              reaction_fp_params=reaction_fp_params,
-                                              reaction_similarity_name=reaction_similarity_name,
-                                              molecular_fingerprint=molecular_fingerprint,
-                                              molecular_fp_params=molecular_fp_params,
-                                              molecular_fp_count_vect=molecular_fp_count_vect,
-                                              molecular_similarity_name=molecular_similarity_name)
-            # Retrieve the roots of the routes
-            root_g1 = [n for n, d in nx_graphs[0].out_degree() if d == 0]
-            root_g2 = [n for n, d in nx_graphs[1].out_degree() if d == 0]
-
-            ged = nx.graph_edit_distance(nx_graphs[0], nx_graphs[1], node_subst_cost=node_subst_cost_partial,
-                                         roots=(root_g1[0], root_g2[0]))
+        check_graphs_type(route1, route2)
+        postorder1, leftmost1 = get_ordered_tree(route1.nx_graph, route1.root)
+        postorder2, leftmost2 = get_ordered_tree(route2.nx_graph, route2.root)
+        # The substitution cost of each pair of nodes is computed only once
+        subst_costs = [[node_subst_cost_prepared(route1.nx_graph.nodes[n1], route2.nx_graph.nodes[n2], route1, route2,
+                                                 reaction_similarity_name, molecular_similarity_name)
+                        for n2 in postorder2] for n1 in postorder1]
+        return zhang_shasha_distance(leftmost1, leftmost2, subst_costs)
+
+    def lower_bound(self, route1, route2, reaction_similarity_name, molecular_similarity_name, cutoff=None) -> float:
+        """ The shared subtrees are repeated in the ordered trees, so the bounds based on the graphs do not apply """
+        return 0.0
+
+
+class GedBipartiteApprox(Ged):
+    """ Subclass for the calculation of an approximated GED based on the bipartite assignment of the nodes, as
+        proposed by Riesen and Bunke. The result is an upper bound of the exact GED, computed in polynomial time, so
+        the time budget is not used. """
+
+    def compute_ged(self, route1, route2, reaction_similarity_name, molecular_similarity_name, timeout=None,
+                    max_distance=None):
+        """ Takes two PreparedRoute instances and the similarity methods for both molecules
+            and reactions and returns the cost of the edit path induced by the optimal assignment of the nodes.
+            The substitution costs are the same used by the 'nx_ged_matrix' method, while the insertion and deletion
+            of nodes and edges cost 1, as in the NetworkX GED.
+        """
+        check_graphs_type(route1, route2)
+        reaction_similarity_matrix = build_similarity_matrix(route1.reaction_fingerprints,
+                                                             route2.reaction_fingerprints, reaction_similarity_name,
+                                                             as_dataframe=False)
+        molecule_similarity_matrix = build_similarity_matrix(route1.molecular_fingerprints,
+                                                             route2.molecular_fingerprints,
+                                                             molecular_similarity_name, as_dataframe=False)
+        g1 = route1.nx_graph
+        g2 = route2.nx_graph
+        nodes1 = list(g1.nodes)
+        nodes2 = list(g2.nodes)
+        n1 = len(nodes1)
+        n2 = len(nodes2)
+
+        # Cost matrix of the assignment problem: substitutions (top left), deletions (top right),
+        # insertions (bottom left) and dummy assignments (bottom right)
+        cost_matrix = np.zeros((n1 + n2, n1 + n2))
+        cost_matrix[:n1, n2:] = np.inf
+        cost_matrix[n1:, :n2] = np.inf
+        for i, u in enumerate(nodes1):
+            for j, v in enumerate(nodes2):
+                # the local edge structure is taken into account through the difference in degrees; each edge is
+                # shared by two nodes, so half of its cost is assigned to each of them
+                edge_cost = 0.5 * (abs(g1.in_degree(u) - g2.in_degree(v)) + abs(g1.out_degree(u) - g2.out_degree(v)))
+                cost_matrix[i, j] = node_subst_cost_matrix(g1.nodes[u], g2.nodes[v], reaction_similarity_matrix,
+                                                           molecule_similarity_matrix) + edge_cost
+            cost_matrix[i, n2 + i] = 1.0 + 0.5 * g1.degree(u)
+        for j, v in enumerate(nodes2):
+            cost_matrix[n1 + j, j] = 1.0 + 0.5 * g2.degree(v)
+
+        rows, cols = linear_sum_assignment(cost_matrix)
+        mapping = {nodes1[i]: nodes2[j] for i, j in zip(rows, cols) if i < n1 and j < n2}
+
+        # Cost of the edit path induced by the node assignment
+        ged = sum(node_subst_cost_matrix(g1.nodes[u], g2.nodes[v], reaction_similarity_matrix,
+                                         molecule_similarity_matrix) for u, v in mapping.items())
+        ged += (n1 - len(mapping)) + (n2 - len(mapping))
+        matched_edges = sum(1 for a, b in g1.edges if a in mapping and b in mapping
+                            and g2.has_edge(mapping[a], mapping[b]))
+        ged += (g1.number_of_edges() - matched_edges) + (g2.number_of_edges() - matched_edges)
+        return ged
 
-        else:
-            logger.error(f'Graph1 has type = {type(syngraph1)} \nGraph2 has type = {type(syngraph2)}. '
-                         f'The GED cannot be computed between graph of different types.')
-            raise MismatchingGraph
 
-        return ged
+class GedWeisfeilerLehman(Ged):
+    """ Subclass for the calculation of a distance based on the Weisfeiler-Lehman subtree kernel. Each route is turned
+        into a sparse vector counting the labels of its nodes, starting from their uid and refined for a few
+        iterations with the labels of their neighbors; the distance is 1 minus the cosine similarity of the vectors.
+        The routes do not need to be compared pair by pair, so the distances among a list of routes are computed at
+        once with a sparse matrix product. """
+    vectorized = True
+
+    def compute_ged(self, route1, route2, reaction_similarity_name, molecular_similarity_name, timeout=None,
+                    max_distance=None):
+        """ Takes two PreparedRoute instances and returns their Weisfeiler-Lehman distance, computed with the number
+            of iterations in the GED settings; the similarity methods and the fingerprints are not used. """
+        check_graphs_type(route1, route2)
+        return float(self.compute_distances([route1.syngraph, route2.syngraph]).get(0, 1))
+
+    def compute_distances(self, syngraphs: list, ged_params=None) -> DistanceMatrix:
+        """ Takes a list of SynGraph instances and returns the DistanceMatrix with their Weisfeiler-Lehman distances,
+            computed with the 'wl_iterations' parameter """
+        return compute_wl_distance_matrix(syngraphs, resolve_ged_params(ged_params)['wl_iterations'])
+
+    def lower_bound(self, route1, route2, reaction_similarity_name, molecular_similarity_name, cutoff=None) -> float:
+        """ The distance is not an edit distance, so the bounds based on the graphs do not apply """
+        return 0.0
+
+
+def compute_wl_features(syngraphs: list, iterations: int) -> sparse.csr_matrix:
+    """ To compute the Weisfeiler-Lehman features of a list of routes. The initial label of each node is the uid of
+        its ChemicalEquation or Molecule; at each iteration, the new label of a node is built from its current label
+        and from the sorted labels of its predecessors and successors. The labels are shared by all the routes.
+
+        :param:
+            syngraphs: a list of SynGraph objects
+
+            iterations: an integer indicating the number of refinement iterations
+
+        :return:
+            features: a scipy sparse matrix (n routes x n labels) counting how many times each label, of any
+                      iteration, occurs in each route
+    """
+    label_ids = {}
+    rows = []
+    columns = []
+    for n, syngraph in enumerate(syngraphs):
+        successors = {node: list(children) for node, children in syngraph.graph.items()}
+        predecessors = defaultdict(list)
+        for node, children in list(successors.items()):
+            for child in children:
+                predecessors[child].append(node)
+                successors.setdefault(child, [])
+        labels = {node: label_ids.setdefault(('uid', type(node).__name__, node.uid), len(label_ids))
+                  for node in successors}
+        columns.extend(labels.values())
+        for _ in range(iterations):
+            # the labels of an iteration are built from those of the previous one, so they are never confused
+            labels = {node: label_ids.setdefault((label, tuple(sorted(labels[p] for p in predecessors[node])),
+                                                  tuple(sorted(labels[s] for s in successors[node]))), len(label_ids))
+                      for node, label in labels.items()}
+            columns.extend(labels.values())
+        rows.extend([n] * (len(columns) - len(rows)))
+    # repeated (route, label) entries are summed up
+    return sparse.csr_matrix((np.ones(len(columns)), (rows, columns)), shape=(len(syngraphs), len(label_ids)))
+
+
+def compute_wl_distance_matrix(syngraphs: list, iterations: int, block_size=None) -> DistanceMatrix:
+    """ To compute the Weisfeiler-Lehman distances among a list of routes, i.e. 1 minus the cosine similarity of their
+        features (see compute_wl_features).
+
+        :param:
+            syngraphs: a list of SynGraph objects of the same type
+
+            iterations: an integer indicating the number of refinement iterations
+
+            block_size: an integer indicating the number of rows of the kernel computed at once (optional;
+                        default: None -> see compute_cosine_distance_matrix)
+
+        :return:
+            a DistanceMatrix with the distances, between 0 and 1
+    """
+    if len({type(s) for s in syngraphs}) > 1:
+        logger.error('The routes have different types: the distance cannot be computed between graphs of '
+                     'different types.')
+        raise MismatchingGraph
+    return compute_cosine_distance_matrix(compute_wl_features(syngraphs, iterations), block_size)
+
+
+def compute_fingerprint_features(syngraphs: list, ged_params=None, fingerprint_store=None) -> sparse.csr_matrix:
+    """ To compute the fingerprint features of a list of routes: each route is represented by the sum of the
+        fingerprints of its reactions and molecules, computed as specified in the GED parameters.
+
+        :param:
+            syngraphs: a list of SynGraph objects
+
+            ged_params: a dictionary with the GED parameters (optional; default: None -> default parameters are used)
+
+            fingerprint_store: a FingerprintStore instance (optional; default: None)
+                If provided, the fingerprints are retrieved from and added to it
+
+        :return:
+            features: a scipy sparse matrix (n routes x n features) with the summed fingerprints
+    """
+    params = resolve_ged_params(ged_params)
+    feature_ids = {}
+    rows = []
+    columns = []
+    values = []
+    for n, syngraph in enumerate(syngraphs):
+        reaction_fingerprints, molecular_fingerprints = compute_nodes_fingerprints(
+            syngraph, params['reaction_fp'], params['molecular_fp'], reaction_fp_params=params['reaction_fp_params'],
+            molecular_fp_params=params['molecular_fp_params'],
+            molecular_fp_count_vect=params['molecular_fp_count_vect'], fingerprint_store=fingerprint_store)
+        for node_type, fingerprints in [('reaction', reaction_fingerprints), ('molecule', molecular_fingerprints)]:
+            for fingerprint in fingerprints.values():
+                # count fingerprints expose their non-zero elements, bit fingerprints their 'on' bits
+                elements = fingerprint.GetNonzeroElements() if hasattr(fingerprint, 'GetNonzeroElements') else \
+                    dict.fromkeys(fingerprint.GetOnBits(), 1)
+                for element, count in elements.items():
+                    rows.append(n)
+                    columns.append(feature_ids.setdefault((node_type, element), len(feature_ids)))
+                    values.append(count)
+    return sparse.csr_matrix((np.asarray(values, dtype=float), (rows, columns)),
+                             shape=(len(syngraphs), len(feature_ids)))
+
+
+def compute_cosine_distance_matrix(features, block_size=None) -> DistanceMatrix:
+    """ To compute the cosine distances, i.e. 1 minus the cosine similarity, among the rows of a sparse feature
+        matrix. The similarity is computed with a sparse matrix product, one block of rows at a time to limit the
+        memory usage.
+
+        :param:
+            features: a scipy sparse matrix (n routes x n features)
+
+            block_size: an integer indicating the number of rows of the similarity computed at once (optional;
+                        default: None -> it is chosen so that each block contains about 16 million values)
+
+        :return:
+            a DistanceMatrix with the distances, between 0 and 1
+    """
+    features = sparse.csr_matrix(features, dtype=float)
+    n_routes = features.shape[0]
+    norms = np.sqrt(np.asarray(features.multiply(features).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    features = sparse.diags(1.0 / norms) @ features
+    features_t = features.T.tocsc()
+    if block_size is None:
+        block_size = max(1, 2 ** 24 // max(n_routes, 1))
+
+    condensed = np.zeros(n_routes * (n_routes - 1) // 2, dtype=np.float32)
+    for start in range(0, n_routes, block_size):
+        stop = min(start + block_size, n_routes)
+        similarity = (features[start:stop] @ features_t).toarray()
+        # the cells above the diagonal of consecutive rows are consecutive in the condensed vector
+        upper = np.arange(n_routes)[None, :] > np.arange(start, stop)[:, None]
+        first = start * n_routes - start * (start + 1) // 2
+        last = stop * n_routes - stop * (stop + 1) // 2
+        condensed[first:last] = np.clip(1.0 - similarity[upper], 0.0, 1.0)
+    return DistanceMatrix(n_routes, condensed=condensed)
+
+
+def get_ordered_tree(nx_graph: nx.DiGraph, root, sort_key=None) -> tuple:
+    """ To visit a route as an ordered tree rooted in its root; the 'children' of a node are its predecessors in the
+        graph. If a node has more than one successor, its subtree is repeated under each of them.
+
+        :param:
+            nx_graph: a networkx DiGraph
+
+            root: the node of the graph to be used as root of the tree
+
+            sort_key: a function used to sort the children of each node (optional; default: None -> the uid of the
+                      'node_class' property of the nodes is used)
+
+        :return:
+            postorder: the list of the nodes of the tree in postorder
+
+            leftmost: the list of the postorder indices of the leftmost leaf descendant of each node
+    """
+    if sort_key is None:
+        def sort_key(n):
+            return nx_graph.nodes[n]['attributes']['properties']['node_class'].uid
+    postorder = []
+    leftmost = []
+    if root is None:
+        return postorder, leftmost
+
+    # Iterative postorder visit: each stack item is (node, sorted children, index of the next child, leftmost leaf)
+    stack = [(root, sorted(nx_graph.predecessors(root), key=sort_key), 0, None)]
+    while stack:
+        node, children, i, first_leaf = stack.pop()
+        if i < len(children):
+            stack.append((node, children, i + 1, first_leaf))
+            child = children[i]
+            stack.append((child, sorted(nx_graph.predecessors(child), key=sort_key), 0, None))
+            continue
+        # all the children have been visited: the node is added to the postorder
+        postorder.append(node)
+        leftmost.append(len(postorder) - 1 if first_leaf is None else first_leaf)
+        if stack and stack[-1][3] is None:
+            # the leftmost leaf of the first child is the leftmost leaf of the parent
+            parent, parent_children, parent_i, _ = stack.pop()
+            stack.append((parent, parent_children, parent_i, leftmost[-1]))
+    return postorder, leftmost
+
+
+def zhang_shasha_distance(leftmost1: list, leftmost2: list, subst_costs, del_cost=1.0, ins_cost=1.0) -> float:
+    """ To compute the ordered tree edit distance with the Zhang-Shasha algorithm.
+
+        :param:
+            leftmost1, leftmost2: the lists of the postorder indices of the leftmost leaf descendant of each node of
+                                  the two trees, output of get_ordered_tree
+
+            subst_costs: a (n nodes in tree1) x (n nodes in tree2) nested list with the substitution costs
+
+            del_cost: a float indicating the cost of deleting a node (optional; default: 1.0)
+
+            ins_cost: a float indicating the cost of inserting a node (optional; default: 1.0)
+
+        :return:
+            the tree edit distance
+    """
+    n1 = len(leftmost1)
+    n2 = len(leftmost2)
+    if n1 == 0 or n2 == 0:
+        return n1 * del_cost + n2 * ins_cost
+    # The keyroots are the nodes with the highest postorder index among those sharing the same leftmost leaf
+    keyroots1 = sorted({lm: i for i, lm in enumerate(leftmost1)}.values())
+    keyroots2 = sorted({lm: j for j, lm in enumerate(leftmost2)}.values())
+    tree_dist = [[0.0] * n2 for _ in range(n1)]
+
+    for i in keyroots1:
+        for j in keyroots2:
+            l1 = leftmost1[i]
+            l2 = leftmost2[j]
+            m = i - l1 + 2
+            n = j - l2 + 2
+            # forest distance; index x corresponds to the node l1 + x - 1 (0 is the empty forest)
+            forest_dist = [[0.0] * n for _ in range(m)]
+            for x in range(1, m):
+                forest_dist[x][0] = forest_dist[x - 1][0] + del_cost
+            for y in range(1, n):
+                forest_dist[0][y] = forest_dist[0][y - 1] + ins_cost
+            for x in range(1, m):
+                i1 = l1 + x - 1
+                for y in range(1, n):
+                    j1 = l2 + y - 1
+                    if leftmost1[i1] == l1 and leftmost2[j1] == l2:
+                        forest_dist[x][y] = min(forest_dist[x - 1][y] + del_cost,
+                                                forest_dist[x][y - 1] + ins_cost,
+                                                forest_dist[x - 1][y - 1] + subst_costs[i1][j1])
+                        tree_dist[i1][j1] = forest_dist[x][y]
+                    else:
+                        p = leftmost1[i1] - l1
+                        q = leftmost2[j1] - l2
+                        forest_dist[x][y] = min(forest_dist[x - 1][y] + del_cost,
+                                                forest_dist[x][y - 1] + ins_cost,
+                                                forest_dist[p][q] + tree_dist[i1][j1])
+    return tree_dist[n1 - 1][n2 - 1]
+
+
+def check_graphs_type(route1: PreparedRoute, route2: PreparedRoute):
+    """ To check that the GED can be computed between two routes, i.e. that they are of the same type """
+    if type(route1.syngraph) != type(route2.syngraph):
+        logger.error(f'Graph1 has type = {type(route1.syngraph)} \nGraph2 has type = {type(route2.syngraph)}. '
+                     f'The GED cannot be computed between graph of different types.')
+        raise MismatchingGraph
+
+
+def compute_set_lower_bound(route1: PreparedRoute, route2: PreparedRoute) -> float:
+    """ To compute a lower bound of the GED between two routes based only on the uid sets of their reactions and
+        molecules and on the number of edges; no similarity is computed. It combines:
+        (i) a node-count bound: only nodes of the same type can be substituted at a cost lower than 1, so the nodes in
+            excess of each type must be inserted, deleted or substituted with a node of the other type;
+        (ii) an edge-count bound: edges can only be substituted at no cost, so the difference in the number of
+             edges must be inserted or deleted.
+
+        :param:
+            route1, route2: two PreparedRoute objects
+
+        :return:
+            the lower bound of the GED
+    """
+    check_graphs_type(route1, route2)
+    reactions1, reactions2 = route1.reaction_fingerprints.keys(), route2.reaction_fingerprints.keys()
+    molecules1, molecules2 = route1.molecular_fingerprints.keys(), route2.molecular_fingerprints.keys()
+    same_type_matches = min(len(reactions1), len(reactions2)) + min(len(molecules1), len(molecules2))
+    node_bound = max(len(reactions1) + len(molecules1), len(reactions2) + len(molecules2)) - same_type_matches
+    edge_bound = abs(route1.nx_graph.number_of_edges() - route2.nx_graph.number_of_edges())
+    return node_bound + edge_bound
+
+
+def compute_ged_lower_bound(route1: PreparedRoute, route2: PreparedRoute, reaction_similarity_name,
+                            molecular_similarity_name) -> float:
+    """ To compute a lower bound of the GED between two routes, with unit costs for the insertion and deletion of
+        nodes and edges and the similarity-based cost for the substitution of nodes. Besides the bound computed by
+        compute_set_lower_bound, a label-multiset bound is used: each node costs at least its cheapest substitution,
+        which is 0 if a node with the same uid is in the other route, plus the unavoidable insertions/deletions.
+        The similarity is computed only for the nodes whose uid is not shared by the two routes.
+
+        :param:
+            route1, route2: two PreparedRoute objects
+
+            reaction_similarity_name: a string indicating the similarity method to be used for reactions
+
+            molecular_similarity_name: a string indicating the similarity method to be used for molecules
+
+        :return:
+            the lower bound of the GED
+    """
+    set_bound = compute_set_lower_bound(route1, route2)
+    n1 = len(route1.reaction_fingerprints) + len(route1.molecular_fingerprints)
+    n2 = len(route2.reaction_fingerprints) + len(route2.molecular_fingerprints)
+
+    # Label-multiset bound: cheapest operation for each node of the two routes
+    min_costs1 = 0.0
+    min_costs2 = 0.0
+    for d_fp1, d_fp2, similarity_name in [(route1.reaction_fingerprints, route2.reaction_fingerprints,
+                                           reaction_similarity_name),
+                                          (route1.molecular_fingerprints, route2.molecular_fingerprints,
+                                           molecular_similarity_name)]:
+        if not d_fp1 or not d_fp2:
+            min_costs1 += len(d_fp1)
+            min_costs2 += len(d_fp2)
+            continue
+        # nodes with the same uid can always be substituted at no cost
+        only1 = {h: fp for h, fp in d_fp1.items() if h not in d_fp2}
+        only2 = {h: fp for h, fp in d_fp2.items() if h not in d_fp1}
+        if only1:
+            values = build_similarity_matrix(only1, d_fp2, similarity_name, as_dataframe=False).values
+            min_costs1 += np.clip(1.0 - values.max(axis=0), 0.0, 1.0).sum()
+        if only2:
+            values = build_similarity_matrix(d_fp1, only2, similarity_name, as_dataframe=False).values
+            min_costs2 += np.clip(1.0 - values.max(axis=1), 0.0, 1.0).sum()
+    multiset_bound = max(min_costs1 + max(0, n2 - n1), min_costs2 + max(0, n1 - n2))
+
+    edge_bound = abs(route1.nx_graph.number_of_edges() - route2.nx_graph.number_of_edges())
+    return max(set_bound, multiset_bound + edge_bound)
 
 
 class GedFactory:
@@ -269,30 +887,199 @@ class GedFactory:
                                   'and the "root" algorithm is used'},
         'nx_optimized_ged': {'value': GedOptNx,
                              'info': 'Optimized NetworkX GED algorithm'},
+        'tree_edit_distance': {'value': GedTreeEdit,
+                               'info': 'Zhang-Shasha tree edit distance, with polynomial runtime. The routes are '
+                                       'treated as trees rooted in the target'},
+        'bipartite_approx_ged': {'value': GedBipartiteApprox,
+                                 'info': 'Approximated GED (Riesen-Bunke) based on the bipartite assignment of the '
+                                         'nodes; it returns an upper bound of the exact GED in polynomial time'},
+        'wl_kernel': {'value': GedWeisfeilerLehman,
+                      'info': 'Distance based on the Weisfeiler-Lehman subtree kernel of the routes, computed for '
+                              'all the routes at once with a sparse matrix product; it is not an edit distance'},
     }
 
-    def select_ged(self, syngraph1, syngraph2, ged_method,
-                   reaction_fp, reaction_fp_params,
-                   reaction_similarity_name,
-                   molecular_fp, molecular_fp_params, molecular_fp_count_vect,
-                   molecular_similarity_name):
-        if ged_method not in self.available_ged:
-            logger.error(f"'{ged_method}' is invalid. Available algorithms are: {self.available_ged.keys()}")
-            raise UnavailableGED
+    def select_ged(self, route1, route2, ged_method, reaction_similarity_name, molecular_similarity_name,
+                   timeout=None, max_distance=None):
+        return self.get_calculator(ged_method).compute_ged(route1, route2, reaction_similarity_name,
+                                                           molecular_similarity_name, timeout=timeout,
+                                                           max_distance=max_distance)
+
+    def get_calculator(self, ged_method) -> Ged:
+        """ To get an instance of the selected Ged calculator """
+        check_ged_method(ged_method)
+        return self.available_ged[ged_method]['value']()
+
+
+def check_ged_method(ged_method: str):
+    """ To check that the selected GED method is among the available ones """
+    if ged_method not in GedFactory.available_ged:
+        logger.error(f"'{ged_method}' is invalid. Available algorithms are: {GedFactory.available_ged.keys()}")
+        raise UnavailableGED
 
-        selector = self.available_ged[ged_method]['value']
-        return selector().compute_ged(syngraph1, syngraph2, reaction_fp, reaction_fp_params,
-                                      reaction_similarity_name,
-                                      molecular_fp, molecular_fp_params, molecular_fp_count_vect,
-                                      molecular_similarity_name)
+
+def resolve_ged_params(ged_params=None) -> dict:
+    """ To complete the dictionary of GED parameters with the default values of the missing ones """
+    if ged_params is None:
+        ged_params = {}
+    return {param: ged_params.get(param, settings.GED.get(param, d['value'])) for param, d in DEFAULT_GED.items()}
+
+
+def ged_params_hash(ged_params=None) -> str:
+    """ To compute a canonical hash of the complete set of GED parameters """
+    canonical = json.dumps(resolve_ged_params(ged_params), sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode('utf8')).hexdigest()
+
+
+class GedResultCache:
+    """ Class implementing a persistent cache of GED results, stored in a SQLite database. The results are keyed by
+        the keys of the two routes (see get_route_key), the GED method and the hash of the GED parameters; when the
+        number of stored results exceeds 'max_entries', the least recently used ones are discarded.
+
+        Attributes:
+            path: the Path of the SQLite database
+
+            max_entries: an integer indicating the maximum number of stored results
+
+            hits: an integer counting the requests for which a result was found in the cache
+
+            misses: an integer counting the requests for which no result was found in the cache
+    """
+    _table = 'ged_results'
+
+    def __init__(self, path=None, max_entries=None):
+        """
+        Parameters:
+            path: a string or Path (optional; default: None -> the 'path' in the GED_CACHE settings is used)
+
+            max_entries: an integer (optional; default: None -> the 'max_entries' in the GED_CACHE settings is used)
+        """
+        cache_settings = settings.get('GED_CACHE', {})
+        if path is None:
+            path = cache_settings.get('path', DEFAULT_GED_CACHE['path'])
+        if max_entries is None:
+            max_entries = cache_settings.get('max_entries', DEFAULT_GED_CACHE['max_entries'])
+        self.path = Path(path).expanduser()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(f'CREATE TABLE IF NOT EXISTS {self._table} (key1 TEXT, key2 TEXT, ged_method TEXT, '
+                               f'params_hash TEXT, value REAL, timed_out INTEGER, prefiltered INTEGER, '
+                               f'last_used REAL, PRIMARY KEY (key1, key2, ged_method, params_hash))')
+            connection.execute(f'CREATE INDEX IF NOT EXISTS {self._table}_last_used ON {self._table} (last_used)')
+
+    def __len__(self):
+        with self._connect() as connection:
+            return connection.execute(f'SELECT COUNT(*) FROM {self._table}').fetchone()[0]
+
+    @contextmanager
+    def _connect(self):
+        """ To open a connection to the database; the transaction is committed and the connection closed at the end,
+            so that the cache can be shared among processes """
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get_many(self, key_pairs: list, ged_method: str, params_hash: str) -> dict:
+        """ To retrieve the results stored for a list of (key1, key2) pairs.
+
+            :return:
+                a dictionary mapping the pairs found in the cache to the tuple (value, timed_out, prefiltered)
+        """
+        found = {}
+        with self._connect() as connection:
+            for key1, key2 in set(key_pairs):
+                row = connection.execute(f'SELECT value, timed_out, prefiltered FROM {self._table} WHERE key1 = ? '
+                                         f'AND key2 = ? AND ged_method = ? AND params_hash = ?',
+                                         (key1, key2, ged_method, params_hash)).fetchone()
+                if row is not None:
+                    found[(key1, key2)] = (row[0], bool(row[1]), bool(row[2]))
+            now = time.time()
+            connection.executemany(f'UPDATE {self._table} SET last_used = ? WHERE key1 = ? AND key2 = ? '
+                                   f'AND ged_method = ? AND params_hash = ?',
+                                   [(now, key1, key2, ged_method, params_hash) for key1, key2 in found])
+        self.hits += sum(1 for pair in key_pairs if pair in found)
+        self.misses += sum(1 for pair in key_pairs if pair not in found)
+        return found
+
+    def get(self, key1: str, key2: str, ged_method: str, params_hash: str):
+        """ To retrieve the result (value, timed_out, prefiltered) stored for a pair of routes, if present """
+        return self.get_many([(key1, key2)], ged_method, params_hash).get((key1, key2))
+
+    def put_many(self, results: dict, ged_method: str, params_hash: str) -> None:
+        """ To store the results in a dictionary {(key1, key2): (value, timed_out, prefiltered)}; the least recently
+            used results are discarded if the cache is full. The results that hit the time budget are only upper
+            bounds of the GED, so they are not stored and are computed again when requested. """
+        results = {pair: result for pair, result in results.items() if not result[1]}
+        if self.max_entries <= 0 or not results:
+            return
+        now = time.time()
+        with self._connect() as connection:
+            connection.executemany(f'INSERT OR REPLACE INTO {self._table} VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                   [(key1, key2, ged_method, params_hash, float(value), int(timed_out),
+                                     int(prefiltered), now)
+                                    for (key1, key2), (value, timed_out, prefiltered) in results.items()])
+            excess = connection.execute(f'SELECT COUNT(*) FROM {self._table}').fetchone()[0] - self.max_entries
+            if excess > 0:
+                connection.execute(f'DELETE FROM {self._table} WHERE rowid IN (SELECT rowid FROM {self._table} '
+                                   f'ORDER BY last_used LIMIT ?)', (excess,))
+
+    def put(self, key1: str, key2: str, ged_method: str, params_hash: str, result: tuple) -> None:
+        """ To store the result (value, timed_out, prefiltered) of a pair of routes """
+        self.put_many({(key1, key2): result}, ged_method, params_hash)
+
+    def clear(self) -> None:
+        """ To remove all the stored results and reset the statistics """
+        with self._connect() as connection:
+            connection.execute(f'DELETE FROM {self._table}')
+        self.hits = 0
+        self.misses = 0
+
+    def get_stats(self) -> dict:
+        """ To get the statistics of the cache """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self), 'max_entries': self.max_entries}
+
+
+_default_ged_cache = None
+
+
+def get_default_ged_cache():
+    """ To get the GedResultCache built from the GED_CACHE settings, or None if the cache is not enabled """
+    global _default_ged_cache
+    if not settings.get('GED_CACHE', {}).get('enabled', DEFAULT_GED_CACHE['enabled']):
+        return None
+    if _default_ged_cache is None:
+        _default_ged_cache = GedResultCache()
+    return _default_ged_cache
+
+
+def get_route_key(route) -> str:
+    """ To get a key of a SynGraph or PreparedRoute object that only depends on its nodes and edges. Unlike the uid
+        of the SynGraph, which hashes the representation of a frozenset, it is the same in every Python process and
+        can therefore be stored on disk. """
+    syngraph = get_route_syngraph(route)
+    edges = sorted((parent.uid, child.uid) for parent, children in syngraph.graph.items() for child in children)
+    isolated_nodes = sorted(parent.uid for parent, children in syngraph.graph.items() if not children)
+    return ''.join([type(syngraph).__name__, str(utilities.create_hash(str((edges, isolated_nodes))))])
+
+
+def get_route_syngraph(route):
+    """ To get the SynGraph of a SynGraph or PreparedRoute object """
+    return route.syngraph if isinstance(route, PreparedRoute) else route
 
 
 def graph_distance_factory(syngraph1, syngraph2, ged_method: str,
-                           ged_params=None):
+                           ged_params=None, ged_cache=None):
     """ Gives access to the Ged factory. Computes the distance matrix between a pair of SynGraph instances.
 
         :param:
             syngraph1, syngraph2: two SynGraph objects
+                PreparedRoute objects, built with the same fingerprints parameters, can be passed instead,
+                so that the routes are not prepared again
 
             ged_method: a string
                 It corresponds to the graph edit distance algorithm to be used
@@ -306,49 +1093,138 @@ def graph_distance_factory(syngraph1, syngraph2, ged_method: str,
                 (v) molecular_fp_params: a dictionary with the optional parameters for computing molecular fingerprints
                 (vi) molecular_fp_count_vect: a boolean indicating whether 'GetCountFingerprint' should be used
                 (vii) molecular_similarity_name: a string corresponding to the similarity type to be used for molecules
+                (viii) timeout: a float with the maximum time in seconds for the calculation; when it is reached, the
+                       best upper bound found so far is returned
+                (ix) max_distance: a float with the distance threshold; if the distance is above it, the calculation
+                     is stopped as soon as possible and PRUNED_DISTANCE is returned
+                (x) prefilter_cutoff: a float; if a cheap lower bound of the distance is above it, the GED is not
+                    computed and the lower bound is returned
+                (xi) wl_iterations: an integer with the number of refinement iterations of the node labels used by
+                     the 'wl_kernel' method
+
+            ged_cache: a GedResultCache instance (optional; default: None -> the cache defined in the GED_CACHE
+                       settings is used, if enabled)
+                If available, it is consulted before computing the distance, which is then added to it
 
         :return:
             The output of the selected similarity algorithm, representing the ged between the two input graphs
         """
+    if ged_cache is None:
+        ged_cache = get_default_ged_cache()
+    if ged_cache is None:
+        return compute_pair_distance(syngraph1, syngraph2, ged_method, ged_params)[0]
 
-    if ged_params is None:
-        ged_params = {}
+    check_ged_method(ged_method)
+    key1, key2 = get_route_key(syngraph1), get_route_key(syngraph2)
+    params_hash = ged_params_hash(ged_params)
+    result = ged_cache.get(key1, key2, ged_method, params_hash)
+    if result is None:
+        result = compute_pair_distance(syngraph1, syngraph2, ged_method, ged_params)
+        ged_cache.put(key1, key2, ged_method, params_hash, result)
+    return result[0]
+
+
+def compute_pair_distance(syngraph1, syngraph2, ged_method: str, ged_params=None) -> tuple:
+    """ To compute the distance between a pair of routes, recording whether the time budget was reached and whether
+        the calculation was skipped by the prefilter.
+
+        :param:
+            syngraph1, syngraph2: two SynGraph or PreparedRoute objects
 
-    reaction_fp = ged_params.get('reaction_fp', settings.GED.reaction_fp)
-    reaction_fp_params = ged_params.get('reaction_fp_params', settings.GED.reaction_fp_params)
-    reaction_similarity_name = ged_params.get('reaction_similarity_name',
-                                              settings.GED.reaction_similarity_name)
-    molecular_fp = ged_params.get('molecular_fp', settings.GED.molecular_fp)
-    molecular_fp_params = ged_params.get('molecular_fp_params', settings.GED.molecular_fp_params)
-    molecular_fp_count_vect = ged_params.get('molecular_fp_count_vect', settings.GED.molecular_fp_count_vect)
-    molecular_similarity_name = ged_params.get('molecular_similarity_name',
-                                               settings.GED.molecular_similarity_name)
+            ged_method: a string corresponding to the graph edit distance algorithm to be used
 
-    ged_calculator = GedFactory()
-    return ged_calculator.select_ged(syngraph1, syngraph2, ged_method, reaction_fp, reaction_fp_params,
-                                     reaction_similarity_name,
-                                     molecular_fp, molecular_fp_params, molecular_fp_count_vect,
-                                     molecular_similarity_name)
+            ged_params: a dictionary with the optional parameters (see graph_distance_factory)
+
+        :return:
+            ged: the value of the distance
+
+            timed_out: a boolean indicating whether the time budget was reached, so that ged is an upper bound
+
+            prefiltered: a boolean indicating whether the lower bound of the distance is above the 'prefilter_cutoff'
+                         parameter, so that ged is the lower bound and the GED was not computed
+
+        If the 'max_distance' parameter is set and the distance is above it, ged is PRUNED_DISTANCE.
+    """
+    calculator = GedFactory().get_calculator(ged_method)
+    params = resolve_ged_params(ged_params)
+    max_distance = params['max_distance']
+    if calculator.vectorized:
+        # the routes are compared as a whole, so their nodes do not need to be prepared
+        ged = float(calculator.compute_distances([get_route_syngraph(s) for s in [syngraph1, syngraph2]],
+                                                 params).get(0, 1))
+        if max_distance is not None and ged > max_distance:
+            ged = PRUNED_DISTANCE
+        return ged, False, False
+
+    route1, route2 = [s if isinstance(s, PreparedRoute) else prepare_route(
+        s, params['reaction_fp'], params['reaction_fp_params'], params['molecular_fp'],
+        params['molecular_fp_params'], params['molecular_fp_count_vect']) for s in [syngraph1, syngraph2]]
+
+    cutoff = params['prefilter_cutoff']
+    thresholds = [t for t in [max_distance, cutoff] if t is not None]
+    if thresholds:
+        lower_bound = calculator.lower_bound(route1, route2, params['reaction_similarity_name'],
+                                             params['molecular_similarity_name'], cutoff=min(thresholds))
+        # if the lower bound is above one of the thresholds, the GED calculation is skipped
+        if max_distance is not None and lower_bound > max_distance + _BOUND_TOLERANCE:
+            return PRUNED_DISTANCE, False, False
+        if cutoff is not None and lower_bound > cutoff + _BOUND_TOLERANCE:
+            return lower_bound, False, True
+
+    ged = calculator.compute_ged(route1, route2, params['reaction_similarity_name'],
+                                 params['molecular_similarity_name'], timeout=params['timeout'],
+                                 max_distance=max_distance)
+    if max_distance is not None and not calculator.timed_out and ged > max_distance:
+        ged = PRUNED_DISTANCE
+    return ged, calculator.timed_out, False
 
 
 # COST FUNCTIONS
 def node_subst_cost_matrix(node1, node2, reaction_similarity_matrix, molecule_similarity_matrix):
-    """ To compute the cost of substituting ona node with another, based on the pre-computed similarity matrices.
-        The more different the nodes, the higher the cost.
+    """ To compute the cost of substituting ona node with another, based on the pre-computed similarity matrices
+        (SimilarityMatrix instances or pandas DataFrames). The more different the nodes, the higher the cost.
 
 
     """
+    node_class1 = node1['attributes']['properties']['node_class']
+    node_class2 = node2['attributes']['properties']['node_class']
     # The correct similarity matrix is used based on the node types
-    if type(node1['attributes']['properties']['node_class']) == ChemicalEquation \
-            and type(node2['attributes']['properties']['node_class']) == ChemicalEquation:
-        similarity = reaction_similarity_matrix.loc[node2['attributes']['properties']['node_class'].uid,
-                                                    node1['attributes']['properties']['node_class'].uid]
+    if type(node_class1) == ChemicalEquation and type(node_class2) == ChemicalEquation:
+        return 1.0 - get_matrix_similarity(reaction_similarity_matrix, node_class2.uid, node_class1.uid)
+
+    elif type(node_class1) == Molecule and type(node_class2) == Molecule:
+        return 1.0 - get_matrix_similarity(molecule_similarity_matrix, node_class2.uid, node_class1.uid)
+
+    else:
+        return 1.0
+
+
+def get_matrix_similarity(matrix: Union[SimilarityMatrix, pd.DataFrame], h2, h1) -> float:
+    """ To read the similarity between the node h2 of graph2 and the node h1 of graph1 from a similarity matrix """
+    if isinstance(matrix, SimilarityMatrix):
+        return matrix.get(h2, h1)
+    return matrix.loc[h2, h1]
+
+
+def node_subst_cost_prepared(node1, node2, route1, route2, reaction_similarity_name, molecular_similarity_name):
+    """ To compute the cost of substituting one node of the first route with one node of the second route, based on
+        the fingerprints stored in the PreparedRoute instances. The more different the nodes, the higher the cost.
+
+        :return:
+            cost: a float between 0 and 1
+    """
+    node_class1 = node1['attributes']['properties']['node_class']
+    node_class2 = node2['attributes']['properties']['node_class']
+    if type(node_class1) == ChemicalEquation and type(node_class2) == ChemicalEquation:
+        similarity = compute_similarity(route1.reaction_fingerprints[node_class1.uid],
+                                        route2.reaction_fingerprints[node_class2.uid],
+                                        similarity_name=reaction_similarity_name)
         return 1.0 - similarity
 
-    elif type(node1['attributes']['properties']['node_class']) == Molecule and type(
-            node2['attributes']['properties']['node_class']) == Molecule:
-        similarity = molecule_similarity_matrix.loc[node2['attributes']['properties']['node_class'].uid,
-                                                    node1['attributes']['properties']['node_class'].uid]
+    elif type(node_class1) == Molecule and type(node_class2) == Molecule:
+        similarity = compute_similarity(route1.molecular_fingerprints[node_class1.uid],
+                                        route2.molecular_fingerprints[node_class2.uid],
+                                        similarity_name=molecular_similarity_name)
         return 1.0 - similarity
 
     else:
@@ -391,7 +1267,8 @@ def node_subst_cost(node1, node2, reaction_fingerprints, reaction_fp_params, rea
 def compute_nodes_fingerprints(syngraph, reaction_fingerprints, molecular_fingerprint,
                                reaction_fp_params=DEFAULT_GED['reaction_fp_params']['value'],
                                molecular_fp_params=DEFAULT_GED['molecular_fp_params']['value'],
-                               molecular_fp_count_vect=DEFAULT_GED['molecular_fp_count_vect']['value']):
+                               molecular_fp_count_vect=DEFAULT_GED['molecular_fp_count_vect']['value'],
+                               fingerprint_store=None):
     """ To create two dictionaries, whose keys are the hashes of the SynGraph nodes and the values their fingerprints.
 
         :param:
@@ -407,40 +1284,33 @@ def compute_nodes_fingerprints(syngraph, reaction_fingerprints, molecular_finger
 
             molecular_fp_count_vect: a boolean indicating whether 'GetCountFingerprint' should be used
 
+            fingerprint_store: a FingerprintStore instance (optional; default: None)
+                If provided, the fingerprints are retrieved from and added to it
+
         :return:
             reaction_nodes_fingerprints: a dictionary containing the fingerprints of the ChemicalEquation nodes
 
             molecule_node_fingerprints: a dictionary containing the fingerprints of the Molecule nodes
     """
+    if fingerprint_store is None:
+        fingerprint_store = FingerprintStore()
     reaction_nodes_fingerprints = {}
     molecule_node_fingerprints = {}
 
     for r, connections in syngraph.graph.items():
-        if type(r) == ChemicalEquation:
-            if r.uid not in reaction_nodes_fingerprints:
-                reaction_nodes_fingerprints[r.uid] = compute_reaction_fingerprint(r.rdrxn,
-                                                                                  fp_name=reaction_fingerprints,
-                                                                                  params=reaction_fp_params)
-        elif r.uid not in molecule_node_fingerprints:
-            molecule_node_fingerprints[r.uid] = compute_mol_fingerprint(r.rdmol, fp_name=molecular_fingerprint,
-                                                                        parameters=molecular_fp_params,
-                                                                        count_fp_vector=molecular_fp_count_vect)
-
-        for c in connections:
-            if type(c) == ChemicalEquation:
-                if c.uid not in reaction_nodes_fingerprints:
-                    reaction_nodes_fingerprints[c.uid] = compute_reaction_fingerprint(c.rdrxn,
-                                                                                      fp_name=reaction_fingerprints,
-                                                                                      params=reaction_fp_params)
-            elif c.uid not in molecule_node_fingerprints:
-                molecule_node_fingerprints[c.uid] = compute_mol_fingerprint(c.rdmol,
-                                                                            fp_name=molecular_fingerprint,
-                                                                            parameters=molecular_fp_params,
-                                                                            count_fp_vector=molecular_fp_count_vect)
+        for node in [r, *connections]:
+            if type(node) == ChemicalEquation:
+                if node.uid not in reaction_nodes_fingerprints:
+                    reaction_nodes_fingerprints[node.uid] = fingerprint_store.get_reaction_fingerprint(
+                        node, fp_name=reaction_fingerprints, params=reaction_fp_params)
+            elif node.uid not in molecule_node_fingerprints:
+                molecule_node_fingerprints[node.uid] = fingerprint_store.get_molecular_fingerprint(
+                    node, fp_name=molecular_fingerprint, parameters=molecular_fp_params,
+                    count_fp_vector=molecular_fp_count_vect)
     return reaction_nodes_fingerprints, molecule_node_fingerprints
 
 
-def build_similarity_matrix(d_fingerprints1, d_fingerprints2, similarity_name='tanimoto'):
+def build_similarity_matrix(d_fingerprints1, d_fingerprints2, similarity_name='tanimoto', as_dataframe=True):
     """ To build the similarity matrix between two routes with the selected method.
 
         :param:
@@ -452,28 +1322,32 @@ def build_similarity_matrix(d_fingerprints1, d_fingerprints2, similarity_name='t
 
             similarity_name: a string specifying the similarity method to be used
 
+            as_dataframe: a boolean (optional; default: True)
+                If set to False, a SimilarityMatrix instance is returned instead of a pandas DataFrame
+
         :return:
             matrix: a pandas dataframe (n nodes in graph1) x (n nodes in graph2) containing the similarity values
     """
-    columns = list(d_fingerprints1.keys())
-    rows = list(d_fingerprints2.keys())
-    matrix = pd.DataFrame(np.zeros((len(rows), len(columns))), columns=columns, index=rows)
-
-    for h1, fp1 in d_fingerprints1.items():
-        for h2, fp2 in d_fingerprints2.items():
-            if matrix.loc[h2, h1] == 0:
-                sim = compute_similarity(fp1, fp2, similarity_name=similarity_name)
-                matrix.loc[h2, h1] = sim
-    return matrix
+    row_index = {h: n for n, h in enumerate(d_fingerprints2)}
+    column_index = {h: n for n, h in enumerate(d_fingerprints1)}
+    values = np.zeros((len(row_index), len(column_index)))
+    fps2 = list(d_fingerprints2.values())
+    if fps2:
+        # Each column is computed with a single bulk similarity call
+        for h1, fp1 in d_fingerprints1.items():
+            values[:, column_index[h1]] = compute_bulk_similarity(fp1, fps2, similarity_name=similarity_name)
+    matrix = SimilarityMatrix(values=values, row_index=row_index, column_index=column_index)
+    return matrix.to_dataframe() if as_dataframe else matrix
 
 
 def compute_distance_matrix(syngraphs: list, ged_method: str, ged_params=None, parallelization=False,
-                            n_cpu=mp.cpu_count()):
+                            n_cpu=mp.cpu_count(), fingerprint_store=None, max_distance=None, ged_cache=None):
     """ To compute the distance matrix of a set of routes.
 
         :param:
             syngraphs: a list of SynGraph objects
-                The routes to use for computing the distance matrix
+                The routes to use for computing the distance matrix; PreparedRoute objects, built with the same
+                fingerprints parameters, can be passed instead
 
             ged_method: a string
                 It indicates which method to be used for computed the graph edit distance
@@ -487,42 +1361,210 @@ def compute_distance_matrix(syngraphs: list, ged_method: str, ged_params=None, p
             n_cpu: an integer (optional; default: 'mp.cpu_count()')
                 If parallelization is activated, it indicates the number of CPUs to be used
 
+            fingerprint_store: a FingerprintStore instance (optional; default: None)
+                If provided, the nodes fingerprints are shared with other runs; otherwise a new store is used, so that
+                each node fingerprint is computed once for the whole matrix
+
+            max_distance: a float (optional; default: None -> the 'max_distance' in ged_params is used)
+                If provided, only the distances up to this value are computed exactly; the cells whose distance is
+                above it are filled with PRUNED_DISTANCE
+
+            ged_cache: a GedResultCache instance (optional; default: None -> the cache defined in the GED_CACHE
+                       settings is used, if enabled)
+                If available, the distances already computed with the same GED method and parameters are retrieved
+                from it and the new ones are added to it
+
         :return:
-            matrix: a pandas DataFrame
-                The distance matrix, with dimensions (n routes x n routes), with the graph distances
+            matrix: a DistanceMatrix
+                The distance matrix, with dimensions (n routes x n routes), with the graph distances; it can be used
+                as a pandas DataFrame. The cells are described in its attributes (matrix.attrs) by their positions,
+                the n * (n - 1) / 2 condensed positions followed by the n positions of the diagonal (see
+                positions_to_cells and cells_mask_to_square). The 'timed_out_positions' attribute is a NumPy array with
+                the positions of the cells for which the time budget was reached, so that the value is an upper bound
+                of the distance; the 'prefiltered_positions' attribute is a NumPy array with the positions of the cells
+                whose lower bound is above the 'prefilter_cutoff' parameter, so that the value is the lower bound; the
+                'pruned_mask' attribute is a boolean NumPy array, True for the cells whose distance is above
+                'max_distance'; the 'exact_mask' attribute is a boolean NumPy array, True for the cells containing the
+                distance computed by the selected method. If a cache is used, the 'ged_cache' attribute contains the
+                number of hits and misses
     """
     if len(syngraphs) < 2:
         logger.error('Less than 2 routes were found: it is not possible to compute the distance matrix')
         raise TooFewRoutes
 
+    check_ged_method(ged_method)
+    ged_params = resolve_ged_params(ged_params)
+    if max_distance is not None:
+        ged_params['max_distance'] = max_distance
+    calculator = GedFactory().get_calculator(ged_method)
+    if calculator.vectorized:
+        # all the distances are computed at once: the routes do not need to be prepared and the cache is not used
+        matrix = calculator.compute_distances([get_route_syngraph(s) for s in syngraphs], ged_params)
+        if ged_params['max_distance'] is not None:
+            matrix.condensed[matrix.condensed > ged_params['max_distance']] = PRUNED_DISTANCE
+        set_distance_matrix_attrs(matrix)
+        return matrix
+    if fingerprint_store is None:
+        fingerprint_store = FingerprintStore()
+    if ged_cache is None:
+        ged_cache = get_default_ged_cache()
+
     routes = range(len(syngraphs))
-    matrix = pd.DataFrame(columns=routes, index=routes)
+    cells = [(i, j) for i in routes for j in routes if j >= i]
+    results = {}
+    if ged_cache is not None:
+        keys = [get_route_key(s) for s in syngraphs]
+        params_hash = ged_params_hash(ged_params)
+        hits_before, misses_before = ged_cache.hits, ged_cache.misses
+        cached = ged_cache.get_many([(keys[i], keys[j]) for i, j in cells], ged_method, params_hash)
+        results = {(i, j): cached[(keys[i], keys[j])] for i, j in cells if (keys[i], keys[j]) in cached}
+    missing_cells = [cell for cell in cells if cell not in results]
+
+    computed = compute_cells(syngraphs, missing_cells, ged_method, ged_params, parallelization, n_cpu,
+                             fingerprint_store)
+    new_results = {(i, j): (sim, timed_out, prefiltered) for i, j, sim, timed_out, prefiltered in computed}
+    results.update(new_results)
+
+    if ged_cache is not None:
+        ged_cache.put_many({(keys[i], keys[j]): result for (i, j), result in new_results.items()}, ged_method,
+                           params_hash)
+
+    matrix = DistanceMatrix(len(syngraphs))
+    timed_out_cells = []
+    prefiltered_cells = []
+    for (i, j), (sim, timed_out, prefiltered) in results.items():
+        matrix.set(i, j, sim)
+        if timed_out:
+            timed_out_cells.append((i, j))
+        if prefiltered:
+            prefiltered_cells.append((i, j))
+    if ged_cache is not None:
+        matrix.attrs['ged_cache'] = {'hits': ged_cache.hits - hits_before, 'misses': ged_cache.misses - misses_before}
+    set_distance_matrix_attrs(matrix, cells_to_positions(timed_out_cells, len(matrix)),
+                              cells_to_positions(prefiltered_cells, len(matrix)))
+    return matrix
+
+
+def compute_cells(syngraphs: list, cells: list, ged_method: str, ged_params: dict, parallelization=False,
+                  n_cpu=mp.cpu_count(), fingerprint_store=None) -> list:
+    """ To compute a list of cells of the distance matrix of a list of routes.
+
+        :param:
+            syngraphs: a list of SynGraph or PreparedRoute objects
+
+            cells: a list of (i, j) tuples indicating the cells to be computed
+
+            ged_method: a string indicating the algorithm to be used for GED calculations
+
+            ged_params: a dictionary with the complete set of GED parameters
+
+            parallelization: a boolean indicating whether parallelization should be used (optional; default: False)
+
+            n_cpu: an integer indicating the number of CPUs to be used (optional; default: 'mp.cpu_count()')
+
+            fingerprint_store: a FingerprintStore instance (optional; default: None -> a new one is created)
+
+        :return:
+            results: a list of (i, j, sim, timed_out, prefiltered) tuples
+    """
+    if GedFactory().get_calculator(ged_method).vectorized:
+        # the routes do not need to be prepared and each pair is cheap to compute
+        return [compute_cell_distance((i, j, syngraphs[i], syngraphs[j]), ged_method, ged_params)
+                for i, j in cells]
+    if fingerprint_store is None:
+        fingerprint_store = FingerprintStore()
+    # Each route is translated and the fingerprint of each node is computed only once, if needed
+    needed_routes = {i for cell in cells for i in cell}
+    prepared_routes = {i: syngraphs[i] if isinstance(syngraphs[i], PreparedRoute) else
+                       prepare_route(syngraphs[i], ged_params['reaction_fp'], ged_params['reaction_fp_params'],
+                                     ged_params['molecular_fp'], ged_params['molecular_fp_params'],
+                                     ged_params['molecular_fp_count_vect'], fingerprint_store)
+                       for i in sorted(needed_routes)}
 
     # Calculation with parallelization
     if parallelization:
-        results = []
-        pool = mp.Pool(n_cpu)
-        for i in routes:
-            in_routes = [(i, j, syngraphs[i], syngraphs[j]) for j in routes if j >= i]
-            results.append(pool.starmap(parallel_matrix_calculations,
-                                        [(tup, ged_method, ged_params) for tup in in_routes]))
-        pool.close()
+        return compute_cells_in_parallel(cells, prepared_routes, ged_method, ged_params, n_cpu)
+    # Calculation without parallelization
+    return [compute_cell_distance((i, j, prepared_routes[i], prepared_routes[j]), ged_method, ged_params)
+            for i, j in cells]
+
+
+def set_distance_matrix_attrs(matrix: DistanceMatrix, timed_out_positions=None, prefiltered_positions=None) -> None:
+    """ To set the attributes of a DistanceMatrix describing the cells that do not contain the exact distance, given
+        the positions of the timed out and of the prefiltered cells (see compute_distance_matrix) """
+    timed_out_positions = np.zeros(0, dtype=np.int64) if timed_out_positions is None else \
+        np.sort(np.asarray(timed_out_positions, dtype=np.int64))
+    prefiltered_positions = np.zeros(0, dtype=np.int64) if prefiltered_positions is None else \
+        np.sort(np.asarray(prefiltered_positions, dtype=np.int64))
+    matrix.attrs['timed_out_positions'] = timed_out_positions
+    if len(timed_out_positions):
+        logger.warning(f'The time budget was reached for {len(timed_out_positions)} pairs of routes: '
+                       f'their distance is an upper bound')
+    matrix.attrs['prefiltered_positions'] = prefiltered_positions
+    matrix.attrs['pruned_mask'] = np.concatenate([matrix.condensed == PRUNED_DISTANCE,
+                                                  matrix.diagonal == PRUNED_DISTANCE])
+    exact_mask = ~matrix.attrs['pruned_mask']
+    exact_mask[timed_out_positions] = False
+    exact_mask[prefiltered_positions] = False
+    matrix.attrs['exact_mask'] = exact_mask
+
+
+def cells_mask_to_square(mask: np.ndarray, n_routes: int) -> np.ndarray:
+    """ To get the square form (n routes x n routes) of a boolean mask of the cells of a distance matrix, given as the
+        n * (n - 1) / 2 condensed positions followed by the n positions of the diagonal """
+    n_condensed = n_routes * (n_routes - 1) // 2
+    square = squareform(mask[:n_condensed], checks=False)
+    np.fill_diagonal(square, mask[n_condensed:])
+    return square
+
+
+def positions_to_cells(positions, n_routes: int) -> tuple:
+    """ To convert positions in the cells of a distance matrix of n_routes routes, given as the condensed positions
+        followed by the diagonal, into the corresponding cells.
 
-        for result in results:
-            for t in result:
-                matrix.loc[t[1], t[0]] = t[2]
-                matrix.loc[t[0], t[1]] = t[2]
+        :param:
+            positions: a NumPy array of integers with the positions of the cells
 
-    # Calculation without parallelization
-    else:
-        for i in routes:
-            for j in routes:
-                if j >= i:
-                    sim = graph_distance_factory(syngraphs[i], syngraphs[j], ged_method=ged_method,
-                                                 ged_params=ged_params)
-                    matrix.loc[j, i] = sim
-                    matrix.loc[i, j] = sim
-    return matrix
+            n_routes: an integer indicating the number of routes
+
+        :return:
+            rows, columns: two NumPy arrays with the indices (i, j) of the cells, with i <= j
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    n_condensed = n_routes * (n_routes - 1) // 2
+    in_condensed = positions < n_condensed
+    rows = np.empty(len(positions), dtype=np.int64)
+    columns = np.empty(len(positions), dtype=np.int64)
+    rows[in_condensed], columns[in_condensed] = condensed_to_cells(positions[in_condensed], n_routes)
+    rows[~in_condensed] = columns[~in_condensed] = positions[~in_condensed] - n_condensed
+    return rows, columns
+
+
+def cells_to_positions(cells, n_routes: int) -> np.ndarray:
+    """ To convert a list of (i, j) cells of a distance matrix of n_routes routes into their positions, the condensed
+        positions followed by the diagonal (see positions_to_cells) """
+    cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2)
+    rows, columns = cells.min(axis=1), cells.max(axis=1)
+    condensed_positions = n_routes * rows - rows * (rows + 1) // 2 + columns - rows - 1
+    return np.where(rows == columns, n_routes * (n_routes - 1) // 2 + rows, condensed_positions)
+
+
+def condensed_to_cells(positions, n_routes: int) -> tuple:
+    """ To convert positions in the condensed distance matrix of n_routes routes into the corresponding cells.
+
+        :param:
+            positions: an integer or a NumPy array of integers with the positions in the condensed vector
+
+            n_routes: an integer indicating the number of routes
+
+        :return:
+            rows, columns: two NumPy arrays with the indices (i, j) of the cells, with i < j
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    rows = n_routes - 2 - np.floor(np.sqrt(-8 * positions + 4 * n_routes * (n_routes - 1) - 7) / 2.0 - 0.5)
+    rows = rows.astype(np.int64)
+    columns = positions + rows + 1 - n_routes * (n_routes - 1) // 2 + (n_routes - rows) * (n_routes - rows - 1) // 2
+    return rows, columns
 
 
 def parallel_matrix_calculations(data, ged_method, ged_params):
@@ -530,17 +1572,431 @@ def parallel_matrix_calculations(data, ged_method, ged_params):
 
         :param:
             data: a tuple (i, j, route1, route2)
-                It contains the two indices and the two routes for computing an element of the distance matrix
+                It contains the two indices and the two routes (SynGraph or PreparedRoute objects) for computing an
+                element of the distance matrix
 
         :return:
             i, j, sim: a tuple
                 It contains two indices of the matrix and the relative distance value
     """
-    (i, j, r1, r2) = data
-    sim = graph_distance_factory(r1, r2, ged_method=ged_method, ged_params=ged_params)
+    i, j, sim, _, _ = compute_cell_distance(data, ged_method, ged_params)
     return i, j, sim
 
 
+def compute_cell_distance(data, ged_method, ged_params):
+    """ To compute an element of the distance matrix, together with the status of the calculation.
+
+        :param:
+            data: a tuple (i, j, route1, route2)
+                It contains the two indices and the two routes (SynGraph or PreparedRoute objects) for computing an
+                element of the distance matrix
+
+        :return:
+            i, j, sim, timed_out, prefiltered: a tuple
+                It contains two indices of the matrix, the relative distance value and two booleans indicating whether
+                the time budget was reached and whether the GED calculation was skipped by the prefilter
+    """
+    (i, j, r1, r2) = data
+    sim, timed_out, prefiltered = compute_pair_distance(r1, r2, ged_method=ged_method, ged_params=ged_params)
+    return i, j, sim, timed_out, prefiltered
+
+
+# Routes and parameters of the worker processes, set once per process by _init_distance_worker
+_worker_data = {}
+
+
+def _init_distance_worker(prepared_routes: dict, ged_method: str, ged_params: dict):
+    """ To store the routes and the GED parameters in a worker process, so that they are sent only once """
+    _worker_data['routes'] = prepared_routes
+    _worker_data['ged_method'] = ged_method
+    _worker_data['ged_params'] = ged_params
+
+
+def _compute_worker_cell(cell: tuple) -> tuple:
+    """ To compute a cell of the distance matrix in a worker process initialized by _init_distance_worker """
+    i, j = cell
+    routes = _worker_data['routes']
+    return compute_cell_distance((i, j, routes[i], routes[j]), _worker_data['ged_method'],
+                                 _worker_data['ged_params'])
+
+
+def estimate_pair_cost(route1: PreparedRoute, route2: PreparedRoute) -> int:
+    """ To estimate the relative cost of computing the distance between two routes, as the product of their number
+        of nodes """
+    return route1.nx_graph.number_of_nodes() * route2.nx_graph.number_of_nodes()
+
+
+def compute_cells_in_parallel(cells: list, prepared_routes: dict, ged_method: str, ged_params: dict,
+                              n_cpu=mp.cpu_count(), chunksize=None) -> list:
+    """ To compute a set of cells of the distance matrix with a pool of worker processes. All the cells are submitted
+        at once, from the most to the least expensive one, so that the long calculations are started first and the
+        workers are kept busy until the end; each route is sent to each worker only once.
+
+        :param:
+            cells: a list of (i, j) tuples indicating the cells to be computed
+
+            prepared_routes: a dictionary mapping the indices of the routes to their PreparedRoute objects
+
+            ged_method: a string indicating the algorithm to be used for GED calculations
+
+            ged_params: a dictionary with the complete set of GED parameters
+
+            n_cpu: an integer indicating the number of CPUs to be used (optional; default: 'mp.cpu_count()')
+
+            chunksize: an integer indicating the number of cells sent to a worker at once (optional; default: None ->
+                       the cells are split in about 16 chunks per worker)
+
+        :return:
+            results: a list of (i, j, sim, timed_out, prefiltered) tuples, in order of completion
+    """
+    if not cells:
+        return []
+    n_workers = n_cpu or mp.cpu_count()
+    ordered_cells = sorted(cells, key=lambda c: estimate_pair_cost(prepared_routes[c[0]], prepared_routes[c[1]]),
+                           reverse=True)
+    if chunksize is None:
+        chunksize = max(1, len(ordered_cells) // (16 * n_workers))
+    # only the routes involved in the cells are sent to the workers
+    needed_routes = {i: prepared_routes[i] for cell in ordered_cells for i in cell}
+    pool = mp.Pool(n_workers, initializer=_init_distance_worker, initargs=(needed_routes, ged_method, ged_params))
+    try:
+        results = list(pool.imap_unordered(_compute_worker_cell, ordered_cells, chunksize=chunksize))
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
+
+
+SHARD_ROUTES_FILE = 'routes.pickle'
+
+
+def write_distance_shards(syngraphs: list, ged_method: str, directory, n_shards: int, ged_params=None,
+                          fingerprint_store=None) -> list:
+    """ To prepare the calculation of a distance matrix split in shards, which can be run independently, for example
+        on different machines sharing the directory. The prepared routes are serialized once, together with the GED
+        method and parameters; the cells of the matrix, including the diagonal, are assigned to the shards in turn,
+        so that each shard gets a similar mix of cheap and expensive pairs.
+
+        :param:
+            syngraphs: a list of SynGraph objects
+
+            ged_method: a string indicating the algorithm to be used for GED calculations
+
+            directory: a string or Path indicating the directory where the files are written
+
+            n_shards: an integer indicating the number of shards
+
+            ged_params: a dictionary (optional; default: None -> default parameters are used)
+
+            fingerprint_store: a FingerprintStore instance (optional; default: None)
+
+        :return:
+            task_files: the list of the Paths of the task files, one for each shard
+    """
+    if len(syngraphs) < 2:
+        logger.error('Less than 2 routes were found: it is not possible to compute the distance matrix')
+        raise TooFewRoutes
+    check_ged_method(ged_method)
+    ged_params = resolve_ged_params(ged_params)
+    if fingerprint_store is None:
+        fingerprint_store = FingerprintStore()
+    prepared_routes = [s if isinstance(s, PreparedRoute) else
+                       prepare_route(s, ged_params['reaction_fp'], ged_params['reaction_fp_params'],
+                                     ged_params['molecular_fp'], ged_params['molecular_fp_params'],
+                                     ged_params['molecular_fp_count_vect'], fingerprint_store) for s in syngraphs]
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    lio.write_pickle({'ged_method': ged_method, 'ged_params': ged_params, 'routes': prepared_routes},
+                     directory / SHARD_ROUTES_FILE)
+    task_files = []
+    for shard in range(n_shards):
+        task_file = directory / f'shard_{shard:05d}.json'
+        lio.write_json({'routes_file': SHARD_ROUTES_FILE, 'n_routes': len(prepared_routes), 'shard': shard,
+                        'n_shards': n_shards}, task_file)
+        task_files.append(task_file)
+    return task_files
+
+
+def get_shard_cells(shard: int, n_shards: int, n_routes: int) -> tuple:
+    """ To get the cells of the distance matrix assigned to a shard. The positions of the condensed matrix are
+        followed by the diagonal, and each shard takes one every n_shards positions.
+
+        :return:
+            positions, rows, columns: three NumPy arrays with the positions and the indices (i, j) of the cells
+    """
+    n_condensed = n_routes * (n_routes - 1) // 2
+    positions = np.arange(shard, n_condensed + n_routes, n_shards, dtype=np.int64)
+    return (positions, *positions_to_cells(positions, n_routes))
+
+
+def get_shard_result_file(task_file) -> Path:
+    """ To get the Path of the file with the result of a shard """
+    task_file = Path(task_file)
+    return task_file.with_name(f'{task_file.stem}_result.npz')
+
+
+def run_distance_shard(task_file, n_cpu=1) -> Path:
+    """ To compute the cells of the distance matrix assigned to a shard and write them to a partial result file.
+
+        :param:
+            task_file: a string or Path indicating the task file of the shard, written by write_distance_shards
+
+            n_cpu: an integer indicating the number of CPUs to be used (optional; default: 1)
+
+        :return:
+            result_file: the Path of the .npz file with the positions, values and flags of the computed cells
+    """
+    task_file = Path(task_file)
+    task = lio.read_json(task_file)
+    data = lio.read_pickle(task_file.parent / task['routes_file'])
+    positions, rows, columns = get_shard_cells(task['shard'], task['n_shards'], task['n_routes'])
+    cells = [(int(i), int(j)) for i, j in zip(rows, columns)]
+    routes = dict(enumerate(data['routes']))
+    if n_cpu > 1:
+        computed = {(i, j): result for i, j, *result in
+                    compute_cells_in_parallel(cells, routes, data['ged_method'], data['ged_params'], n_cpu)}
+    else:
+        computed = {(i, j): result for i, j, *result in
+                    [compute_cell_distance((i, j, routes[i], routes[j]), data['ged_method'],
+                                           data['ged_params']) for i, j in cells]}
+    results = [computed[cell] for cell in cells]
+    result_file = get_shard_result_file(task_file)
+    np.savez(result_file, positions=positions, values=np.array([r[0] for r in results], dtype=np.float32),
+             timed_out=np.array([r[1] for r in results], dtype=bool),
+             prefiltered=np.array([r[2] for r in results], dtype=bool))
+    return result_file
+
+
+def merge_distance_shards(directory) -> DistanceMatrix:
+    """ To assemble the distance matrix from the partial results of its shards.
+
+        :param:
+            directory: a string or Path indicating the directory containing the task and result files
+
+        :return:
+            matrix: a DistanceMatrix, with the same attributes set by compute_distance_matrix
+    """
+    task_files = sorted(Path(directory).glob('shard_*.json'))
+    if not task_files:
+        logger.error(f'No shard was found in {directory}')
+        raise MissingShardResult
+    n_routes = lio.read_json(task_files[0])['n_routes']
+    n_condensed = n_routes * (n_routes - 1) // 2
+    values = np.zeros(n_condensed + n_routes, dtype=np.float32)
+    timed_out = np.zeros(n_condensed + n_routes, dtype=bool)
+    prefiltered = np.zeros(n_condensed + n_routes, dtype=bool)
+    for task_file in task_files:
+        result_file = get_shard_result_file(task_file)
+        if not result_file.exists():
+            logger.error(f'The result of the shard {task_file} is missing')
+            raise MissingShardResult
+        with np.load(result_file) as result:
+            values[result['positions']] = result['values']
+            timed_out[result['positions']] = result['timed_out']
+            prefiltered[result['positions']] = result['prefiltered']
+
+    matrix = DistanceMatrix(n_routes, condensed=values[:n_condensed], diagonal=values[n_condensed:])
+    set_distance_matrix_attrs(matrix, np.flatnonzero(timed_out), np.flatnonzero(prefiltered))
+    return matrix
+
+
+class IncrementalDistanceMatrix:
+    """ Class holding a distance matrix keyed by the routes, to which new routes can be added without recomputing
+        the distances between the routes already in it. It can be saved to a file and loaded back.
+
+        The routes are identified by the key returned by get_route_key, which does not change between Python
+        processes. The distances are stored in condensed form, row by row of the lower triangle: the row of each new
+        route holds its distances from the routes added before it, so adding routes only appends to the storage.
+
+        Attributes:
+            ged_method: a string indicating the algorithm used to compute the graph edit distance
+
+            ged_params: a dictionary with the complete set of parameters used in the GED calculations
+
+            routes: a dictionary mapping the key of each route to the SynGraph instance, in order of insertion
+
+            diagonal: a NumPy array with the distance of each route from itself, in the same order as 'routes'
+
+            timed_out_pairs: a set of (key1, key2) tuples for which the time budget was reached
+
+            prefiltered_pairs: a set of (key1, key2) tuples for which the GED was skipped by the prefilter
+    """
+
+    def __init__(self, ged_method: str, ged_params=None):
+        """
+        Parameters:
+            ged_method: a string
+                It indicates which method to be used for computed the graph edit distance
+
+            ged_params: a dictionary (optional; default: None -> default parameters are used)
+                It contains the parameters for fingerprints and similarity calculations (see graph_distance_factory)
+        """
+        check_ged_method(ged_method)
+        self.ged_method = ged_method
+        self.ged_params = resolve_ged_params(ged_params)
+        self.routes = {}
+        self.diagonal = np.zeros(0, dtype=np.float32)
+        self.timed_out_pairs = set()
+        self.prefiltered_pairs = set()
+        self._condensed = np.zeros(0, dtype=np.float32)
+        self._n_distances = 0
+        self._prepared_routes = {}
+        self._fingerprint_store = FingerprintStore()
+
+    def __len__(self):
+        return len(self.routes)
+
+    def __contains__(self, key):
+        return key in self.routes
+
+    def __getstate__(self):
+        # the prepared routes and the fingerprints are rebuilt when needed; the unused capacity is not saved
+        state = self.__dict__.copy()
+        state['_condensed'] = self.condensed.copy()
+        state['_prepared_routes'] = {}
+        state['_fingerprint_store'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._fingerprint_store = FingerprintStore()
+
+    @property
+    def keys(self) -> list:
+        """ To get the list of the keys of the routes in the matrix """
+        return list(self.routes)
+
+    @property
+    def condensed(self) -> np.ndarray:
+        """ To get the distances between different routes, row by row of the lower triangle of the matrix """
+        return self._condensed[:self._n_distances]
+
+    def add_routes(self, syngraphs: list, parallelization=False, n_cpu=mp.cpu_count()) -> list:
+        """ To add new routes to the matrix. Only the distances between the new routes and between the new routes and
+            the ones already in the matrix are computed; the routes whose key is already in the matrix are ignored.
+
+            :param:
+                syngraphs: a list of SynGraph objects
+
+                parallelization: a boolean (optional; default: False)
+                    It indicates whether parallelization should be used
+
+                n_cpu: an integer (optional; default: 'mp.cpu_count()')
+                    If parallelization is activated, it indicates the number of CPUs to be used
+
+            :return:
+                new_keys: the list of the keys of the routes added to the matrix
+        """
+        new_routes = {}
+        for syngraph in syngraphs:
+            key = get_route_key(syngraph)
+            if key not in self.routes:
+                new_routes.setdefault(key, syngraph)
+        if not new_routes:
+            return []
+        old_keys = self.keys
+        new_keys = list(new_routes)
+        n = len(old_keys)
+        self.routes.update(new_routes)
+        # rows[k, i] is the distance between the k-th new route and the i-th route of the matrix
+        rows = np.zeros((len(new_keys), n + len(new_keys)), dtype=np.float32)
+
+        # Distances among the new routes
+        new_prepared = [self._get_prepared_route(key) for key in new_keys]
+        if len(new_keys) > 1:
+            block = compute_distance_matrix(new_prepared, self.ged_method, self.ged_params,
+                                            parallelization=parallelization, n_cpu=n_cpu)
+            rows[:, n:] = block.to_square()
+            for pairs, positions in [(self.timed_out_pairs, block.attrs['timed_out_positions']),
+                                     (self.prefiltered_pairs, block.attrs['prefiltered_positions'])]:
+                pairs.update((new_keys[i], new_keys[j]) for i, j in zip(*positions_to_cells(positions, len(block))))
+        else:
+            rows[0, n], timed_out, prefiltered = compute_pair_distance(new_prepared[0], new_prepared[0],
+                                                                       self.ged_method, self.ged_params)
+            self._record_status(new_keys[0], new_keys[0], timed_out, prefiltered)
+
+        # Distances between the routes already in the matrix and the new ones
+        keys = old_keys + new_keys
+        all_prepared = {i: self._get_prepared_route(key) for i, key in enumerate(keys)}
+        cross_cells = [(i, n + k) for i in range(n) for k in range(len(new_keys))]
+        if parallelization:
+            results = compute_cells_in_parallel(cross_cells, all_prepared, self.ged_method, self.ged_params, n_cpu)
+        else:
+            results = [compute_cell_distance((i, j, all_prepared[i], all_prepared[j]), self.ged_method,
+                                             self.ged_params) for i, j in cross_cells]
+        for i, j, sim, timed_out, prefiltered in results:
+            rows[j - n, i] = sim
+            self._record_status(keys[i], keys[j], timed_out, prefiltered)
+
+        self._append_distances(np.concatenate([rows[k, :n + k] for k in range(len(new_keys))]))
+        self.diagonal = np.concatenate([self.diagonal, rows[np.arange(len(new_keys)), n + np.arange(len(new_keys))]])
+        return new_keys
+
+    def to_distance_matrix(self) -> DistanceMatrix:
+        """ To get the distance matrix as a DistanceMatrix, with the routes in the same order as 'routes'. The
+            attributes are the same set by compute_distance_matrix. """
+        keys = self.keys
+        n_routes = len(keys)
+        # the cell (i, j), with i < j, is at position j * (j - 1) / 2 + i of the lower triangle storage
+        rows, columns = np.triu_indices(n_routes, k=1)
+        matrix = DistanceMatrix(n_routes, condensed=self.condensed[columns * (columns - 1) // 2 + rows],
+                                diagonal=self.diagonal)
+        positions = {key: n for n, key in enumerate(keys)}
+        set_distance_matrix_attrs(
+            matrix, cells_to_positions([(positions[a], positions[b]) for a, b in self.timed_out_pairs], n_routes),
+            cells_to_positions([(positions[a], positions[b]) for a, b in self.prefiltered_pairs], n_routes))
+        return matrix
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """ To get the distance matrix as a pandas DataFrame whose index and columns are the keys of the routes. The
+            attributes of the DataFrame are the same set by compute_distance_matrix. """
+        distances = self.to_distance_matrix()
+        matrix = pd.DataFrame(distances.to_square(), index=self.keys, columns=self.keys)
+        matrix.attrs = distances.attrs
+        return matrix
+
+    def save(self, file_path):
+        """ To save the matrix, together with its routes, to a pickle file """
+        lio.write_pickle(self, file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        """ To load a matrix saved with the 'save' method """
+        matrix = lio.read_pickle(file_path)
+        if not isinstance(matrix, cls):
+            logger.error(f'The file {file_path} does not contain an IncrementalDistanceMatrix')
+            raise TypeError
+        return matrix
+
+    def _append_distances(self, distances: np.ndarray):
+        """ To append distances to the condensed storage, doubling its capacity when it is full """
+        end = self._n_distances + len(distances)
+        if end > len(self._condensed):
+            storage = np.empty(max(end, 2 * len(self._condensed)), dtype=np.float32)
+            storage[:self._n_distances] = self.condensed
+            self._condensed = storage
+        self._condensed[self._n_distances:end] = distances
+        self._n_distances = end
+
+    def _get_prepared_route(self, key) -> PreparedRoute:
+        """ To get the PreparedRoute of a route in the matrix, building it if needed """
+        if key not in self._prepared_routes:
+            self._prepared_routes[key] = prepare_route(
+                self.routes[key], self.ged_params['reaction_fp'], self.ged_params['reaction_fp_params'],
+                self.ged_params['molecular_fp'], self.ged_params['molecular_fp_params'],
+                self.ged_params['molecular_fp_count_vect'], self._fingerprint_store)
+        return self._prepared_routes[key]
+
+    def _record_status(self, key1, key2, timed_out: bool, prefiltered: bool):
+        if timed_out:
+            self.timed_out_pairs.add((key1, key2))
+        if prefiltered:
+            self.prefiltered_pairs.add((key1, key2))
+
+
 def get_available_ged_algorithms():
     """ Returns a dictionary with the available GED algorithms and some info"""
     return {f: additional_info['info'] for f, additional_info in GedFactory.available_ged.items()}
@@ -135,3 +135,24 @@ def test_degree_sequence():
         iron.add_edge(id_e, edge)
 
     assert iron.get_degree_sequence() == [4, 4, 4, 3, 3, 3, 2, 2, 2, 2, 1, 1, 1, 1, 1]
+
+
+def test_adjacency_indexes():
+    """ To test that the adjacency indexes of an Iron instance are kept up to date when edges are added or replaced.
+        """
+    iron = Iron()
+    for n in ['1', '2', '3']:
+        iron.add_node(n, Node(iid=n, properties={'id': n}, labels=[]))
+    iron.add_edge('1', Edge(iid='1', a_iid='2', b_iid='1', direction=Direction('2>1'), properties={}, labels=[]))
+    iron.add_edge('2', Edge(iid='2', a_iid='3', b_iid='1', direction=Direction('3>1'), properties={}, labels=[]))
+    assert iron.get_child_nodes('1') == ['2', '3']
+    assert iron.get_parent_nodes('2') == ['1']
+    assert sorted(iron.get_neighbors('1')) == ['2', '3']
+    assert iron.get_edge_id('3', '1') == ['2']
+
+    # replacing an edge removes the old connection from the indexes
+    iron.add_edge('2', Edge(iid='2', a_iid='3', b_iid='2', direction=Direction('3>2'), properties={}, labels=[]))
+    assert iron.get_child_nodes('1') == ['2']
+    assert iron.get_child_nodes('2') == ['3']
+    assert iron.get_edge_id('1', '3') == []
+    assert iron.get_degree_sequence() == [2, 1, 1]
@@ -5,10 +5,12 @@ import pytest
 from linchemin.cgu.syngraph import (BipartiteSynGraph, MonopartiteMolSynGraph,
                                     MonopartiteReacSynGraph,
                                     extract_reactions_from_syngraph,
-                                    merge_syngraph)
+                                    get_reaction_instance,
+                                    group_iron_connections, merge_syngraph)
 from linchemin.cgu.translate import translator
 from linchemin.cheminfo.constructors import (ChemicalEquationConstructor,
-                                             MoleculeConstructor)
+                                             MoleculeConstructor,
+                                             chemical_equation_cache)
 
 
 def test_bipartite_syngraph_instance(az_path):
@@ -261,3 +263,27 @@ def test_hashing(ibm2_path):
 
     syngraph_mpm = translator('ibm_retro', graph[0], 'syngraph', 'bipartite')
     assert syngraph_mpm.uid[:2] == 'BP'
+
+
+def test_group_iron_connections(az_path):
+    """ To test that the edges of an Iron instance are correctly grouped by product and by reactant. """
+    graph = json.loads(open(az_path).read())
+    iron = translator('az_retro', graph[0], 'iron', out_data_model='bipartite')
+    connections, reactants_of, products_of, smiles = group_iron_connections(iron)
+    assert len(connections) == iron.i_edge_number()
+    for reactant, product in connections:
+        assert reactant in reactants_of[product]
+        assert product in products_of[reactant]
+        assert smiles[reactant] == iron.nodes[reactant].properties['node_smiles']
+    assert sum(len(r) for r in reactants_of.values()) == len(connections)
+
+
+def test_reaction_instance_cache():
+    """ To test that repeated reactions share the same ChemicalEquation instance. """
+    chemical_equation_cache.clear()
+    ce1 = get_reaction_instance(['CC(=O)O', 'CCN'], ['CCNC(C)=O'])
+    ce2 = get_reaction_instance(['CCN', 'CC(=O)O'], ['CCNC(C)=O'])
+    assert ce1 is ce2
+    assert chemical_equation_cache.get_stats()['hits'] == 1
+    ce3 = get_reaction_instance(['CCN', 'CC(=O)Cl'], ['CCNC(C)=O'])
+    assert ce3 != ce1
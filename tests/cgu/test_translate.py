@@ -9,7 +9,8 @@ import pytest
 
 from linchemin.cgu.iron import Direction, Edge, Iron, Node
 from linchemin.cgu.syngraph import BipartiteSynGraph, MonopartiteReacSynGraph
-from linchemin.cgu.translate import (TranslationError, az_dict_to_iron,
+from linchemin.cgu.translate import (TranslationError, TranslatorFactory,
+                                     az_dict_to_iron,
                                      get_available_data_models,
                                      get_available_formats, get_input_formats,
                                      get_output_formats, ibm_dict_to_iron,
@@ -231,6 +232,37 @@ def test_iron_to_mp_syngraph(az_path):
                                                '=O)CC1']
 
 
+def test_syngraph_to_iron(az_path):
+    """ To test that the SynGraph -> Iron transformation creates one node for each SynGraph node and one edge for each
+        connection, for all the data models. """
+    graph_az = json.loads(open(az_path).read())
+    for data_model in ['bipartite', 'monopartite_reactions', 'monopartite_molecules']:
+        syngraph = translator('az_retro', graph_az[0], 'syngraph', out_data_model=data_model)
+        iron = translator('syngraph', syngraph, 'iron', out_data_model=data_model)
+        assert iron.i_node_number() == len(syngraph.graph)
+        assert iron.i_edge_number() == sum(len(connections) for connections in syngraph.graph.values())
+        for edge in iron.edges.values():
+            parent = iron.nodes[edge.a_iid].properties['node_class']
+            child = iron.nodes[edge.b_iid].properties['node_class']
+            assert child in syngraph[parent]
+
+
+def test_syngraph_to_nx_fast_path(az_path, ibm1_path):
+    """ To test that the direct SynGraph -> Networkx translation gives the same graph obtained through Iron. """
+    graphs = [('az_retro', g) for g in json.loads(open(az_path).read())[:3]] + \
+             [('ibm_retro', g) for g in json.loads(open(ibm1_path).read())[:3]]
+    factory = TranslatorFactory()
+    for data_model in ['bipartite', 'monopartite_reactions', 'monopartite_molecules']:
+        for input_format, graph in graphs:
+            syngraph = translator(input_format, graph, 'syngraph', out_data_model=data_model)
+            nx_graph = translator('syngraph', syngraph, 'networkx', out_data_model=data_model)
+            iron = factory.select_translation_to_iron('syngraph', syngraph, data_model)
+            nx_graph_iron = factory.select_translation_from_iron('networkx', iron, data_model)
+            assert list(nx_graph.nodes(data=True)) == list(nx_graph_iron.nodes(data=True))
+            assert list(nx_graph.edges(data=True)) == list(nx_graph_iron.edges(data=True))
+            assert nx_graph.graph == nx_graph_iron.graph
+
+
 def test_one_node_iron_to_nx(ibm1_path):
     graph_ibm = json.loads(open(ibm1_path).read())
     mp_syngraph = translator('ibm_retro', graph_ibm[0], 'syngraph', out_data_model='monopartite_reactions')
@@ -3,7 +3,9 @@ from rdkit.Chem import DataStructs, rdChemReactions
 
 import linchemin.cheminfo.functions as cif
 from linchemin.cheminfo.chemical_similarity import (
-    compute_mol_fingerprint, compute_reaction_fingerprint, compute_similarity)
+    FingerprintStore, compute_bulk_similarity, compute_mol_fingerprint,
+    compute_reaction_fingerprint, compute_similarity)
+from linchemin.cheminfo.constructors import MoleculeConstructor
 
 
 def test_rdkit_reaction_fingerprints_basics_non_mapped_molecules():
@@ -165,3 +167,33 @@ def test_mol_fp_factory():
     parameters = {'fpSize': 1024, 'countSimulation': True}
     fp_rdkit_params = compute_mol_fingerprint(rdmol, 'rdkit', parameters=parameters)
     assert fp_rdkit_params != fp_rdkit
+
+
+def test_fingerprint_store():
+    molecule = MoleculeConstructor(molecular_identity_property_name='smiles').build_from_molecule_string(
+        molecule_string='CNC(C)=O', inp_fmt='smiles')
+    store = FingerprintStore()
+    fp1 = store.get_molecular_fingerprint(molecule, 'rdkit')
+    fp2 = store.get_molecular_fingerprint(molecule, 'rdkit')
+    assert fp1 is fp2 and len(store) == 1
+    assert fp1 == compute_mol_fingerprint(molecule.rdmol, 'rdkit')
+
+    # different parameters or count flag give different entries
+    store.get_molecular_fingerprint(molecule, 'rdkit', parameters={'fpSize': 1024})
+    store.get_molecular_fingerprint(molecule, 'rdkit', count_fp_vector=True)
+    assert len(store) == 3
+
+    store.clear()
+    assert len(store) == 0
+
+
+def test_similarity_names():
+    fps = [compute_mol_fingerprint(cif.rdmol_from_string(smiles, inp_fmt='smiles'), 'rdkit')
+           for smiles in ['CNC(C)=O', 'CCO', 'CNC(C)=O']]
+    assert compute_bulk_similarity(fps[0], fps, 'tanimoto') == [compute_similarity(fps[0], fp, 'tanimoto')
+                                                                  for fp in fps]
+    # an unavailable similarity raises the same error in the scalar and in the bulk calculation
+    for similarity in [compute_similarity, compute_bulk_similarity]:
+        with pytest.raises(KeyError) as ke:
+            similarity(fps[0], fps if similarity is compute_bulk_similarity else fps[1], 'wrong_similarity')
+        assert 'tanimoto' in str(ke.value)
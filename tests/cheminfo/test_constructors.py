@@ -8,12 +8,14 @@ import linchemin.cheminfo.functions as cif
 from linchemin.cheminfo.constructors import (BadMapping,
                                              ChemicalEquationConstructor,
                                              DisconnectionConstructor,
+                                             InstanceCache,
                                              MoleculeConstructor,
                                              PatternConstructor,
                                              RatamConstructor,
                                              TemplateConstructor,
                                              UnavailableMolIdentifier,
-                                             calculate_molecular_hash_values)
+                                             calculate_molecular_hash_values,
+                                             molecule_cache)
 from linchemin.cheminfo.models import Template
 from linchemin.IO import io as lio
 from linchemin.utilities import create_hash
@@ -1552,3 +1554,36 @@ def test_disconnection_depiction():
         # depiction_data = cid.draw_reaction(rdrxn=rdrxn, )
         # lio.write_rdkit_depict(data=depiction_data, file_path=f"{item.get('name')}_reaction.png")
         # print(f"\n{item.get('name')} {disconnection.__dict__}")
+
+
+def test_molecule_cache():
+    molecule_cache.clear()
+    molecule_constructor = MoleculeConstructor(molecular_identity_property_name='smiles')
+    mol1 = molecule_constructor.build_from_molecule_string(molecule_string='CCO', inp_fmt='smiles')
+    mol2 = molecule_constructor.build_from_molecule_string(molecule_string='CCO', inp_fmt='smiles')
+    assert mol1 is mol2
+    # the first molecule is missing both as string and as rdkit Mol
+    assert molecule_cache.get_stats()['hits'] == 1 and molecule_cache.get_stats()['misses'] == 2
+
+    # a different string of the same molecule and its rdkit Mol share the Molecule instance
+    assert molecule_constructor.build_from_molecule_string(molecule_string='OCC', inp_fmt='smiles') is mol1
+    assert molecule_constructor.build_from_rdmol(rdmol=cif.Chem.MolFromSmiles('C(C)O')) is mol1
+    # the atom mapping is part of the identity of the rdkit Mol
+    mapped = molecule_constructor.build_from_rdmol(rdmol=cif.Chem.MolFromSmiles('[CH3:1][CH2:2][OH:3]'))
+    assert mapped is not mol1 and mapped.uid == mol1.uid
+
+    # a different identity property gives a different Molecule instance
+    mol3 = MoleculeConstructor(molecular_identity_property_name='inchi_key').build_from_molecule_string(
+        molecule_string='CCO', inp_fmt='smiles')
+    assert mol3 is not mol1
+
+    # the least recently used molecule is discarded when the cache is full
+    cache = InstanceCache(maxsize=2)
+    cache.put('a', mol1)
+    cache.put('b', mol2)
+    cache.get('a')
+    cache.put('c', mol3)
+    assert len(cache) == 2 and cache.get('b') is None and cache.get('a') is mol1
+
+    molecule_cache.clear()
+    assert len(molecule_cache) == 0 and molecule_cache.get_stats()['hits'] == 0
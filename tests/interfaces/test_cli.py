@@ -1,6 +1,14 @@
+import json
 import os
 import unittest.mock
 
+import numpy as np
+
+from linchemin.cgu.translate import translator
+from linchemin.interfaces.cli import distance_shard_cli
+from linchemin.rem.graph_distance import (compute_distance_matrix,
+                                          write_distance_shards)
+
 
 def test_cli_basic(capfd, cli):
     cli_str = str(cli)
@@ -19,3 +27,17 @@ def test_cli(capfd, cli, mit_path):
     assert 'Translating the routes in the input file to a list of SynGraph....' in out
     os.remove('routes.json')
     os.remove('tree.json')
+
+
+def test_distance_shard_cli(capfd, az_path, tmp_path):
+    graph = json.loads(open(az_path).read())
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='monopartite_reactions') for g in graph[:4]]
+    task_files = write_distance_shards(syngraphs, 'nx_ged', tmp_path, n_shards=2)
+    for task_file in task_files:
+        distance_shard_cli(['run', str(task_file)])
+    output = tmp_path / 'matrix.npz'
+    distance_shard_cli(['merge', str(tmp_path), '-output', str(output)])
+    out, err = capfd.readouterr()
+    assert 'Distance matrix of 4 routes' in out
+    with np.load(output) as data:
+        assert np.array_equal(data['condensed'], compute_distance_matrix(syngraphs, 'nx_ged').condensed)
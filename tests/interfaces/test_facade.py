@@ -5,6 +5,7 @@ import unittest.mock
 import pandas as pd
 from rdkit.Chem import rdChemReactions
 
+import linchemin.rem.graph_distance as graph_distance
 from linchemin.cgu.syngraph import BipartiteSynGraph, MonopartiteReacSynGraph
 from linchemin.interfaces.facade import facade, facade_helper
 
@@ -64,6 +65,19 @@ def test_ged(az_path):
     assert meta3['errors'] != []
 
 
+def test_ged_cache(az_path, tmp_path, monkeypatch):
+    graph = json.loads(open(az_path).read())
+    routes_mp, m = facade('translate', 'az_retro', graph, out_format='syngraph',
+                          out_data_model='monopartite_reactions')
+    cache = graph_distance.GedResultCache(tmp_path / 'ged.sqlite')
+    monkeypatch.setattr(graph_distance, 'get_default_ged_cache', lambda: cache)
+    d1, meta1 = facade('distance_matrix', routes_mp, ged_method='nx_ged')
+    assert meta1['ged_cache_hits'] == 0 and meta1['ged_cache_misses'] == 21
+    d2, meta2 = facade('distance_matrix', routes_mp, ged_method='nx_ged')
+    assert meta2['ged_cache_hits'] == 21 and meta2['ged_cache_misses'] == 0
+    assert d2.equals(d1)
+
+
 @unittest.mock.patch('linchemin.interfaces.facade.get_clustered_routes_metrics')
 @unittest.mock.patch('linchemin.rem.clustering.AgglomerativeClusterCalculator.get_clustering')
 def test_clustering(mock_clusterer, mock_metrics, az_path):
@@ -107,6 +121,26 @@ def test_clustering_parallelization(az_path):
     assert all(cluster4[0].labels_) is not None
 
 
+def test_clustering_wl_kernel(az_path):
+    graph = json.loads(open(az_path).read())
+    routes, m = facade('translate', 'az_retro', graph, out_format='syngraph',
+                       out_data_model='monopartite_reactions')
+    cluster, meta = facade('clustering', routes, ged_method='wl_kernel', clustering_method='agglomerative_cluster')
+    assert len(cluster[0].labels_) == len(routes)
+    assert meta['ged_algorithm'] == 'wl_kernel'
+    assert meta['silhouette'] == {'mode': 'full', 'sample_size': len(routes), 'metric': 'ged'}
+
+
+def test_clustering_knn_graph(ibm1_path):
+    graph = json.loads(open(ibm1_path).read())
+    routes, m = facade('translate', 'ibm_retro', graph, out_format='syngraph',
+                       out_data_model='monopartite_reactions')
+    cluster, meta = facade('clustering', routes, ged_method='nx_ged', clustering_method='knn_graph', n_neighbors=3,
+                           min_cluster_size=2)
+    assert len(cluster[0].labels_) == len(routes) - meta['invalid_routes']
+    assert meta['silhouette'] == cluster[0].silhouette_info
+
+
 def test_subset(az_path):
     graph = json.loads(open(az_path).read())
     routes, meta = facade('translate', 'az_retro', graph, out_format='syngraph',
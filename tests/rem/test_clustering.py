@@ -1,11 +1,28 @@
 import json
 
+import numpy as np
+import pandas as pd
 import pytest
+from scipy.spatial.distance import pdist, squareform
+from sklearn.metrics import silhouette_score
 
+import linchemin.rem.graph_distance as graph_distance
 from linchemin.cgu.translate import translator
-from linchemin.rem.clustering import (ClusteringError, clusterer,
+from linchemin.rem.clustering import (ClusteringError, ClusterModel,
+                                      KnnGraphClusterCalculator,
+                                      build_distance_graph,
+                                      clamp_pruned_distances,
+                                      cluster_distance_graph, clusterer,
+                                      compute_silhouette_score,
+                                      compute_silhouette_scores,
                                       get_available_clustering,
-                                      get_clustered_routes_metrics)
+                                      get_clustered_routes_metrics,
+                                      get_silhouette_info,
+                                      get_stratified_sample,
+                                      optimize_agglomerative_cluster)
+from linchemin.rem.graph_distance import (PRUNED_DISTANCE, DistanceMatrix,
+                                          compute_distance_matrix)
+from linchemin.rem.route_descriptors import descriptor_calculator
 
 
 def test_clusterer(az_path):
@@ -56,8 +73,181 @@ def test_get_cluster_metrics(az_path):
                                  clustering_method='agglomerative_cluster')
     df = get_clustered_routes_metrics(syngraphs, cluster1)
     assert len(df) == len(syngraphs)
+    assert list(df['cluster']) == sorted(cluster1.labels_)
+    for _, row in df.iterrows():
+        route = next(g for g in syngraphs if g.source == row['routes_id'])
+        assert row['n_steps'] == descriptor_calculator(route, 'nr_steps')
+        assert row['n_branch'] == descriptor_calculator(route, 'nr_branches')
+
+    # bipartite routes give the same metrics
+    bp_syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='bipartite') for g in graph]
+    df_bp = get_clustered_routes_metrics(bp_syngraphs, cluster1)
+    assert df_bp[['cluster', 'n_steps', 'n_branch']].equals(df[['cluster', 'n_steps', 'n_branch']])
+
+    # the descriptors already computed for the same routes are reused
+    routes_descriptors = pd.DataFrame({'route_id': [g.source for g in syngraphs],
+                                       'nr_steps': range(len(syngraphs))})
+    df_reused = get_clustered_routes_metrics(syngraphs, cluster1, routes_descriptors)
+    assert sorted(df_reused['n_steps']) == list(range(len(syngraphs)))
+    assert list(df_reused['n_branch']) == list(df['n_branch'])
+    # descriptors of different routes are ignored
+    assert get_clustered_routes_metrics(syngraphs, cluster1, routes_descriptors[:2]).equals(df)
+
+
+def test_optimize_agglomerative_cluster():
+    rng = np.random.default_rng(0)
+    points = rng.normal(size=(30, 2))
+    points[:10] += 10
+    points[10:20] -= 10
+    dist_matrix = squareform(pdist(points))
+    labelings = [rng.integers(0, k, len(points)) for k in [2, 3, 6]]
+    assert np.allclose(compute_silhouette_scores(dist_matrix, labelings),
+                       [silhouette_score(dist_matrix, labels, metric='precomputed') for labels in labelings])
+
+    # the linkage is cut at each number of clusters, and the best one is selected
+    clustering, score, n_cluster = optimize_agglomerative_cluster(dist_matrix, 'average')
+    assert n_cluster == 3 and clustering.n_clusters_ == 3
+    assert sorted(np.unique(clustering.labels_)) == [0, 1, 2]
+    assert score == pytest.approx(silhouette_score(dist_matrix, clustering.labels_, metric='precomputed'))
+    clustering, score, n_cluster = optimize_agglomerative_cluster(dist_matrix, 'average', max_n_clusters=2)
+    assert n_cluster == 2
+    assert optimize_agglomerative_cluster(dist_matrix[:2, :2], 'average')[0] is None
+
+
+def test_sampled_silhouette():
+    rng = np.random.default_rng(0)
+    points = rng.normal(size=(200, 2))
+    points[:80] += 3
+    dist_matrix = DistanceMatrix(200, condensed=pdist(points).astype(np.float32))
+    labels = rng.integers(0, 4, len(points))
+    labels[:80] = 4
+    # the scores computed in chunks from the condensed matrix are the same as the full ones
+    expected = silhouette_score(squareform(pdist(points)), labels, metric='precomputed')
+    assert compute_silhouette_scores(dist_matrix, [labels], chunk_size=7)[0] == pytest.approx(expected, abs=1e-5)
+    assert compute_silhouette_score(dist_matrix, labels, sample_size=1000) == pytest.approx(expected, abs=1e-5)
+
+    # the sample is stratified by cluster
+    sample = get_stratified_sample(labels, 50)
+    assert len(sample) == len(set(sample)) == 50
+    assert list(np.bincount(labels[sample])) == [round(50 * c / 200) for c in np.bincount(labels)]
+    assert get_silhouette_info(200, 50) == {'mode': 'sampled', 'sample_size': 50, 'metric': 'ged'}
+    assert get_silhouette_info(200) == {'mode': 'full', 'sample_size': 200, 'metric': 'ged'}
+    score = compute_silhouette_score(dist_matrix, labels, sample_size=50)
+    assert score == compute_silhouette_score(dist_matrix, labels, sample_size=50)
+    assert score == pytest.approx(silhouette_score(squareform(pdist(points[sample])), labels[sample],
+                                                   metric='precomputed'), abs=1e-5)
+
+
+def test_pruned_distances(az_path):
+    graph = json.loads(open(az_path).read())
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='monopartite_reactions') for g in graph]
+    matrix = compute_distance_matrix(syngraphs, ged_method='nx_ged')
+    max_distance = float(np.median(matrix.condensed))
+    pruned = compute_distance_matrix(syngraphs, ged_method='nx_ged', max_distance=max_distance)
+    assert pruned.attrs['pruned_mask'].any()
+    # the pruned cells are replaced by a finite distance, larger than all the computed ones
+    clamped = clamp_pruned_distances(pruned.condensed)
+    assert np.isfinite(clamped).all()
+    assert np.isinf(pruned.condensed).any()
+    assert clamped.max() == pytest.approx(pruned.condensed[np.isfinite(pruned.condensed)].max() + 1.0)
+    # the routes can be clustered with a distance threshold
+    for clustering_method in ['agglomerative_cluster', 'knn_graph']:
+        cluster, score = clusterer(syngraphs, ged_method='nx_ged', clustering_method=clustering_method,
+                                   ged_params={'max_distance': max_distance}, min_cluster_size=2)
+        assert len(cluster.labels_) == len(syngraphs)
+        assert -1.0 <= score <= 1.0
+
+
+def test_cluster_distance_graph():
+    # two triangles linked by a long edge, a pair of identical routes and an isolated route
+    rows = np.array([0, 1, 0, 3, 4, 3, 2, 6, 7])
+    columns = np.array([1, 2, 2, 4, 5, 5, 3, 7, 8])
+    values = np.array([0.1, 0.1, 0.2, 0.1, 0.1, 0.2, 5.0, 0.0, PRUNED_DISTANCE])
+    graph = build_distance_graph(9, rows, columns, values)
+    assert (graph != graph.T).nnz == 0 and graph.nnz == 16
+    assert graph[6, 7] > 0.0 and graph[7, 8] == 0.0
+
+    labels = cluster_distance_graph(graph, graph_clustering='connected_components', min_cluster_size=2)
+    assert list(labels) == [0, 0, 0, 0, 0, 0, 1, 1, -1]
+    labels = cluster_distance_graph(graph, graph_clustering='connected_components', min_cluster_size=3,
+                                    distance_threshold=1.0)
+    assert list(labels) == [0, 0, 0, 1, 1, 1, -1, -1, -1]
+    labels = cluster_distance_graph(graph, graph_clustering='hdbscan', min_cluster_size=3, n_neighbors=2)
+    assert labels[0] == labels[1] == labels[2] != labels[3] == labels[4] == labels[5]
+    assert list(labels[6:]) == [-1, -1, -1]
+    with pytest.raises(ClusteringError):
+        cluster_distance_graph(graph, graph_clustering='some_clustering')
+
+
+def test_knn_graph_clustering(ibm1_path):
+    graph = json.loads(open(ibm1_path).read())
+    syngraphs = [translator('ibm_retro', g, 'syngraph', out_data_model='monopartite_reactions') for g in graph]
+    syngraphs = [s for s in syngraphs if s is not None]
+    clustering, score, distance_graph = clusterer(syngraphs, ged_method='nx_ged', clustering_method='knn_graph',
+                                                  n_neighbors=3, min_cluster_size=2, save_dist_matrix=True)
+    assert len(clustering.labels_) == len(syngraphs) and 0 in clustering.labels_
+    # the silhouette score is computed with the cosine distances of the embedding
+    assert clustering.silhouette_info == {'mode': 'full', 'sample_size': len(syngraphs),
+                                          'metric': 'embedding_cosine'}
+    # the distance is computed only for the pairs of neighbours, and it is the same as in the full matrix
+    assert distance_graph.nnz <= 2 * 3 * len(syngraphs)
+    dist_matrix = compute_distance_matrix(syngraphs, ged_method='nx_ged')
+    for i, j in zip(*distance_graph.nonzero()):
+        assert distance_graph[i, j] == pytest.approx(max(dist_matrix.get(i, j), 1e-8), abs=1e-6)
+    assert -1.0 <= score <= 1.0
+
+    clustering_wl, _ = clusterer(syngraphs, ged_method='nx_ged', clustering_method='knn_graph', n_neighbors=3,
+                                 min_cluster_size=2, knn_embedding='wl', graph_clustering='connected_components')
+    assert len(clustering_wl.labels_) == len(syngraphs)
+
+    # the graph can be extracted from a precomputed distance matrix as well
+    clustering_dense, _ = KnnGraphClusterCalculator().get_clustering(dist_matrix, False, n_neighbors=3,
+                                                                     min_cluster_size=2)
+    assert clustering_dense.distance_graph.nnz <= 2 * 3 * len(syngraphs)
+    assert clustering_dense.silhouette_info['metric'] == 'ged'
+
+
+def test_cluster_model(ibm1_path, tmp_path, monkeypatch):
+    graph = json.loads(open(ibm1_path).read())
+    syngraphs = [translator('ibm_retro', g, 'syngraph', out_data_model='monopartite_reactions') for g in graph]
+    syngraphs = [s for s in syngraphs if s is not None]
+    clustered, new_routes = syngraphs[:8], syngraphs[8:]
+    clustering, score, dist_matrix = clusterer(clustered, ged_method='nx_ged',
+                                               clustering_method='agglomerative_cluster', save_dist_matrix=True)
+    model = ClusterModel.from_clustering(clustered, clustering, 'nx_ged', dist_matrix=dist_matrix)
+    n_clusters = len(set(clustering.labels_))
+    assert len(model) == n_clusters
+    assert sum(model.sizes.values()) == len(clustered)
+    # the threshold is the largest distance of a route from the medoid of its cluster
+    square = dist_matrix.to_square()
+    assert model.novelty_threshold == pytest.approx(
+        max(square[i, clustered.index(model.exemplars[label][0])]
+            for i, label in enumerate(clustering.labels_)), abs=1e-6)
+    # the same medoids are found if the distances are computed again
+    model_computed = ClusterModel.from_clustering(clustered, clustering, 'nx_ged')
+    assert all(model_computed.exemplars[label][0] is model.exemplars[label][0] for label in model.exemplars)
+
+    model.save(tmp_path / 'model.pickle')
+    model = ClusterModel.load(tmp_path / 'model.pickle')
+
+    # the distances are computed only from the exemplars
+    calls = []
+    original = graph_distance.compute_pair_distance
+    monkeypatch.setattr(graph_distance, 'compute_pair_distance', lambda *args, **kwargs: calls.append(1) or
+                        original(*args, **kwargs))
+    labels = model.assign(clustered[:2])
+    assert list(labels) == list(clustering.labels_[:2])
+    assert len(calls) == 2 * n_clusters
+
+    # routes far from all the exemplars open new clusters
+    strict_model = ClusterModel.from_clustering(clustered, clustering, 'nx_ged', dist_matrix=dist_matrix,
+                                                novelty_threshold=0.0)
+    labels = strict_model.assign(new_routes + new_routes[:1])
+    assert labels[0] == n_clusters and labels[-1] == labels[0]
+    assert len(strict_model) == n_clusters + len(new_routes)
+    assert strict_model.sizes[n_clusters] == 2
 
 
 def test_get_available_clustering():
     assert type(get_available_clustering()) == dict and \
-           'hdbscan' in get_available_clustering()
+           'hdbscan' in get_available_clustering() and 'knn_graph' in get_available_clustering()
@@ -1,21 +1,55 @@
 import json
+import multiprocessing as mp
+import os
+import subprocess
+import sys
+import time
+from functools import partial
 
 import networkx as nx
 import numpy as np
 import pandas as pd
 import pytest
 from rdkit.Chem import rdChemReactions
+from scipy.spatial.distance import squareform
 
+import linchemin.rem.graph_distance as graph_distance
 from linchemin.cgu.convert import converter
 from linchemin.cgu.translate import translator
-from linchemin.rem.graph_distance import (GraphDistanceError,
+from linchemin.cheminfo.chemical_similarity import (FingerprintStore,
+                                                    compute_similarity)
+from linchemin.rem.graph_distance import (PRUNED_DISTANCE, DistanceMatrix,
+                                          GedNx, GedResultCache,
+                                          GraphDistanceError,
+                                          IncrementalDistanceMatrix,
                                           build_similarity_matrix,
+                                          cells_mask_to_square,
+                                          cells_to_positions,
+                                          compute_cells_in_parallel,
+                                          compute_cosine_distance_matrix,
                                           compute_distance_matrix,
+                                          compute_fingerprint_features,
+                                          compute_ged_lower_bound,
                                           compute_nodes_fingerprints,
+                                          compute_set_lower_bound,
+                                          compute_wl_distance_matrix,
+                                          compute_wl_features,
+                                          condensed_to_cells,
+                                          estimate_pair_cost,
                                           get_available_ged_algorithms,
                                           get_ged_default_parameters,
-                                          get_ged_parameters,
-                                          graph_distance_factory)
+                                          get_ged_parameters, get_ordered_tree,
+                                          get_route_key,
+                                          graph_distance_factory,
+                                          merge_distance_shards,
+                                          node_subst_cost_prepared,
+                                          optimize_ged_with_budget,
+                                          parallel_matrix_calculations,
+                                          positions_to_cells, prepare_route,
+                                          resolve_ged_params,
+                                          run_distance_shard,
+                                          write_distance_shards,
+                                          zhang_shasha_distance)
 
 
 def test_similarity_factory(az_path):
@@ -90,6 +124,25 @@ def test_build_similarity_matrix(az_path):
     assert matrix.shape == (3, 2)
 
 
+def test_similarity_matrix_array(az_path):
+    graph_az = json.loads(open(az_path).read())
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='bipartite') for g in graph_az]
+    for count_vect, similarity_names in [(False, ['tanimoto', 'kulczynski', 'dice', 'mcconnaughey']),
+                                         (True, ['tanimoto', 'dice'])]:
+        _, molecule_fp1 = compute_nodes_fingerprints(syngraphs[1], reaction_fingerprints='structure_fp',
+                                                     molecular_fingerprint='rdkit', molecular_fp_count_vect=count_vect)
+        _, molecule_fp2 = compute_nodes_fingerprints(syngraphs[2], reaction_fingerprints='structure_fp',
+                                                     molecular_fingerprint='rdkit', molecular_fp_count_vect=count_vect)
+        for similarity_name in similarity_names:
+            matrix = build_similarity_matrix(molecule_fp1, molecule_fp2, similarity_name, as_dataframe=False)
+            assert type(matrix.values) == np.ndarray
+            assert matrix.values.shape == (len(molecule_fp2), len(molecule_fp1))
+            for h1, fp1 in molecule_fp1.items():
+                for h2, fp2 in molecule_fp2.items():
+                    assert matrix.get(h2, h1) == pytest.approx(compute_similarity(fp1, fp2, similarity_name))
+            assert matrix.to_dataframe().equals(build_similarity_matrix(molecule_fp1, molecule_fp2, similarity_name))
+
+
 def test_similarity_matrix(az_path):
     # Test similarity with oneself using the similarity matrix workflow
     graph_az = json.loads(open(az_path).read())
@@ -127,6 +180,20 @@ def test_compute_distance_matrix(az_path, ibm1_path):
     assert m2.equals(matrix_parallelization)
 
 
+def test_distance_matrix_fingerprint_store(az_path):
+    graph = json.loads(open(az_path).read())
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='bipartite') for g in graph[:4]]
+    store = FingerprintStore()
+    m = compute_distance_matrix(syngraphs, ged_method='nx_ged', fingerprint_store=store)
+    # each node has its fingerprint computed exactly once for the whole matrix
+    all_nodes = {n for s in syngraphs for n in s.graph}
+    assert len(store) == len(all_nodes)
+    # the store can be reused by another run
+    m2 = compute_distance_matrix(syngraphs, ged_method='nx_ged', fingerprint_store=store)
+    assert len(store) == len(all_nodes)
+    assert m.equals(m2)
+
+
 def test_optimized_ged(az_path):
     graph_az = json.loads(open(az_path).read())
     syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='bipartite') for g in graph_az]
@@ -152,6 +219,422 @@ def test_optimized_ged_workflow(az_path):
     assert ged_mp == ged_mp_std
 
 
+def test_prepared_route(az_path):
+    graph_az = json.loads(open(az_path).read())
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='bipartite') for g in graph_az]
+    routes = [prepare_route(s, 'structure_fp', None, 'rdkit', None, False) for s in syngraphs[:2]]
+    assert routes[0].root == syngraphs[0].get_roots()[0].smiles
+    assert len(routes[0].reaction_fingerprints) + len(routes[0].molecular_fingerprints) == \
+           routes[0].nx_graph.number_of_nodes()
+    # the GED computed from the prepared routes is the same as the one computed from the SynGraphs
+    for ged_method in ['nx_ged', 'nx_ged_matrix']:
+        assert graph_distance_factory(routes[0], routes[1], ged_method=ged_method) == \
+               graph_distance_factory(syngraphs[0], syngraphs[1], ged_method=ged_method)
+
+    mpm_syngraph = translator('az_retro', graph_az[0], 'syngraph', out_data_model='monopartite_molecules')
+    with pytest.raises(GraphDistanceError) as ke:
+        prepare_route(mpm_syngraph, 'structure_fp', None, 'rdkit', None, False)
+    assert "MismatchingGraph" in str(ke.type)
+
+
+def test_zhang_shasha_distance():
+    # Classic example: f(d(a c(b)) e) and f(c(d(a b)) e) have tree edit distance 2
+    tree1 = nx.DiGraph([('d', 'f'), ('e', 'f'), ('a', 'd'), ('c', 'd'), ('b', 'c')])
+    tree2 = nx.DiGraph([('c', 'f'), ('e', 'f'), ('d', 'c'), ('a', 'd'), ('b', 'd')])
+    postorder1, leftmost1 = get_ordered_tree(tree1, 'f', sort_key=lambda n: n)
+    postorder2, leftmost2 = get_ordered_tree(tree2, 'f', sort_key=lambda n: n)
+    assert postorder1 == ['a', 'b', 'c', 'd', 'e', 'f'] and leftmost1 == [0, 1, 1, 0, 4, 0]
+    costs = [[0.0 if n1 == n2 else 1.0 for n2 in postorder2] for n1 in postorder1]
+    assert zhang_shasha_distance(leftmost1, leftmost2, costs) == 2.0
+    assert zhang_shasha_distance(leftmost1, leftmost1, [[0.0 if n1 == n2 else 1.0 for n2 in postorder1]
+                                                        for n1 in postorder1]) == 0.0
+
+
+def test_tree_edit_distance(az_path):
+    graph_az = json.loads(open(az_path).read())
+    for data_model in ['bipartite', 'monopartite_reactions']:
+        syngraphs = [translator('az_retro', g, 'syngraph', out_data_model=data_model) for g in graph_az]
+        assert graph_distance_factory(syngraphs[0], syngraphs[0], ged_method='tree_edit_distance') == 0.0
+        ted = graph_distance_factory(syngraphs[0], syngraphs[3], ged_method='tree_edit_distance')
+        assert ted > 0.0
+        assert ted == pytest.approx(graph_distance_factory(syngraphs[3], syngraphs[0],
+                                                           ged_method='tree_edit_distance'))
+        m = compute_distance_matrix(syngraphs, ged_method='tree_edit_distance')
+        assert all(m.iat[n, n] == 0.0 for n in range(len(m)))
+
+
+def test_bipartite_approx_ged(az_path, ibm1_path):
+    graph_az = json.loads(open(az_path).read())
+    mp_syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='monopartite_reactions') for g in graph_az]
+    assert graph_distance_factory(mp_syngraphs[0], mp_syngraphs[0], ged_method='bipartite_approx_ged') == 0.0
+    # the approximated GED is an upper bound of the exact GED
+    for i, j in [(0, 1), (1, 2)]:
+        routes = [prepare_route(s, 'structure_fp', None, 'rdkit', None, False) for s in [mp_syngraphs[i],
+                                                                                        mp_syngraphs[j]]]
+        exact_ged = nx.graph_edit_distance(routes[0].nx_graph, routes[1].nx_graph,
+                                           node_subst_cost=partial(node_subst_cost_prepared, route1=routes[0],
+                                                                   route2=routes[1],
+                                                                   reaction_similarity_name='tanimoto',
+                                                                   molecular_similarity_name='tanimoto'))
+        approx_ged = graph_distance_factory(routes[0], routes[1], ged_method='bipartite_approx_ged')
+        assert approx_ged >= exact_ged - 1e-9
+
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='bipartite') for g in graph_az]
+    m = compute_distance_matrix(syngraphs, ged_method='bipartite_approx_ged')
+    assert all(m.iat[n, n] == 0.0 for n in range(len(m)))
+    assert m.iat[0, 3] > 0.0
+
+    # routes of different sizes: the approximation is symmetric and still an upper bound of the exact GED
+    graph_ibm = json.loads(open(ibm1_path).read())
+    syngraphs = [translator('ibm_retro', g, 'syngraph', out_data_model='bipartite') for g in graph_ibm]
+    routes = [prepare_route(s, 'structure_fp', None, 'rdkit', None, False) for s in [syngraphs[0], syngraphs[2]]]
+    assert len(routes[0].nx_graph) != len(routes[1].nx_graph)
+    exact_ged = nx.graph_edit_distance(routes[0].nx_graph, routes[1].nx_graph,
+                                       node_subst_cost=partial(node_subst_cost_prepared, route1=routes[0],
+                                                               route2=routes[1], reaction_similarity_name='tanimoto',
+                                                               molecular_similarity_name='tanimoto'))
+    d_ab = graph_distance_factory(routes[0], routes[1], ged_method='bipartite_approx_ged')
+    d_ba = graph_distance_factory(routes[1], routes[0], ged_method='bipartite_approx_ged')
+    assert d_ab == pytest.approx(d_ba)
+    assert d_ab >= exact_ged - 1e-9
+
+
+def test_ged_timeout(az_path):
+    graph_az = json.loads(open(az_path).read())
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='bipartite') for g in graph_az[:4]]
+    exact = compute_distance_matrix(syngraphs, ged_method='nx_ged')
+    assert len(exact.attrs['timed_out_positions']) == 0
+    for ged_method in ['nx_ged', 'nx_optimized_ged']:
+        m = compute_distance_matrix(syngraphs, ged_method=ged_method, ged_params={'timeout': 1e-6})
+        # the pairs that hit the budget get an upper bound of the distance
+        assert len(m.attrs['timed_out_positions'])
+        assert not m.attrs['exact_mask'][m.attrs['timed_out_positions']].any()
+        for i, j in zip(*positions_to_cells(m.attrs['timed_out_positions'], len(m))):
+            assert m.iat[i, j] is not None and m.iat[i, j] >= exact.iat[i, j] - 1e-6
+        # a budget that is not reached by the search does not flag any pair
+        m = compute_distance_matrix(syngraphs, ged_method=ged_method, ged_params={'timeout': 600})
+        assert len(m.attrs['timed_out_positions']) == 0
+        assert m.equals(exact)
+
+    # the budget is checked each time a better edit path is found, and the best value found so far is kept
+    def slow_costs():
+        for cost in [5.0, 3.0, 2.0]:
+            time.sleep(0.05)
+            yield cost
+
+    calculator = GedNx()
+    assert optimize_ged_with_budget(calculator, slow_costs(), timeout=0.01) == 5.0 and calculator.timed_out
+    assert optimize_ged_with_budget(calculator, iter([5.0, 3.0]), timeout=60) == 3.0 and not calculator.timed_out
+    assert optimize_ged_with_budget(calculator, iter([])) == PRUNED_DISTANCE and not calculator.timed_out
+
+
+def test_max_distance(az_path):
+    graph_az = json.loads(open(az_path).read())
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='bipartite') for g in graph_az[:4]]
+    routes = [prepare_route(s, 'structure_fp', {}, 'rdkit', {}, False) for s in syngraphs]
+    exact = compute_distance_matrix(syngraphs, ged_method='nx_ged')
+    assert not exact.attrs['pruned_mask'].any()
+    for i, r1 in enumerate(routes):
+        for j, r2 in enumerate(routes):
+            # the lower bound never exceeds the exact distance
+            assert compute_ged_lower_bound(r1, r2, 'tanimoto', 'tanimoto') <= exact.iat[i, j] + 1e-6
+    t = np.median([exact.iat[i, j] for i in range(4) for j in range(4) if i < j])
+    for ged_method in ['nx_ged', 'nx_optimized_ged', 'nx_ged_matrix', 'tree_edit_distance']:
+        reference = exact if ged_method != 'tree_edit_distance' else compute_distance_matrix(syngraphs, ged_method)
+        m = compute_distance_matrix(syngraphs, ged_method=ged_method, max_distance=t)
+        pruned = cells_mask_to_square(m.attrs['pruned_mask'], 4)
+        assert pruned.any()
+        for i in range(4):
+            for j in range(4):
+                assert pruned[i, j] == (reference.iat[i, j] > t)
+                if reference.iat[i, j] > t:
+                    assert m.iat[i, j] == PRUNED_DISTANCE
+                else:
+                    assert m.iat[i, j] == pytest.approx(reference.iat[i, j])
+    assert graph_distance_factory(syngraphs[0], syngraphs[0], 'nx_ged', ged_params={'max_distance': 0.0}) == 0.0
+
+
+def test_prefilter(az_path):
+    graph_az = json.loads(open(az_path).read())
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='bipartite') for g in graph_az[:4]]
+    routes = [prepare_route(s, 'structure_fp', {}, 'rdkit', {}, False) for s in syngraphs]
+    exact = compute_distance_matrix(syngraphs, ged_method='nx_ged')
+    assert len(exact.attrs['prefiltered_positions']) == 0 and exact.attrs['exact_mask'].all()
+    for i, r1 in enumerate(routes):
+        for j, r2 in enumerate(routes):
+            set_bound = compute_set_lower_bound(r1, r2)
+            assert set_bound <= compute_ged_lower_bound(r1, r2, 'tanimoto', 'tanimoto') + 1e-9
+            assert set_bound <= exact.iat[i, j] + 1e-6
+
+    cutoff = np.median([exact.iat[i, j] for i in range(4) for j in range(4) if i < j])
+    m = compute_distance_matrix(syngraphs, ged_method='nx_ged', ged_params={'prefilter_cutoff': cutoff})
+    prefiltered_cells = list(zip(*positions_to_cells(m.attrs['prefiltered_positions'], 4)))
+    assert prefiltered_cells
+    # the masks have the condensed positions followed by the diagonal
+    assert len(m.attrs['exact_mask']) == 6 + 4
+    mask = cells_mask_to_square(m.attrs['exact_mask'], 4)
+    for i in range(4):
+        for j in range(4):
+            if mask[i, j]:
+                assert m.iat[i, j] == pytest.approx(exact.iat[i, j])
+            else:
+                # the prefiltered cells contain a lower bound above the cutoff
+                assert (min(i, j), max(i, j)) in prefiltered_cells
+                assert cutoff < m.iat[i, j] <= exact.iat[i, j] + 1e-6
+
+
+def test_incremental_distance_matrix(az_path, tmp_path, monkeypatch):
+    graph_az = json.loads(open(az_path).read())
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='monopartite_reactions') for g in graph_az[:4]]
+    full = compute_distance_matrix(syngraphs, ged_method='nx_ged')
+
+    incremental = IncrementalDistanceMatrix('nx_ged')
+    keys = [get_route_key(s) for s in syngraphs]
+    assert incremental.add_routes(syngraphs[:2]) == keys[:2]
+    file_path = tmp_path / 'matrix.pickle'
+    incremental.save(file_path)
+    incremental = IncrementalDistanceMatrix.load(file_path)
+
+    computed_pairs = []
+    original_pair_distance = graph_distance.compute_pair_distance
+
+    def counting_pair_distance(*args, **kwargs):
+        computed_pairs.append(1)
+        return original_pair_distance(*args, **kwargs)
+    monkeypatch.setattr(graph_distance, 'compute_pair_distance', counting_pair_distance)
+    # the routes already in the matrix are ignored
+    assert incremental.add_routes(syngraphs) == keys[2:]
+    # only the 2 * 2 cells between old and new routes and the 3 among the new ones are computed
+    assert len(computed_pairs) == 7
+    assert incremental.add_routes(syngraphs[:3]) == []
+
+    matrix = incremental.to_dataframe()
+    assert list(matrix.index) == keys
+    assert np.allclose(matrix.to_numpy(dtype=float), full.to_numpy(dtype=float))
+    # the distances are stored once, in condensed form
+    assert len(incremental.condensed) == len(full.condensed)
+    assert matrix.attrs['exact_mask'].all()
+
+
+def run_with_hash_seed(script: str, hash_seed: str, *args) -> str:
+    """ To run a Python script in a new process with the given PYTHONHASHSEED and get its output """
+    env = dict(os.environ, PYTHONHASHSEED=hash_seed)
+    result = subprocess.run([sys.executable, '-c', script, *map(str, args)], env=env, capture_output=True, text=True,
+                            check=True)
+    return result.stdout.strip()
+
+
+def test_incremental_distance_matrix_across_processes(az_path, tmp_path):
+    script = """
+import json
+import sys
+from linchemin.cgu.translate import translator
+from linchemin.rem.graph_distance import IncrementalDistanceMatrix
+graph_az = json.loads(open(sys.argv[1]).read())
+syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='monopartite_reactions') for g in graph_az[:2]]
+if sys.argv[3] == 'write':
+    matrix = IncrementalDistanceMatrix('nx_ged')
+else:
+    matrix = IncrementalDistanceMatrix.load(sys.argv[2])
+print(len(matrix.add_routes(syngraphs)))
+matrix.save(sys.argv[2])
+"""
+    file_path = tmp_path / 'matrix.pickle'
+    assert run_with_hash_seed(script, '1', az_path, file_path, 'write') == '2'
+    # the routes are recognized in a process with a different hash seed
+    assert run_with_hash_seed(script, '2', az_path, file_path, 'read') == '0'
+
+
+def test_ged_result_cache(az_path, tmp_path):
+    graph_az = json.loads(open(az_path).read())
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='monopartite_reactions') for g in graph_az[:3]]
+    cache = GedResultCache(tmp_path / 'ged.sqlite', max_entries=100)
+    m1 = compute_distance_matrix(syngraphs, ged_method='nx_ged', ged_cache=cache)
+    assert m1.attrs['ged_cache'] == {'hits': 0, 'misses': 6}
+    assert len(cache) == 6
+    m2 = compute_distance_matrix(syngraphs, ged_method='nx_ged', ged_cache=cache)
+    assert m2.attrs['ged_cache'] == {'hits': 6, 'misses': 0}
+    assert m2.equals(m1)
+
+    # the results persist across instances and are consulted by graph_distance_factory
+    new_cache = GedResultCache(tmp_path / 'ged.sqlite')
+    ged = graph_distance_factory(syngraphs[0], syngraphs[1], 'nx_ged', ged_cache=new_cache)
+    assert ged == pytest.approx(m1.iat[0, 1])
+    assert new_cache.get_stats()['hits'] == 1
+    # a different set of parameters is a different key
+    graph_distance_factory(syngraphs[0], syngraphs[1], 'nx_ged', ged_params={'reaction_similarity_name': 'dice'},
+                           ged_cache=new_cache)
+    assert new_cache.get_stats()['misses'] == 1 and len(new_cache) == 7
+
+    # the least recently used results are evicted
+    small_cache = GedResultCache(tmp_path / 'small.sqlite', max_entries=2)
+    compute_distance_matrix(syngraphs, ged_method='nx_ged', ged_cache=small_cache)
+    assert len(small_cache) == 2
+    small_cache.clear()
+    assert len(small_cache) == 0
+
+    # the results that hit the time budget are not stored
+    bp_syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='bipartite') for g in graph_az[:4]]
+    timeout_cache = GedResultCache(tmp_path / 'timeout.sqlite', max_entries=100)
+    m = compute_distance_matrix(bp_syngraphs, ged_method='nx_ged', ged_params={'timeout': 1e-6},
+                                ged_cache=timeout_cache)
+    n_timed_out = len(m.attrs['timed_out_positions'])
+    assert n_timed_out and len(timeout_cache) == 10 - n_timed_out
+    m = compute_distance_matrix(bp_syngraphs, ged_method='nx_ged', ged_params={'timeout': 1e-6},
+                                ged_cache=timeout_cache)
+    assert m.attrs['ged_cache']['misses'] == n_timed_out
+
+
+def test_ged_result_cache_across_processes(az_path, tmp_path):
+    script = """
+import json
+import sys
+from linchemin.cgu.translate import translator
+from linchemin.rem.graph_distance import GedResultCache, compute_distance_matrix
+graph_az = json.loads(open(sys.argv[1]).read())
+syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='monopartite_reactions') for g in graph_az[:3]]
+matrix = compute_distance_matrix(syngraphs, ged_method='nx_ged', ged_cache=GedResultCache(sys.argv[2]))
+print(matrix.attrs['ged_cache']['hits'])
+"""
+    cache_path = tmp_path / 'ged.sqlite'
+    assert run_with_hash_seed(script, '1', az_path, cache_path) == '0'
+    # the results written by a process are found by a process with a different hash seed
+    assert run_with_hash_seed(script, '2', az_path, cache_path) == '6'
+
+
+def test_condensed_distance_matrix(az_path):
+    graph_az = json.loads(open(az_path).read())
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='monopartite_reactions') for g in graph_az[:4]]
+    m = compute_distance_matrix(syngraphs, ged_method='nx_ged')
+    assert isinstance(m, DistanceMatrix)
+    assert m.condensed.dtype == np.float32 and len(m.condensed) == 6
+    square = m.to_square()
+    assert np.array_equal(squareform(m.condensed, checks=False), square)
+    for i in range(4):
+        for j in range(4):
+            assert m.get(i, j) == m.get(j, i) == square[i, j]
+    # the DataFrame view is built lazily, with the same attrs
+    df = m.to_dataframe()
+    assert df.attrs.keys() == m.attrs.keys()
+    assert m.iat[1, 2] == square[1, 2] and list(m.index) == list(range(4))
+    assert m.equals(df) and m.equals(DistanceMatrix.from_square(df))
+    # iteration, length and comparison behave as for the DataFrame
+    assert list(m) == list(df) and [c for c in m] == list(range(4)) and len(m) == len(df)
+    assert (m == m).all().all() and (m == df).equals(df == df) and not (m != m).any().any()
+    assert (m == 0).equals(df == 0)
+    m.set(0, 1, 10.0)
+    assert m.iat[1, 0] == 10.0
+    # the assignments through the indexers are written in the condensed matrix
+    m.loc[0, 2] = 5.0
+    m.iat[3, 1] = 7.0
+    assert m.get(2, 0) == 5.0 and m.iloc[1, 3] == 7.0 and m.to_square()[1, 3] == 7.0
+    with pytest.raises(TypeError):
+        m.loc[0, :] = 1.0
+    with pytest.raises(IndexError):
+        m.iloc[0, 4] = 1.0
+    # the DataFrame view is read-only
+    with pytest.raises(ValueError):
+        m.values[0, 1] = 1.0
+    assert m.get(0, 1) == 10.0
+
+
+def test_parallel_matrix_calculations(az_path):
+    graph_az = json.loads(open(az_path).read())
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='monopartite_reactions') for g in graph_az[:2]]
+    params = resolve_ged_params()
+    i, j, sim = parallel_matrix_calculations((0, 1, syngraphs[0], syngraphs[1]), 'nx_ged', params)
+    assert (i, j) == (0, 1)
+    assert sim == graph_distance_factory(syngraphs[0], syngraphs[1], 'nx_ged', params)
+
+
+def test_parallel_scheduler(az_path):
+    graph_az = json.loads(open(az_path).read())
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='bipartite') for g in graph_az[:4]]
+    prepared = {i: prepare_route(s, 'structure_fp', {}, 'rdkit', {}, False) for i, s in enumerate(syngraphs)}
+    assert estimate_pair_cost(prepared[0], prepared[1]) == \
+        prepared[0].nx_graph.number_of_nodes() * prepared[1].nx_graph.number_of_nodes()
+    cells = [(i, j) for i in range(4) for j in range(4) if j >= i]
+    params = resolve_ged_params()
+    results = compute_cells_in_parallel(cells, prepared, 'nx_ged', params, n_cpu=2, chunksize=1)
+    assert sorted((i, j) for i, j, *_ in results) == cells
+    serial = compute_distance_matrix(syngraphs, ged_method='nx_ged')
+    for i, j, sim, timed_out, prefiltered in results:
+        assert sim == pytest.approx(serial.iat[i, j], abs=1e-6)
+        assert not timed_out and not prefiltered
+
+    incremental = IncrementalDistanceMatrix('nx_ged')
+    incremental.add_routes(syngraphs[:2])
+    incremental.add_routes(syngraphs[2:], parallelization=True, n_cpu=2)
+    assert np.allclose(incremental.to_distance_matrix().to_square(), serial.to_square())
+
+
+def test_distance_shards(az_path, tmp_path):
+    rows, columns = condensed_to_cells(np.arange(10), 5)
+    assert np.array_equal(rows, np.triu_indices(5, k=1)[0]) and np.array_equal(columns, np.triu_indices(5, k=1)[1])
+    rows, columns = positions_to_cells(np.arange(15), 5)
+    assert list(zip(rows[10:], columns[10:])) == [(i, i) for i in range(5)]
+    assert np.array_equal(cells_to_positions(list(zip(columns, rows)), 5), np.arange(15))
+
+    graph_az = json.loads(open(az_path).read())
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='monopartite_reactions') for g in graph_az]
+    task_files = write_distance_shards(syngraphs, 'nx_ged', tmp_path, n_shards=3)
+    assert len(task_files) == 3
+    # the shards are run independently by different processes
+    with mp.Pool(3) as pool:
+        result_files = pool.map(run_distance_shard, task_files)
+    assert all(f.exists() for f in result_files)
+    merged = merge_distance_shards(tmp_path)
+    expected = compute_distance_matrix(syngraphs, ged_method='nx_ged')
+    assert merged.equals(expected)
+    assert merged.attrs['exact_mask'].all()
+
+    result_files[1].unlink()
+    with pytest.raises(GraphDistanceError) as ke:
+        merge_distance_shards(tmp_path)
+    assert "MissingShardResult" in str(ke.type)
+
+
+def test_wl_kernel(az_path):
+    graph_az = json.loads(open(az_path).read())
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='monopartite_reactions') for g in graph_az]
+    features = compute_wl_features(syngraphs, iterations=2)
+    n_nodes = [len(set(s.graph) | {c for children in s.graph.values() for c in children}) for s in syngraphs]
+    assert features.shape[0] == len(syngraphs)
+    assert list(np.asarray(features.sum(axis=1)).ravel()) == [3 * n for n in n_nodes]
+
+    m = compute_distance_matrix(syngraphs + [syngraphs[0]], ged_method='wl_kernel')
+    square = m.to_square()
+    assert np.allclose(square, square.T) and np.all(m.diagonal == 0.0)
+    assert np.all((square >= 0.0) & (square <= 1.0))
+    # identical routes have identical features
+    assert m.get(0, len(syngraphs)) == pytest.approx(0.0, abs=1e-6)
+    assert m.attrs['exact_mask'].all()
+    # the result does not depend on the blocks in which the kernel is computed
+    assert np.allclose(compute_wl_distance_matrix(syngraphs, 3, block_size=2).condensed,
+                       compute_distance_matrix(syngraphs, ged_method='wl_kernel').condensed)
+    assert graph_distance_factory(syngraphs[2], syngraphs[3], 'wl_kernel') == pytest.approx(m.get(2, 3), abs=1e-6)
+
+    m_pruned = compute_distance_matrix(syngraphs, ged_method='wl_kernel', max_distance=0.9)
+    pruned = cells_mask_to_square(m_pruned.attrs['pruned_mask'], len(syngraphs))
+    assert pruned.any() and np.all(square[:len(syngraphs), :len(syngraphs)][pruned] > 0.9)
+
+    bp_syngraph = translator('az_retro', graph_az[0], 'syngraph', out_data_model='bipartite')
+    with pytest.raises(GraphDistanceError):
+        compute_distance_matrix([bp_syngraph, syngraphs[0]], ged_method='wl_kernel')
+
+
+def test_fingerprint_features(az_path):
+    graph_az = json.loads(open(az_path).read())
+    syngraphs = [translator('az_retro', g, 'syngraph', out_data_model='bipartite') for g in graph_az]
+    features = compute_fingerprint_features(syngraphs + [syngraphs[0]])
+    assert features.shape[0] == len(syngraphs) + 1
+    assert (features[0] != features[len(syngraphs)]).nnz == 0 and features[0].nnz > 0
+    m = compute_cosine_distance_matrix(features)
+    assert m.get(0, len(syngraphs)) == pytest.approx(0.0, abs=1e-6)
+    assert np.all((m.condensed >= 0.0) & (m.condensed <= 1.0))
+    assert np.allclose(compute_cosine_distance_matrix(features, block_size=3).condensed, m.condensed)
+
+
 def test_get_available_ged():
     assert type(get_available_ged_algorithms()) == dict and 'nx_ged' in get_available_ged_algorithms()
 